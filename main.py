@@ -3,29 +3,36 @@ from logging.handlers import RotatingFileHandler
 from fastapi import FastAPI, Request, status, HTTPException
 from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
-from src.logger import setup_logging
+from src.logger import request_logging, setup_logging
 
 # Initialize logging immediately
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
-from src.api_router import chat_router, user_router
-from src.utils import load_config
+from src.api_router import batch_router, chat_router, job_router, user_router
+from src.config import settings
 from src.lifespan import lifespan
-
-cfg = load_config(filename="config.yml")
-
-HOST = cfg["FastAPI"]["HOST"]
-PORT = cfg["FastAPI"]["PORT"]
-WORKERS = cfg["FastAPI"]["WORKERS"]
-LOG_LEVEL = cfg["FastAPI"]["LOG_LEVEL"]
-TIMEOUT = cfg["FastAPI"]["TIMEOUT"]
-GRACEFUL_TIMEOUT = cfg["FastAPI"]["GRACEFUL_TIMEOUT"]
+from src.llms.llamacpp_sidecar import sidecar_enabled, start_sidecar, stop_sidecar
+from src.metrics import metrics_response, prepare_multiprocess_dir, track_request_latency
+from src.timing import server_timing
+from src.tracing import trace_requests
+
+HOST = settings.FastAPI.HOST
+PORT = str(settings.FastAPI.PORT)
+WORKERS = str(settings.FastAPI.WORKERS)
+LOG_LEVEL = settings.FastAPI.LOG_LEVEL
+TIMEOUT = str(settings.FastAPI.TIMEOUT)
+GRACEFUL_TIMEOUT = str(settings.FastAPI.GRACEFUL_TIMEOUT)
+METRICS_ENABLED = settings.Metrics.ENABLED
+METRICS_MULTIPROC_DIR = settings.Metrics.MULTIPROC_DIR
+TRACING_ENABLED = settings.Tracing.ENABLED
+LLAMACPP_CONFIG = settings.LLM.provider_config("llamacpp")
+USE_LLAMACPP_SIDECAR = settings.LLM.Provider.lower() == "llamacpp" and sidecar_enabled(LLAMACPP_CONFIG)
 
 
 # Set log levels for specific libraries to WARNING to reduce verbosity
-for logger_name in cfg["Logging"]["NOISY_LOGGERS"]:
+for logger_name in settings.Logging.NOISY_LOGGERS:
     logging.getLogger(logger_name).setLevel(logging.WARNING)
 
 
@@ -41,8 +48,24 @@ app.add_middleware(
     allow_headers=["*"],      # Allows all headers (like Content-Type, Authorization, etc.) This is important for: JWT auth, Streaming responses, LLM metadata headers
 )
 
+# Record per-route request latency
+if METRICS_ENABLED:
+    app.middleware("http")(track_request_latency)
+
+# Per-request stage timer; emits Server-Timing on non-streaming responses
+app.middleware("http")(server_timing)
+
+# Root span per request; inside request_logging so the span carries its request ID
+if TRACING_ENABLED:
+    app.middleware("http")(trace_requests)
+
+# Request ID + access log line; added last so it is the outermost middleware and times everything
+app.middleware("http")(request_logging)
+
 # Include API routers
 app.include_router(chat_router.router)
+app.include_router(batch_router.router)
+app.include_router(job_router.router)
 app.include_router(user_router.router)
 
 
@@ -51,12 +74,33 @@ def home():
     return RedirectResponse(url="/docs")
 
 
+@app.get("/health/live", include_in_schema=False)
+def health_live():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+def health_ready(request: Request):
+    # Set by the lifespan once the model is built and warm-up has finished
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "warming_up"})
+    return {"status": "ready", "warmup_ms": request.app.state.warmup_timings}
+
+
+if METRICS_ENABLED:
+    app.add_route("/metrics", metrics_response, include_in_schema=False)
+
+
 
 # Entry points for running the application in production or development mode
 def main_prod():
+    # Workers inherit the environment, so they all write metrics to the same directory
+    if METRICS_ENABLED:
+        prepare_multiprocess_dir(METRICS_MULTIPROC_DIR)
 
     cmd = [
         "gunicorn",
+        "-c", "python:src.gunicorn_conf",
         "-w", WORKERS,
         "-k", "uvicorn.workers.UvicornWorker",
         "--timeout", TIMEOUT,
@@ -65,7 +109,13 @@ def main_prod():
         "main:app",
     ]
 
-    subprocess.run(cmd, check=True)
+    # One shared llama.cpp process for all workers; started first so workers find it on warm-up
+    sidecar = start_sidecar(LLAMACPP_CONFIG) if USE_LLAMACPP_SIDECAR else None
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        if sidecar is not None:
+            stop_sidecar(sidecar)
 
 def main_dev():
     cmd = [
@@ -0,0 +1,108 @@
+"""
+Backfill `user_id` on turn documents written before chat_router stored it.
+
+Walks the conversations collection in _id order, --batch-size conversations at a time, and for each batch
+sends one unordered bulk_write with an UpdateMany per conversation:
+    {chat_id: <conversation id>, user_id: {$exists: false}}  ->  {$set: {user_id: <owner>}}
+Each update is confined to one conversation's turns (served by the chat_id index), and the script
+sleeps between batches, so it can run against the live database while the app keeps writing; new
+turns already carry user_id and are skipped by the filter.
+
+Progress is checkpointed after every batch in the `migrations` collection (last conversation _id
+and counts), so an interrupted run resumes where it stopped. Running it again after it finished
+only picks up conversations created since.
+
+Usage:
+    python scripts/backfill_message_user_id.py
+    python scripts/backfill_message_user_id.py --batch-size 200 --sleep 0.5
+    python scripts/backfill_message_user_id.py --dry-run     # count what would change
+    python scripts/backfill_message_user_id.py --restart     # ignore the checkpoint
+"""
+
+import argparse
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from pymongo import MongoClient, UpdateMany
+
+from src.config import settings
+
+MIGRATION_ID = "messages_user_id_backfill"
+
+
+def load_checkpoint(migrations, restart: bool) -> dict:
+    checkpoint = None if restart else migrations.find_one({"_id": MIGRATION_ID})
+    return checkpoint or {"_id": MIGRATION_ID, "conversations": 0, "messages": 0}
+
+
+def backfill(db, batch_size: int, sleep: float, dry_run: bool, restart: bool):
+    conversations = db[settings.MongoDB.CHAT_HISTORY_COLLECTION]
+    messages = db[settings.MongoDB.MESSAGES_COLLECTION]
+    migrations = db["migrations"]
+
+    checkpoint = load_checkpoint(migrations, restart)
+    if checkpoint.get("last_conversation_id"):
+        print(f"Resuming after conversation {checkpoint['last_conversation_id']} "
+              f"({checkpoint['conversations']} conversations, {checkpoint['messages']} messages so far)")
+
+    started = time.perf_counter()
+    while True:
+        query = {"_id": {"$gt": checkpoint["last_conversation_id"]}} if checkpoint.get("last_conversation_id") else {}
+        batch = list(conversations.find(query, {"user_id": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        if dry_run:
+            # Same conversations as the real run: ones without an owner are skipped
+            updated = sum(
+                messages.count_documents({"chat_id": str(c["_id"]), "user_id": {"$exists": False}})
+                for c in batch if c.get("user_id")
+            )
+        else:
+            updates = [
+                UpdateMany({"chat_id": str(c["_id"]), "user_id": {"$exists": False}}, {"$set": {"user_id": c["user_id"]}})
+                for c in batch if c.get("user_id")
+            ]
+            updated = messages.bulk_write(updates, ordered=False).modified_count if updates else 0
+
+        checkpoint["last_conversation_id"] = batch[-1]["_id"]
+        checkpoint["conversations"] += len(batch)
+        checkpoint["messages"] += updated
+        checkpoint["updated_at"] = datetime.now(UTC)
+        if not dry_run:
+            migrations.replace_one({"_id": MIGRATION_ID}, checkpoint, upsert=True)
+
+        print(f"{checkpoint['conversations']} conversations, {checkpoint['messages']} messages "
+              f"{'to update' if dry_run else 'updated'} ({time.perf_counter() - started:.1f}s)")
+        time.sleep(sleep)
+
+    remaining = messages.count_documents({"user_id": {"$exists": False}})
+    print(f"Done. Messages still without user_id: {remaining}")
+    if remaining and not dry_run:
+        print("These belong to conversations that no longer exist (or have no user_id).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill user_id on turn documents")
+    parser.add_argument("--batch-size", type=int, default=500, help="Conversations per bulk write")
+    parser.add_argument("--sleep", type=float, default=0.2, help="Seconds to pause between batches")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the messages that would be updated")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and start from the beginning")
+    args = parser.parse_args()
+
+    client = MongoClient(settings.MongoDB.MONGO_URL, tz_aware=True)
+    try:
+        backfill(client[settings.MongoDB.DB_NAME], args.batch_size, args.sleep, args.dry_run, args.restart)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
+
+# python3 scripts/backfill_message_user_id.py
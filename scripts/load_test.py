@@ -0,0 +1,292 @@
+"""
+End-to-end load test for main:app.
+
+Boots the app in-process (uvicorn on an ephemeral local port) with the `fake` LLM provider
+(see LLM.fake in config.yml) and an in-memory Mongo stand-in (mongomock-motor), then drives concurrent virtual users through login, the chat pipeline (plain
+and streaming) and the conversation CRUD routes. Reports RPS and p50/p95/p99 latency per route
+plus TTFT for streams, and writes the results as JSON so runs can be compared across commits.
+
+Usage:
+    python scripts/load_test.py --users 20 --iterations 10
+    python scripts/load_test.py --users 20 --compare benchmarks/results/<previous>.json
+
+Requires the bench extra: pip install -e ".[bench]"
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import UTC, datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+os.chdir(ROOT_DIR)
+
+DEFAULT_RESULTS_DIR = ROOT_DIR / "benchmarks" / "results"
+PASSWORD = "load-test-password"
+ROUTES = ["login", "run_pipeline", "stream", "list", "get", "rename", "delete"]
+
+
+def install_test_doubles():
+    """Swap Motor for mongomock-motor before any src module opens a client."""
+    try:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("mongomock-motor is required: pip install -e \".[bench]\"")
+
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+    # Secrets are read at import time; the load test never sends mail or talks to real users
+    os.environ.setdefault("JWT_SECRET_KEY", "load-test-secret")
+    os.environ.setdefault("SENDER_EMAIL", "load-test@example.com")
+    os.environ.setdefault("SENDER_PASSWORD", "unused")
+
+
+def install_fake_llm(args):
+    """Build the registered `fake` provider from config, with command-line overrides."""
+    import src.clients.llm_client as llm_client
+    from src.config import settings
+    from src.llms import LLMFactory
+
+    fake_cfg = settings.LLM.provider_config("fake")
+    overrides = {
+        "TTFT": args.ttft,
+        "TOKENS_PER_SECOND": args.tokens_per_second,
+        "RESPONSE_TOKENS_MEAN": args.response_tokens,
+        "ERROR_RATE": args.error_rate,
+        "REPLAY_FILE": args.replay_file,
+    }
+    fake_cfg.update({key: value for key, value in overrides.items() if value is not None})
+    llm_client._llm_model = LLMFactory.get_provider("fake").create_model(fake_cfg)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: list[float], errors: int, duration: float) -> dict:
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / duration, 2) if duration else 0.0,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.ttft: list[float] = []
+
+    async def timed(self, name: str, coro):
+        start_time = time.perf_counter()
+        try:
+            response = await coro
+        except Exception:
+            self.errors[name] += 1
+            return None
+        elapsed = time.perf_counter() - start_time
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(elapsed)
+        return response
+
+
+async def stream_turn(client, headers: dict, recorder: Recorder, conversation_id: str):
+    start_time = time.perf_counter()
+    first_token = None
+    try:
+        async with client.stream(
+            "POST",
+            "/chat/run_pipeline/stream",
+            json={"user_query": "Continue please", "service_name": "chat", "conversation_id": conversation_id},
+            headers=headers,
+        ) as response:
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith("data:") and '"content"' in line:
+                    first_token = time.perf_counter() - start_time
+            status_code = response.status_code
+    except Exception:
+        recorder.errors["stream"] += 1
+        return
+
+    if status_code >= 400:
+        recorder.errors["stream"] += 1
+        return
+    recorder.latencies["stream"].append(time.perf_counter() - start_time)
+    if first_token is not None:
+        recorder.ttft.append(first_token)
+
+
+async def virtual_user(client, user_index: int, iterations: int, recorder: Recorder):
+    email = f"load-user-{user_index}@example.com"
+    await client.post("/auth/signup", json={"email": email, "password": PASSWORD})
+
+    response = await recorder.timed("login", client.post("/auth/login-json", json={"email": email, "password": PASSWORD}))
+    if response is None:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for iteration in range(iterations):
+        response = await recorder.timed("run_pipeline", client.post(
+            "/chat/run_pipeline",
+            json={"user_query": f"Explain topic {iteration} in detail", "service_name": "chat"},
+            headers=headers,
+        ))
+        if response is None:
+            continue
+        conversation_id = response.json()["conversation_id"]
+
+        await stream_turn(client, headers, recorder, conversation_id)
+        await recorder.timed("list", client.get("/chat/conversations", headers=headers))
+        await recorder.timed("get", client.get(f"/chat/conversations/{conversation_id}", headers=headers))
+        await recorder.timed("rename", client.put(
+            f"/chat/conversations/{conversation_id}/rename", json={"title": f"Renamed {iteration}"}, headers=headers
+        ))
+        await recorder.timed("delete", client.delete(f"/chat/conversations/{conversation_id}", headers=headers))
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def start_server(app):
+    """Serve the app with uvicorn on an ephemeral local port inside this event loop."""
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()  # Surface startup errors
+        await asyncio.sleep(0.05)
+
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def run(args) -> dict:
+    # A real HTTP server rather than httpx's ASGITransport, which buffers whole responses and would hide TTFT
+    import httpx
+
+    from main import app
+
+    recorder = Recorder()
+    server, server_task, base_url = await start_server(app)
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            start_time = time.perf_counter()
+            await asyncio.gather(*(
+                virtual_user(client, index, args.iterations, recorder) for index in range(args.users)
+            ))
+            duration = time.perf_counter() - start_time
+    finally:
+        server.should_exit = True
+        await server_task
+
+    total_requests = sum(len(samples) for samples in recorder.latencies.values())
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "config": {
+            "users": args.users,
+            "iterations": args.iterations,
+            "ttft": args.ttft,
+            "tokens_per_second": args.tokens_per_second,
+            "response_tokens": args.response_tokens,
+            "error_rate": args.error_rate,
+            "replay_file": args.replay_file,
+        },
+        "duration_s": round(duration, 3),
+        "total_requests": total_requests,
+        "total_rps": round(total_requests / duration, 2) if duration else 0.0,
+        "routes": {
+            name: summarize(recorder.latencies[name], recorder.errors[name], duration) for name in ROUTES
+        },
+        "ttft": {
+            "count": len(recorder.ttft),
+            "p50_ms": round(percentile(recorder.ttft, 50) * 1000, 2),
+            "p95_ms": round(percentile(recorder.ttft, 95) * 1000, 2),
+            "p99_ms": round(percentile(recorder.ttft, 99) * 1000, 2),
+        },
+    }
+
+
+def print_report(results: dict, baseline: dict | None = None):
+    print(f"\nLOAD TEST  commit={results['commit']}  users={results['config']['users']}  "
+          f"iterations={results['config']['iterations']}")
+    print("=" * 78)
+    print(f"{'Route':14} {'Count':>7} {'Errors':>7} {'RPS':>9} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    print("-" * 78)
+    for name, stats in results["routes"].items():
+        line = (f"{name:14} {stats['count']:7} {stats['errors']:7} {stats['rps']:9} "
+                f"{stats['p50_ms']:10} {stats['p95_ms']:10} {stats['p99_ms']:10}")
+        if baseline and name in baseline.get("routes", {}):
+            before = baseline["routes"][name]["p95_ms"]
+            if before:
+                line += f"   p95 {((stats['p95_ms'] - before) / before) * 100:+.1f}%"
+        print(line)
+    print("-" * 78)
+    ttft = results["ttft"]
+    print(f"TTFT  p50={ttft['p50_ms']} ms  p95={ttft['p95_ms']} ms  p99={ttft['p99_ms']} ms")
+    print(f"Total {results['total_requests']} requests in {results['duration_s']} s = {results['total_rps']} RPS")
+    if baseline:
+        print(f"Baseline commit {baseline.get('commit')}: {baseline.get('total_rps')} RPS")
+    print("=" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process end-to-end load test for AIChatApp")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=5, help="Conversation cycles per user")
+    parser.add_argument("--ttft", type=float, default=None, help="Fake LLM time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Fake LLM generation speed")
+    parser.add_argument("--response-tokens", type=int, default=None, help="Mean fake LLM answer length")
+    parser.add_argument("--error-rate", type=float, default=None, help="Fake LLM failure probability")
+    parser.add_argument("--replay-file", type=str, default=None, help="JSONL of recorded responses to replay")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", type=Path, default=None, help="Result JSON path")
+    parser.add_argument("--compare", type=Path, default=None, help="Previous result JSON to compare against")
+    args = parser.parse_args()
+
+    install_test_doubles()
+    install_fake_llm(args)
+
+    results = asyncio.run(run(args))
+
+    output = args.output or DEFAULT_RESULTS_DIR / f"load_test_{results['commit']}_{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(results, baseline)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
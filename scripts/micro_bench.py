@@ -0,0 +1,59 @@
+"""
+Run the per-request micro-benchmarks in tests/benchmarks with pytest-benchmark.
+
+Usage:
+    python scripts/micro_bench.py                      # run and print results
+    python scripts/micro_bench.py record               # save a new baseline
+    python scripts/micro_bench.py compare              # compare with the latest baseline
+    python scripts/micro_bench.py compare --threshold 10
+
+compare exits non-zero when any benchmark's median is slower than the baseline by more than
+--threshold percent. Baselines live under benchmarks/micro, one folder per machine/Python.
+
+Requires the bench extra: pip install -e ".[bench]"
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+STORAGE_DIR = ROOT_DIR / "benchmarks" / "micro"
+BENCH_DIR = ROOT_DIR / "tests" / "benchmarks"
+BASELINE_NAME = "baseline"
+
+
+def pytest_command(extra_args: list[str]) -> list[str]:
+    return [
+        sys.executable, "-m", "pytest", str(BENCH_DIR),
+        # bench_* names keep these out of the regular test run
+        "-o", "python_files=bench_*.py",
+        "-o", "python_functions=bench_*",
+        "-p", "no:cacheprovider",
+        f"--benchmark-storage=file://{STORAGE_DIR}",
+        "--benchmark-sort=name",
+        "--benchmark-columns=min,mean,median,stddev,ops,rounds",
+        *extra_args,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AIChatApp micro-benchmarks")
+    parser.add_argument("mode", nargs="?", default="run", choices=["run", "record", "compare"])
+    parser.add_argument("--threshold", type=float, default=15.0, help="Allowed median regression in percent")
+    parser.add_argument("--baseline", default=None, help="Baseline run id or name to compare with (default: latest)")
+    args, pytest_args = parser.parse_known_args()
+
+    extra_args = list(pytest_args)
+    if args.mode == "record":
+        extra_args.append(f"--benchmark-save={BASELINE_NAME}")
+    elif args.mode == "compare":
+        extra_args.append(f"--benchmark-compare={args.baseline}" if args.baseline else "--benchmark-compare")
+        extra_args.append(f"--benchmark-compare-fail=median:{args.threshold:g}%")
+
+    sys.exit(subprocess.run(pytest_command(extra_args), cwd=ROOT_DIR).returncode)
+
+
+if __name__ == "__main__":
+    main()
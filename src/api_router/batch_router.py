@@ -0,0 +1,312 @@
+"""
+Batch query API.
+
+POST /chat/batch runs many UserInputs through the pipeline in one request, for evaluation and
+back-office jobs that would otherwise pay auth, a history lookup and a DB round trip per call:
+    - auth once, and one query to check every referenced conversation belongs to the user
+    - a bounded pool of workers (Batch.CONCURRENCY, or the request's own, up to MAX_CONCURRENCY)
+    - results streamed back as NDJSON in completion order, one BatchItemResult per input;
+      failures are reported inline with their status and never abort the rest of the batch
+    - turns that start a new conversation are written with insert_many in chunks, plus one usage
+      rollup per flush; their titles come from the prompt (no title generation call per item).
+      Turns continuing an existing conversation go through save_turn, which needs the atomic
+      message_count bump for their seq.
+A result line is only sent once its turn is persisted, so every conversation_id it reports exists.
+If the client disconnects, nothing already generated is lost: items in flight finish and every
+outcome is written in the background. Streaming.DISCONNECT_POLICY decides whether the items not
+started yet still run ("background") or are dropped ("cancel").
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from src.api_router.chat_router import (
+    SUPPORTED_SERVICES,
+    build_llm_messages,
+    conversation_document,
+    conversation_summary,
+    get_current_timestamp,
+    load_history,
+    run_config,
+    save_turn,
+    turn_document,
+)
+from src.background import spawn
+from src.config import settings
+from src.database import conversations_collection, messages_collection, usage_collection
+from src.deps import get_current_user
+from src.pipelines.builder import pipeline
+from src.purge import NOT_DELETED
+from src.search import index_turn
+from src.schemas import BatchItemResult, BatchRequest, UserInput
+from src.timing import timer_scope
+
+logger = logging.getLogger(__name__)
+
+BATCH = settings.Batch
+DISCONNECT_POLICY = settings.Streaming.DISCONNECT_POLICY
+
+router = APIRouter(prefix="/chat", tags=["Chat"])
+
+
+@dataclass
+class BatchOutcome:
+    result: BatchItemResult
+    # Set for turns that start a new conversation; written by BatchWriter
+    conversation_doc: dict | None = None
+    turn_doc: dict | None = None
+
+
+@dataclass
+class BatchWriter:
+    """
+    Buffers new conversations and their turns, and writes them with bulk inserts.
+    Outcomes leave `pending` only once their write is done, and flushes run one at a time, so a
+    flush interrupted by a disconnect is neither lost nor repeated by the one finishing the batch.
+    """
+    user_id: str
+    pending: list[BatchOutcome] = field(default_factory=list)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def due(self) -> bool:
+        return len(self.pending) >= BATCH.WRITE_BATCH_SIZE
+
+    async def flush(self) -> list[BatchItemResult]:
+        async with self._lock:
+            outcomes = list(self.pending)
+            if not outcomes:
+                return []
+            try:
+                return await self._write(outcomes)
+            finally:
+                del self.pending[:len(outcomes)]  # Outcomes added meanwhile were appended after them
+
+    async def _write(self, outcomes: list[BatchOutcome]) -> list[BatchItemResult]:
+
+        usage: dict[str, Counter] = {}
+        for outcome in outcomes:
+            rollup = usage.setdefault(outcome.turn_doc["created_at"][:10], Counter())
+            rollup.update({
+                "input_tokens": outcome.turn_doc["input_tokens"],
+                "output_tokens": outcome.turn_doc["output_tokens"],
+                "turns": 1,
+            })
+
+        conversation_ids = [o.conversation_doc["_id"] for o in outcomes]
+        try:
+            await conversations_collection.insert_many([o.conversation_doc for o in outcomes], ordered=False)
+            try:
+                await messages_collection.insert_many([o.turn_doc for o in outcomes], ordered=False)
+            except Exception:
+                await self._roll_back(conversation_ids)
+                raise
+        except Exception as e:
+            logger.error(f"Batch write of {len(outcomes)} results failed: {e}", exc_info=True)
+            return [
+                o.result.model_copy(update={"status": 500, "conversation_id": None, "error": "Error saving result"})
+                for o in outcomes
+            ]
+
+        for outcome in outcomes:
+            index_turn(outcome.turn_doc)
+        try:
+            for date, rollup in usage.items():
+                await usage_collection.update_one(
+                    {"user_id": self.user_id, "date": date}, {"$inc": dict(rollup)}, upsert=True
+                )
+        except Exception as e:
+            # The turns are saved; only the usage rollup is short
+            logger.error(f"Usage rollup for {len(outcomes)} batch results failed: {e}", exc_info=True)
+        return [o.result for o in outcomes]
+
+    async def _roll_back(self, conversation_ids: list[ObjectId]):
+        """Remove conversations whose turns could not be written (and any of those turns that were)."""
+        try:
+            await messages_collection.delete_many({"chat_id": {"$in": [str(_id) for _id in conversation_ids]}})
+            await conversations_collection.delete_many({"_id": {"$in": conversation_ids}})
+        except Exception as e:
+            logger.error(f"Rolling back {len(conversation_ids)} batch conversations failed: {e}", exc_info=True)
+
+
+async def owned_conversations(items: list[UserInput], user_id: str) -> dict[str, dict]:
+    """Every valid conversation ID referenced by the batch that belongs to the user, in one query."""
+    ids = {ObjectId(item.conversation_id) for item in items if item.conversation_id and ObjectId.is_valid(item.conversation_id)}
+    if not ids:
+        return {}
+    cursor = conversations_collection.find({"_id": {"$in": list(ids)}, "user_id": user_id, **NOT_DELETED})
+    return {str(conversation["_id"]): conversation async for conversation in cursor}
+
+
+async def run_batch_item(index: int, item: UserInput, user_id: str, conversations: dict[str, dict]) -> BatchOutcome:
+    with timer_scope() as timer:
+        try:
+            user_prompt = item.user_query.strip()
+            service_name = item.service_name.strip().lower()
+            conversation_id = item.conversation_id
+            conversation = None
+            db_turns = []
+
+            if service_name not in SUPPORTED_SERVICES:
+                raise HTTPException(status_code=400, detail=f"Service '{service_name}' not supported")
+            if conversation_id:
+                if not ObjectId.is_valid(conversation_id):
+                    raise HTTPException(status_code=400, detail="Invalid conversation ID")
+                conversation = conversations.get(conversation_id)
+                if conversation is None:
+                    raise HTTPException(status_code=404, detail="Conversation not found")
+                with timer.stage("history"):
+                    db_turns = await load_history(conversation_id, conversation)
+
+            with timer.stage("pipeline"):
+                response = await pipeline.ainvoke(
+                    {
+                        "service_name": service_name,
+                        "user_input": user_prompt,
+                        "llm_messages": build_llm_messages(db_turns, user_prompt, conversation_summary(conversation)),
+                        "deep_search": item.deep_search,
+                    },
+                    config=run_config(user_id, conversation_id),
+                )
+
+            assistant_content = response["llm_response"]
+            sources = response.get("sources") or []
+            input_tokens = response.get("input_tokens") or 0
+            output_tokens = response.get("output_tokens") or 0
+            response_time = round(timer.stages["pipeline"], 3)
+
+            if conversation_id:
+                await save_turn(
+                    user_id=user_id,
+                    conversation_id=conversation_id,
+                    user_prompt=user_prompt,
+                    assistant_content=assistant_content,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    response_time=response_time,
+                    timings=timer.as_dict(),
+                    sources=sources,
+                )
+                return BatchOutcome(BatchItemResult(
+                    index=index, conversation_id=conversation_id, message=assistant_content, sources=sources
+                ))
+
+            # New conversation: the ID is assigned here so the turn can be written in the same bulk insert
+            timestamp = get_current_timestamp()
+            conversation_doc = conversation_document(
+                user_id, user_prompt[:50], user_prompt, assistant_content, input_tokens, output_tokens, timestamp
+            )
+            conversation_doc["_id"] = ObjectId()
+            new_id = str(conversation_doc["_id"])
+            turn_doc = turn_document(
+                user_id, new_id, 1, user_prompt, assistant_content, input_tokens, output_tokens,
+                response_time, False, None, timer.as_dict(), sources, timestamp,
+            )
+            return BatchOutcome(
+                BatchItemResult(index=index, conversation_id=new_id, message=assistant_content, sources=sources),
+                conversation_doc=conversation_doc,
+                turn_doc=turn_doc,
+            )
+
+        except HTTPException as e:
+            return BatchOutcome(BatchItemResult(index=index, status=e.status_code, error=str(e.detail)))
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {e}", exc_info=True)
+            return BatchOutcome(BatchItemResult(index=index, status=500, error=str(e)))
+
+
+async def run_batch(
+    items: list[UserInput], user_id: str, conversations: dict[str, dict], concurrency: int, out: asyncio.Queue,
+    stop: asyncio.Event,
+):
+    """A fixed pool of workers pulling inputs in order; outcomes go to `out`, followed by None. No item starts once `stop` is set."""
+    todo: asyncio.Queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        todo.put_nowait((index, item))
+
+    async def worker():
+        while not stop.is_set():
+            try:
+                index, item = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            out.put_nowait(await run_batch_item(index, item, user_id, conversations))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(items)))))
+    finally:
+        out.put_nowait(None)
+
+
+async def finish_batch(runner: asyncio.Task, out: asyncio.Queue, writer: BatchWriter):
+    """After a disconnect: wait for the items still running, then write every outcome not yet persisted."""
+    await asyncio.gather(runner, return_exceptions=True)
+    while not out.empty():
+        outcome = out.get_nowait()
+        if outcome and outcome.turn_doc is not None:
+            writer.pending.append(outcome)
+            if writer.due():
+                await writer.flush()
+    await writer.flush()
+
+
+# ---------------- BATCH QUERY ----------------
+@router.post("/batch", status_code=status.HTTP_200_OK)
+async def execute_batch(batch: BatchRequest, current_user=Depends(get_current_user)):
+    if len(batch.items) > BATCH.MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"At most {BATCH.MAX_ITEMS} items per batch",
+        )
+
+    user_id = str(current_user["_id"])
+    conversations = await owned_conversations(batch.items, user_id)
+    concurrency = min(batch.concurrency or BATCH.CONCURRENCY, BATCH.MAX_CONCURRENCY)
+
+    async def stream_results():
+        out: asyncio.Queue = asyncio.Queue()
+        stop = asyncio.Event()
+        runner = asyncio.create_task(run_batch(batch.items, user_id, conversations, concurrency, out, stop))
+        writer = BatchWriter(user_id)
+        finished = False
+        last_flush = time.monotonic()
+
+        try:
+            while not finished:
+                # Wait no longer than the next flush is due (indefinitely when nothing is buffered)
+                timeout = max(0.0, last_flush + BATCH.WRITE_INTERVAL - time.monotonic()) if writer.pending else None
+                try:
+                    outcome = await asyncio.wait_for(out.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    outcome = False
+
+                if outcome is None:
+                    finished = True
+                elif outcome and outcome.turn_doc is None:
+                    yield outcome.result.model_dump_json() + "\n"  # Error, or already saved by save_turn
+                elif outcome:
+                    writer.pending.append(outcome)
+
+                if finished or writer.due() or time.monotonic() - last_flush >= BATCH.WRITE_INTERVAL:
+                    # Shielded: a disconnect during the write must not cut it off between the two inserts
+                    for result in await asyncio.shield(spawn(writer.flush(), name="batch-flush")):
+                        yield result.model_dump_json() + "\n"
+                    last_flush = time.monotonic()
+        finally:
+            if not finished:
+                # Client went away. Items already generated or in flight are paid for: keep them.
+                # Called from a finally block that may itself be cancelled, so nothing here may await
+                if DISCONNECT_POLICY == "background":
+                    logger.info("Batch client disconnected; finishing the remaining items in the background")
+                else:
+                    logger.info("Batch client disconnected; skipping items not started, saving the rest")
+                    stop.set()
+                spawn(finish_batch(runner, out, writer), name="batch-finish")
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
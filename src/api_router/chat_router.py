@@ -1,30 +1,50 @@
+import asyncio
 import json
 import logging
+import time
+from dataclasses import dataclass, field
 from datetime import UTC, datetime
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.responses import StreamingResponse
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
-from src.clients.llm_client import llm_model
-from src.database import conversations_collection, messages_collection
+from src.background import spawn
+from src.clients.llm_client import get_llm
+from src.config import settings
+from src.database import conversations_collection, messages_collection, usage_collection
 from src.deps import get_current_user
-from src.llms.llm_parser import parse_response
+from src.jobs import job_runner
+from src.llms.llm_parser import extract_usage, parse_response
+from src.metrics import LLM_TIME_TO_FIRST_TOKEN, STREAMS_IN_FLIGHT, observe_generation
 from src.pipelines.builder import pipeline
+from src.pipelines.nodes import SOURCES_EVENT
+from src.purge import NOT_DELETED, soft_delete
+from src.search import index_turn, search
+from src.summarizer import history_limit, needs_summary, summary_message, update_summary
+from src.timing import StageTimer, current_timer, stage
 from src.schemas import (
     Conversation,
     ConversationCreate,
     ConversationUpdate,
     Message,
+    SearchResponse,
     UserInput,
     UserQueryResponse,
 )
-from src.utils import load_config
 
 
 logger = logging.getLogger(__name__)
-cfg = load_config(filename="config.yml")
+
+SUPPORTED_SERVICES = settings.Services.SUPPORTED_SERVICES
+DISCONNECT_POLICY = settings.Streaming.DISCONNECT_POLICY
+DISCONNECT_POLL_INTERVAL = settings.Streaming.DISCONNECT_POLL_INTERVAL
+LLM_PROVIDER = settings.LLM.Provider.lower()
+SUMMARY_ENABLED = settings.Summary.ENABLED
+SEARCH_MAX_LIMIT = settings.Search.MAX_LIMIT
+SEARCH_MAX_OFFSET = settings.Search.MAX_OFFSET
+PREVIEW_CHARS = 160 # Sidebar preview length per side of the last turn
 
 # Create API router
 router = APIRouter(prefix="/chat", tags=["Chat"])
@@ -40,13 +60,68 @@ def serialize_conversation(conversation, messages=None) -> Conversation:
         title=conversation.get("title"),
         messages=messages or [],
         message_count=conversation.get("message_count", 0),
+        total_input_tokens=conversation.get("total_input_tokens", 0),
+        total_output_tokens=conversation.get("total_output_tokens", 0),
+        preview=conversation.get("preview"),
         created_at=conversation.get("created_at"),
         updated_at=conversation.get("updated_at"),
     )
 
+def serialize_message(turn: dict) -> Message:
+    return Message(
+        id=str(turn["_id"]),
+        chat_id=turn["chat_id"],
+        user=turn["user"],
+        assistant=turn["assistant"],
+        input_tokens=turn.get("input_tokens", 0),
+        output_tokens=turn.get("output_tokens", 0),
+        response_time=turn.get("response_time", 0.0),
+        truncated=turn.get("truncated", False),
+        ttft=turn.get("ttft"),
+        timings=turn.get("timings"),
+        created_at=turn["created_at"],
+        seq=turn.get("seq"),
+        sources=turn.get("sources"),
+    )
+
+def build_llm_messages(db_turns: list[dict], user_prompt: str, summary: str | None = None) -> list:
+    """
+    The conversation summary (if any), then history turns (chronological) as alternating Human/AI
+    messages, followed by the new user message.
+    """
+    llm_messages = [summary_message(summary)] if summary else []
+    for turn in db_turns:
+        llm_messages.append(HumanMessage(content=turn["user"]))
+        llm_messages.append(AIMessage(content=turn["assistant"]))
+
+    # Append current user message for LLM context
+    llm_messages.append(HumanMessage(content=user_prompt))
+    return llm_messages
+
+async def load_history(conversation_id: str, conversation: dict) -> list[dict]:
+    """The turns not yet folded into the conversation's summary (at most history_limit()), oldest first."""
+    query = {"chat_id": conversation_id}
+    if SUMMARY_ENABLED and conversation.get("summary_seq"):
+        query["seq"] = {"$gt": conversation["summary_seq"]}
+
+    cursor = messages_collection.find(query).sort("created_at", -1).limit(history_limit())
+    db_turns = [turn async for turn in cursor]
+    db_turns.reverse() # Restore chronological order
+    return db_turns
+
+def conversation_summary(conversation: dict | None) -> str | None:
+    return conversation.get("summary") if SUMMARY_ENABLED and conversation else None
+
+def run_config(user_id: str, conversation_id: str | None) -> dict:
+    """LangChain run config; the metadata reaches every node and model call (e.g. llama.cpp prefix reuse)."""
+    return {"metadata": {"user_id": user_id, "conversation_id": conversation_id}}
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
 async def generate_title(user_query: str) -> str:
     try:        
-        response = await llm_model.ainvoke([
+        response = await get_llm().ainvoke([
                 SystemMessage(content="You are a helpful assistant. Generate a short, 3-5 word title for a conversation that starts with the following user query. Do not use quotes."),
                 HumanMessage(content=user_query)
             ]
@@ -57,30 +132,266 @@ async def generate_title(user_query: str) -> str:
         title = parsed.content
         if title.startswith('"') and title.endswith('"'):
             title = title[1:-1]
-        return title
+        # Conversation titles are capped at 60 characters by the schema
+        return title.strip()[:60] or user_query[:50]
     except Exception as e:
         logger.error(f"Error generating title: {e}", exc_info=True)
         return user_query[:50]
 
 
-# ---------------- RUN PIPELINE (NON-STREAMING) ----------------
-@router.post("/run_pipeline", response_model=UserQueryResponse, status_code=status.HTTP_201_CREATED)
-async def execute_user_query(
-    user_input: UserInput,
-    current_user=Depends(get_current_user)
+def preview_text(text: str) -> str:
+    """Whitespace-collapsed start of a message, as stored in the conversation preview."""
+    text = " ".join((text or "").split())
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS - 1].rstrip() + "…"
+
+
+def conversation_document(
+    user_id: str, title: str, user_prompt: str, assistant_content: str, input_tokens: int, output_tokens: int, timestamp: str
+) -> dict:
+    """A conversation created by its first turn."""
+    return {
+        "user_id": user_id,
+        "title": title,
+        "message_count": 1, # First turn
+        "total_input_tokens": input_tokens,
+        "total_output_tokens": output_tokens,
+        "preview": {
+            "user": preview_text(user_prompt),
+            "assistant": preview_text(assistant_content),
+            "seq": 1,
+            "total_tokens": input_tokens + output_tokens,
+        },
+        "created_at": timestamp,
+        "updated_at": timestamp,
+    }
+
+def turn_document(
+    user_id, conversation_id, seq, user_prompt, assistant_content, input_tokens, output_tokens,
+    response_time, truncated, ttft, timings, sources, timestamp,
+) -> dict:
+    turn_doc = {
+        "user_id": user_id, # Lets per-user reads (deletes, usage, search, export) skip the conversations lookup
+        "chat_id": conversation_id,
+        "user": user_prompt,
+        "assistant": assistant_content,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "response_time": response_time,
+        "truncated": truncated,
+        "ttft": ttft,
+        "timings": timings or {},
+        "created_at": timestamp,
+        "seq": seq
+    }
+    if sources:
+        turn_doc["sources"] = sources
+    return turn_doc
+
+
+async def save_turn(
+    user_id: str,
+    conversation_id: str | None,
+    user_prompt: str,
+    assistant_content: str,
+    input_tokens: int | None = 0,
+    output_tokens: int | None = 0,
+    response_time: float | None = 0.0,
+    truncated: bool = False,
+    ttft: float | None = None,
+    timings: dict | None = None,
+    sources: list[dict] | None = None,
+) -> str:
+    """
+    Persist one user/assistant turn, creating the conversation if needed. Returns the conversation ID.
+    Usage rollups (per conversation and per user per day) are maintained here with $inc so reads never aggregate.
+    `timings` is a snapshot taken before this call, so the stored turn has no persistence stage and its
+    total stops where persistence starts; the Server-Timing header and the timing SSE event include both.
+    """
+    if timings:
+        timings = {name: duration for name, duration in timings.items() if name != "persistence"}
+    with stage("persistence"):
+        return await _save_turn(
+            user_id, conversation_id, user_prompt, assistant_content,
+            input_tokens, output_tokens, response_time, truncated, ttft, timings, sources,
+        )
+
+
+async def _save_turn(
+    user_id, conversation_id, user_prompt, assistant_content,
+    input_tokens, output_tokens, response_time, truncated, ttft, timings, sources,
+) -> str:
+    timestamp = get_current_timestamp()
+    input_tokens = input_tokens or 0
+    output_tokens = output_tokens or 0
+
+    if not conversation_id:
+        # Create new conversation. Truncated turns skip the extra LLM call for the title.
+        title = user_prompt[:50] if truncated else await generate_title(user_prompt)
+        new_conversation = conversation_document(
+            user_id, title, user_prompt, assistant_content, input_tokens, output_tokens, timestamp
+        )
+        result = await conversations_collection.insert_one(new_conversation)
+        conversation_id = str(result.inserted_id)
+        seq = 1
+        summary_seq = None
+    else:
+        # Atomic update of conversation metadata, sequence generation and the sidebar preview for existing chats.
+        # A pipeline update, so the preview's seq and token total come from the same counters it bumps
+        # (every stage reads the document as it was before the update). Text goes in as $literal: a
+        # prompt starting with "$" would otherwise be read as a field path.
+        next_seq = {"$add": [{"$ifNull": ["$message_count", 0]}, 1]}
+        total_input = {"$add": [{"$ifNull": ["$total_input_tokens", 0]}, input_tokens]}
+        total_output = {"$add": [{"$ifNull": ["$total_output_tokens", 0]}, output_tokens]}
+        updated_chat = await conversations_collection.find_one_and_update(
+            {"_id": ObjectId(conversation_id), **NOT_DELETED},
+            [{
+                "$set": {
+                    "updated_at": timestamp,
+                    "message_count": next_seq,
+                    "total_input_tokens": total_input,
+                    "total_output_tokens": total_output,
+                    "preview": {
+                        "user": {"$literal": preview_text(user_prompt)},
+                        "assistant": {"$literal": preview_text(assistant_content)},
+                        "seq": next_seq,
+                        "total_tokens": {"$add": [total_input, total_output]},
+                    },
+                }
+            }],
+            return_document=True
+        )
+        if not updated_chat:
+             raise HTTPException(status_code=404, detail="Conversation not found during update")
+        seq = updated_chat.get("message_count", 0)
+        summary_seq = updated_chat.get("summary_seq")
+
+    # Insert turn document
+    turn_doc = turn_document(
+        user_id, conversation_id, seq, user_prompt, assistant_content, input_tokens, output_tokens,
+        response_time, truncated, ttft, timings, sources, timestamp,
+    )
+    await messages_collection.insert_one(turn_doc)
+    index_turn(turn_doc)
+
+    # Fold turns that left the recent window into the rolling summary, off the request path
+    if needs_summary(seq, summary_seq):
+        spawn(update_summary(conversation_id), name="summary-update")
+
+    # Per-user daily rollup (date in UTC, taken from the ISO timestamp)
+    await usage_collection.update_one(
+        {"user_id": user_id, "date": timestamp[:10]},
+        {"$inc": {"input_tokens": input_tokens, "output_tokens": output_tokens, "turns": 1}},
+        upsert=True
+    )
+
+    return conversation_id
+
+
+@dataclass
+class StreamResult:
+    """Everything collected from a pipeline run while its events are being streamed."""
+    streamed_response: str = "" # What we have streamed so far from LLM
+    full_response: str = ""     # The final total response (including links)
+    input_tokens: int = 0
+    output_tokens: int = 0
+    streamed_chunks: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    first_token_at: float | None = None # perf_counter timestamp of the first streamed content
+    finished_at: float | None = None
+    error: Exception | None = None
+    sources: list[dict] = field(default_factory=list) # Web search sources, sent before the answer
+
+    def response_time(self) -> float:
+        return round((self.finished_at or time.perf_counter()) - self.started_at, 3)
+
+
+async def consume_pipeline_events(
+    pipeline_input: dict, result: StreamResult, queue: asyncio.Queue, config: dict | None = None
 ):
+    """
+    Drive the pipeline and push SSE frames onto the queue, ending with None.
+    Runs as its own task so generation can be cancelled (or left running) independently of the client.
+    """
+    service_name = pipeline_input["service_name"]
+    timer = current_timer() or StageTimer()
+    result.started_at = time.perf_counter()
+    try:
+        async for event in pipeline.astream_events(pipeline_input, config=config, version="v2"):
+            kind = event["event"]
+
+            if kind == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    if result.first_token_at is None:
+                        result.first_token_at = time.perf_counter()
+                        timer.mark_first_token()
+                        LLM_TIME_TO_FIRST_TOKEN.labels(provider=LLM_PROVIDER, service=service_name).observe(
+                            result.first_token_at - result.started_at
+                        )
+                    result.streamed_response += content
+                    result.streamed_chunks += 1
+                    queue.put_nowait(sse_event({'type': 'content', 'content': content}))
+
+            elif kind == "on_chat_model_end":
+                # Accumulate usage across every model call in the run (estimated when the provider reports none)
+                output = event["data"].get("output")
+                if output:
+                    model_input = event["data"].get("input")
+                    prompt_messages = model_input.get("messages", [[]])[0] if isinstance(model_input, dict) else model_input
+                    usage = extract_usage(output, prompt_messages)
+                    result.input_tokens += usage["input_tokens"]
+                    result.output_tokens += usage["output_tokens"]
+
+            elif kind == "on_custom_event" and event["name"] == SOURCES_EVENT:
+                # Published by web_search_node right after the search, ahead of the first token
+                result.sources = event["data"]["sources"]
+                queue.put_nowait(sse_event({'type': 'sources', 'sources': result.sources}))
+
+            elif kind == "on_chain_end":
+                # Capture the final state from the pipeline completion
+                # The event name for the main graph usually matches the graph name or is simply "LangGraph"
+                # We check if the output contains the keys we expect in our state
+                data = event["data"].get("output")
+                if data and isinstance(data, dict) and "llm_response" in data:
+                    result.full_response = data["llm_response"]
+                    result.sources = result.sources or data.get("sources") or []
+
+        if result.first_token_at is not None:
+            # Chunk count stands in for tokens when the provider reports no usage
+            observe_generation(
+                LLM_PROVIDER,
+                service_name,
+                result.output_tokens or result.streamed_chunks,
+                time.perf_counter() - result.first_token_at,
+            )
+
+    except Exception as e:
+        logger.error(f"Error during streaming: {e}", exc_info=True)
+        result.error = e
+    finally:
+        result.finished_at = time.perf_counter()
+        timer.add("pipeline", result.finished_at - result.started_at)
+        queue.put_nowait(None)
+
+
+async def answer_query(user_input: UserInput, user_id: str) -> dict:
+    """
+    Run one query through the pipeline and save the turn; returns the UserQueryResponse fields.
+    Shared by POST /run_pipeline and the job runner (src.jobs).
+    """
     user_prompt = user_input.user_query.strip()
     service_name = user_input.service_name.strip().lower()
-    llm_messages = []
+    db_turns = []
+    existing_conversation = None
     
-    if service_name not in cfg["Services"]["SUPPORTED_SERVICES"]:
+    if service_name not in SUPPORTED_SERVICES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail=f"Service '{service_name}' not supported"
         )
 
-    user_id = str(current_user["_id"])
     conversation_id = user_input.conversation_id
+    timer = current_timer() or StageTimer()
     
     if conversation_id:
         if not ObjectId.is_valid(conversation_id):
@@ -88,96 +399,75 @@ async def execute_user_query(
              
         existing_conversation = await conversations_collection.find_one({
             "_id": ObjectId(conversation_id),
-            "user_id": user_id
+            "user_id": user_id,
+            **NOT_DELETED,
         })
         
         if not existing_conversation:
              raise HTTPException(status_code=404, detail="Conversation not found")
         
-        # Load last 5 turns (10 messages) from DB history for context
-        cursor = messages_collection.find({"chat_id": conversation_id}).sort("created_at", -1).limit(5)
-        db_turns = []
-        async for turn in cursor:
-            db_turns.append(turn)
-        
-        db_turns.reverse() # Restore chronological order
-        for turn in db_turns:
-            llm_messages.append(HumanMessage(content=turn["user"]))
-            llm_messages.append(AIMessage(content=turn["assistant"]))
-    
-    # Append current user message for LLM context
-    llm_messages.append(HumanMessage(content=user_prompt))
+        # Turns the rolling summary does not cover yet; the summary stands in for everything older
+        with timer.stage("history"):
+            db_turns = await load_history(conversation_id, existing_conversation)
+
+    llm_messages = build_llm_messages(db_turns, user_prompt, conversation_summary(existing_conversation))
 
     # Call pipeline
-    response = await pipeline.ainvoke(
-        {   
-            "service_name": service_name,
-            "user_input": user_prompt, 
-            "llm_messages": llm_messages
-        }
-    )
-    
-    assistant_content = response["llm_response"]
-    timestamp = get_current_timestamp()
-    
-    if not conversation_id:
-        # Create new conversation
-        title = await generate_title(user_prompt)
-        new_conversation = {
-            "user_id": user_id,
-            "title": title,
-            "message_count": 1, # First turn
-            "created_at": timestamp,
-            "updated_at": timestamp,
-        }
-        result = await conversations_collection.insert_one(new_conversation)
-        conversation_id = str(result.inserted_id)
-        seq = 1
-    else:
-        # Atomic update of conversation metadata and sequence generation for existing chats
-        updated_chat = await conversations_collection.find_one_and_update(
-            {"_id": ObjectId(conversation_id)},
-            {
-                "$set": {"updated_at": timestamp},
-                "$inc": {"message_count": 1}
+    with timer.stage("pipeline"):
+        response = await pipeline.ainvoke(
+            {   
+                "service_name": service_name,
+                "user_input": user_prompt, 
+                "llm_messages": llm_messages,
+                "deep_search": user_input.deep_search,
             },
-            return_document=True
+            config=run_config(user_id, conversation_id),
         )
-        if not updated_chat:
-             raise HTTPException(status_code=404, detail="Conversation not found during update")
-        seq = updated_chat.get("message_count", 0)
-
-    # Insert turn document
-    turn_doc = {
-        "chat_id": conversation_id,
-        "user": user_prompt,
-        "assistant": assistant_content,
-        "input_tokens": response.get("input_tokens", 0),
-        "output_tokens": response.get("output_tokens", 0),
-        "response_time": response.get("response_time", 0.0),
-        "created_at": timestamp,
-        "seq": seq
-    }
     
-    await messages_collection.insert_one(turn_doc)
+    assistant_content = response["llm_response"]
+    observe_generation(LLM_PROVIDER, service_name, response.get("output_tokens"), timer.stages.get("generation"))
+
+    conversation_id = await save_turn(
+        user_id=user_id,
+        conversation_id=conversation_id,
+        user_prompt=user_prompt,
+        assistant_content=assistant_content,
+        input_tokens=response.get("input_tokens", 0),
+        output_tokens=response.get("output_tokens", 0),
+        response_time=round(timer.stages["pipeline"], 3),
+        timings=timer.as_dict(),
+        sources=response.get("sources"),
+    )
 
     return {
         "conversation_id": conversation_id,
-        "message": assistant_content
+        "message": assistant_content,
+        "sources": response.get("sources") or [],
     }
 
 
+# ---------------- RUN PIPELINE (NON-STREAMING) ----------------
+@router.post("/run_pipeline", response_model=UserQueryResponse, status_code=status.HTTP_201_CREATED)
+async def execute_user_query(
+    user_input: UserInput,
+    current_user=Depends(get_current_user)
+):
+    return await answer_query(user_input, str(current_user["_id"]))
+
+
 # ---------------- RUN PIPELINE (STREAMING) ----------------
 @router.post("/run_pipeline/stream", status_code=status.HTTP_200_OK)
 async def execute_user_query_streaming(
     user_input: UserInput,
+    request: Request,
     current_user=Depends(get_current_user)
 ):
     user_prompt = user_input.user_query.strip()
     service_name = user_input.service_name.strip().lower()
-    llm_messages = []
+    db_turns = []
+    existing_conversation = None
     
-    if service_name not in cfg["Services"]["SUPPORTED_SERVICES"]:
+    if service_name not in SUPPORTED_SERVICES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail=f"Service '{service_name}' not supported"
@@ -185,6 +475,7 @@ async def execute_user_query_streaming(
 
     user_id = str(current_user["_id"])
     conversation_id = user_input.conversation_id
+    timer = current_timer() or StageTimer()
     
     # helper to validate and load history
     if conversation_id:
@@ -193,138 +484,131 @@ async def execute_user_query_streaming(
              
         existing_conversation = await conversations_collection.find_one({
             "_id": ObjectId(conversation_id),
-            "user_id": user_id
+            "user_id": user_id,
+            **NOT_DELETED,
         })
         
         if not existing_conversation:
              raise HTTPException(status_code=404, detail="Conversation not found")
         
-        # Load last 5 turns (10 messages) from DB history for context
-        cursor = messages_collection.find({"chat_id": conversation_id}).sort("created_at", -1).limit(5)
-        db_turns = []
-        async for turn in cursor:
-            db_turns.append(turn)
-        
-        db_turns.reverse() # Restore chronological order
-        for turn in db_turns:
-            llm_messages.append(HumanMessage(content=turn["user"]))
-            llm_messages.append(AIMessage(content=turn["assistant"]))
-    
-    # Append current user message for LLM context
-    llm_messages.append(HumanMessage(content=user_prompt))
+        # Turns the rolling summary does not cover yet; the summary stands in for everything older
+        with timer.stage("history"):
+            db_turns = await load_history(conversation_id, existing_conversation)
 
-    async def stream_generator():
+    llm_messages = build_llm_messages(db_turns, user_prompt, conversation_summary(existing_conversation))
+
+    pipeline_input = {
+        "service_name": service_name,
+        "user_input": user_prompt,
+        "llm_messages": llm_messages,
+        "deep_search": user_input.deep_search,
+    }
+
+    async def persist(result: StreamResult, truncated: bool = False) -> str | None:
         nonlocal conversation_id
-        full_response = "" # The final total response (including links)
-        streamed_response = "" # What we have streamed so far from LLM
-        input_tokens = 0
-        output_tokens = 0
-        response_time = 0.0 # Placeholder, could measure start/end time
-        
-        start_time = datetime.now()
+        # For a truncated turn only what was actually generated is a meaningful partial answer
+        full_response = result.streamed_response if truncated else (result.full_response or result.streamed_response)
+        if truncated and not full_response:
+            logger.info("Client disconnected before any content was generated; nothing to save")
+            return None
+
+        conversation_id = await save_turn(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            user_prompt=user_prompt,
+            assistant_content=full_response,
+            input_tokens=result.input_tokens,
+            output_tokens=result.output_tokens,
+            response_time=result.response_time(),
+            truncated=truncated,
+            ttft=round(timer.first_token, 3) if timer.first_token is not None else None,
+            timings=timer.as_dict(),
+            sources=result.sources,
+        )
+        return conversation_id
 
-        try:
-            async for event in pipeline.astream_events(
-                {   
-                    "service_name": service_name,
-                    "user_input": user_prompt, 
-                    "llm_messages": llm_messages
-                },
-                version="v2"
-            ):
-                kind = event["event"]
-
-                if kind == "on_chat_model_stream":
-                    content = event["data"]["chunk"].content
-                    if content:
-                        streamed_response += content
-                        yield f"data: {json.dumps({'type': 'content', 'content': content})}\n\n"
-                
-                elif kind == "on_chat_model_end":
-                    # Try to capture usage metadata if available
-                    output = event["data"].get("output")
-                    if output and hasattr(output, "usage_metadata"):
-                        usage = output.usage_metadata
-                        input_tokens = usage.get("input_tokens", 0) if hasattr(usage, "input_tokens") else None
-                        output_tokens = usage.get("output_tokens", 0) if hasattr(usage, "output_tokens") else None
-
-                elif kind == "on_chain_end":
-                    # Capture the final state from the pipeline completion
-                    # The event name for the main graph usually matches the graph name or is simply "LangGraph"
-                    # We check if the output contains the keys we expect in our state
-                    data = event["data"].get("output")
-                    if data and isinstance(data, dict) and "llm_response" in data:
-                        full_response = data["llm_response"]
+    async def finish_in_background(producer: asyncio.Task, result: StreamResult):
+        await producer
+        if result.error:
+            return
+        await persist(result)
+
+    def on_client_disconnect(producer: asyncio.Task, result: StreamResult):
+        # Called from a finally block that may itself be cancelled, so nothing here may await
+        if DISCONNECT_POLICY == "background":
+            logger.info("Client disconnected; finishing generation in the background")
+            spawn(finish_in_background(producer, result), name="stream-finish")
+        else:
+            logger.info("Client disconnected; cancelling generation and saving the partial answer")
+            producer.cancel()
+            spawn(persist(result, truncated=True), name="stream-persist-partial")
 
-        except Exception as e:
-            logger.error(f"Error during streaming: {e}", exc_info=True)
-            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+    async def stream_generator():
+        result = StreamResult()
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(consume_pipeline_events(pipeline_input, result, queue, run_config(user_id, conversation_id)))
+
+        disconnected = False
+        last_check = time.monotonic()
+        STREAMS_IN_FLIGHT.inc()
+
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=DISCONNECT_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    frame = ""
+
+                if frame is None:
+                    break
+
+                # Poll between frames as well as when idle; a steady token stream never times out
+                if time.monotonic() - last_check >= DISCONNECT_POLL_INTERVAL:
+                    last_check = time.monotonic()
+                    if await request.is_disconnected():
+                        disconnected = True
+                        return
+
+                if frame:
+                    yield frame
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # The server cancels the generator or fails the send once the client is gone
+            disconnected = True
+            raise
+
+        finally:
+            STREAMS_IN_FLIGHT.dec()
+            if disconnected:
+                on_client_disconnect(producer, result)
+            elif not producer.done():
+                producer.cancel()
+
+        if result.error:
+            yield sse_event({'type': 'error', 'detail': str(result.error)})
             return
 
         # If we didn't capture full_response from on_chain_end for some reason, fallback to streamed
-        if not full_response:
-            full_response = streamed_response
-        
-        # Check if there is extra content (e.g. links) that wasn't streamed
-        if len(full_response) > len(streamed_response):
-            diff = full_response[len(streamed_response):]
-            if diff:
-                yield f"data: {json.dumps({'type': 'content', 'content': diff})}\n\n"
+        if not result.full_response:
+            result.full_response = result.streamed_response
 
-        end_time = datetime.now()
-        response_time = (end_time - start_time).total_seconds()
-        timestamp = get_current_timestamp()
+        # Check if there is extra content (added by a node after generation) that wasn't streamed
+        if len(result.full_response) > len(result.streamed_response):
+            diff = result.full_response[len(result.streamed_response):]
+            if diff:
+                yield sse_event({'type': 'content', 'content': diff})
 
-        # DB persistence logic
+        # DB persistence logic. Shielded so a disconnect at this point does not lose the finished turn.
         try:
-            if not conversation_id:
-                # Create new conversation
-                title = await generate_title(user_prompt)
-                new_conversation = {
-                    "user_id": user_id,
-                    "title": title,
-                    "message_count": 1, 
-                    "created_at": timestamp,
-                    "updated_at": timestamp,
-                }
-                result = await conversations_collection.insert_one(new_conversation)
-                conversation_id = str(result.inserted_id)
-                seq = 1
-            else:
-                # Update existing conversation
-                updated_chat = await conversations_collection.find_one_and_update(
-                    {"_id": ObjectId(conversation_id)},
-                    {
-                        "$set": {"updated_at": timestamp},
-                        "$inc": {"message_count": 1}
-                    },
-                    return_document=True
-                )
-                if updated_chat:
-                    seq = updated_chat.get("message_count", 0)
-                else:
-                    # Fallback or error, though unlikely if checked before
-                    seq = 1 
-
-            # Insert turn document
-            turn_doc = {
-                "chat_id": conversation_id,
-                "user": user_prompt,
-                "assistant": full_response,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "response_time": response_time,
-                "created_at": timestamp,
-                "seq": seq
-            }
-            await messages_collection.insert_one(turn_doc)
+            saved_conversation_id = await asyncio.shield(spawn(persist(result), name="stream-persist"))
 
             # Yield final metadata
-            yield f"data: {json.dumps({'type': 'metadata', 'conversation_id': conversation_id})}\n\n"
-            
+            yield sse_event({'type': 'metadata', 'conversation_id': saved_conversation_id})
+            yield sse_event({'type': 'timing', 'timings': timer.as_dict()})
+
         except Exception as e:
              logger.error(f"Error saving to DB: {e}", exc_info=True)
-             yield f"data: {json.dumps({'type': 'error', 'detail': 'Error saving conversation'})}\n\n"
+             yield sse_event({'type': 'error', 'detail': 'Error saving conversation'})
 
     return StreamingResponse(
         stream_generator(), 
@@ -360,7 +644,8 @@ async def create_new_conversation(
 async def list_conversations(current_user=Depends(get_current_user)):
     user_id = str(current_user["_id"])
     conversations = []
-    cursor = conversations_collection.find({"user_id": user_id}).sort("updated_at", -1)
+    # One query on the (user_id, updated_at) index; the preview saves a turn lookup per conversation
+    cursor = conversations_collection.find({"user_id": user_id, **NOT_DELETED}, {"summary": 0}).sort("updated_at", -1)
     
     async for conversation in cursor:
         conversations.append(serialize_conversation(conversation))
@@ -379,7 +664,8 @@ async def get_conversion_by_id(
         
     conversation = await conversations_collection.find_one({
         "_id": ObjectId(conversation_id),
-        "user_id": str(current_user["_id"])
+        "user_id": str(current_user["_id"]),
+        **NOT_DELETED,
     })
     
     if not conversation:
@@ -389,17 +675,7 @@ async def get_conversion_by_id(
     messages = []
     cursor = messages_collection.find({"chat_id": conversation_id}).sort("created_at", 1)
     async for turn in cursor:
-        messages.append(Message(
-            id=str(turn["_id"]),
-            chat_id=turn["chat_id"],
-            user=turn["user"],
-            assistant=turn["assistant"],
-            input_tokens=turn.get("input_tokens", 0),
-            output_tokens=turn.get("output_tokens", 0),
-            response_time=turn.get("response_time", 0.0),
-            created_at=turn["created_at"],
-            seq=turn.get("seq")
-        ))
+        messages.append(serialize_message(turn))
         
     return serialize_conversation(conversation, messages=messages)
 
@@ -417,7 +693,8 @@ async def update_exiting_conversion(
     # Check if conversation exists and belongs to user
     existing_conversation = await conversations_collection.find_one({
         "_id": ObjectId(conversation_id),
-        "user_id": str(current_user["_id"])
+        "user_id": str(current_user["_id"]),
+        **NOT_DELETED,
     })
     if not existing_conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -435,7 +712,7 @@ async def update_exiting_conversion(
 
 
 # ---------------- DELETE CONVERSATION BY CHAT_ID ----------------
-@router.delete("/conversations/{conversation_id}", status_code=status.HTTP_200_OK)
+@router.delete("/conversations/{conversation_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_conversion_by_id(
     conversation_id: str,
     current_user=Depends(get_current_user)
@@ -443,41 +720,41 @@ async def delete_conversion_by_id(
     if not ObjectId.is_valid(conversation_id):
         raise HTTPException(status_code=400, detail="Invalid conversation ID")
 
-    # Delete conversation
-    result = await conversations_collection.delete_one({
-        "_id": ObjectId(conversation_id),
-        "user_id": str(current_user["_id"])
-    })
+    user_id = str(current_user["_id"])
 
-    if result.deleted_count == 0:
+    # Hide the conversation now; its messages are removed by a background purge job
+    if not await soft_delete(user_id, conversation_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    # Delete associated messages
-    await messages_collection.delete_many({"chat_id": conversation_id})
+    job = await job_runner.submit(user_id, {"conversation_id": conversation_id}, kind="purge")
 
-    return {"message": "Conversation and associated messages deleted successfully"}
+    return {"message": "Conversation deleted; associated messages are being removed", "job_id": str(job["_id"])}
 
 
 # ---------------- DELETE ALL CONVERSATIONS ----------------
-@router.delete("/conversations", status_code=status.HTTP_200_OK)
+@router.delete("/conversations", status_code=status.HTTP_202_ACCEPTED)
 async def delete_all_conversations(current_user=Depends(get_current_user)):
     user_id = str(current_user["_id"])
 
-    # 1. Find all conversations for this user to get their IDs
-    cursor = conversations_collection.find({"user_id": user_id}, {"_id": 1})
-    conversation_ids = [doc["_id"] async for doc in cursor]
-    
-    # 2. Convert ObjectIds to strings if stored as strings in messages
-    chat_ids_str = [str(cid) for cid in conversation_ids]
+    # One indexed update hides them all; the purge job deletes them in chunks
+    deleted_count = await soft_delete(user_id)
+    job = await job_runner.submit(user_id, {"conversation_id": None}, kind="purge")
 
-    if chat_ids_str:
-        # 3. Delete all messages for these conversations
-        await messages_collection.delete_many({"chat_id": {"$in": chat_ids_str}})
+    return {
+        "message": f"{deleted_count} conversations deleted; associated messages are being removed",
+        "job_id": str(job["_id"]),
+    }
 
-    # 4. Delete all conversations for this user
-    result = await conversations_collection.delete_many({"user_id": user_id})
 
-    return {"message": f"{result.deleted_count} conversations and all associated messages deleted successfully"}
+# ---------------- SEARCH CONVERSATIONS ----------------
+@router.get("/search", response_model=SearchResponse)
+async def search_conversations(
+    q: str = Query(min_length=1, max_length=200, description="Words to find in turns and titles"),
+    offset: int = Query(default=0, ge=0, le=SEARCH_MAX_OFFSET),
+    limit: int = Query(default=20, ge=1, le=SEARCH_MAX_LIMIT),
+    current_user=Depends(get_current_user)
+):
+    return await search(str(current_user["_id"]), q, offset, limit)
 
 
 # ---------------- RENAME CONVERSATION BY CHAT_ID ----------------
@@ -498,7 +775,8 @@ async def rename_conversation_title(
     # Ensure conversation belongs to the user
     conversation = await conversations_collection.find_one({
         "_id": ObjectId(conversation_id),
-        "user_id": str(current_user["_id"])
+        "user_id": str(current_user["_id"]),
+        **NOT_DELETED,
     })
 
     if not conversation:
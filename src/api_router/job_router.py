@@ -0,0 +1,129 @@
+"""
+Async job API.
+
+POST /chat/jobs accepts the same body as /chat/run_pipeline but answers 202 with a job ID as soon
+as the job is stored; the pipeline runs under the worker-side JobRunner (src.jobs). Clients either
+poll GET /chat/jobs/{job_id} or subscribe to GET /chat/jobs/{job_id}/events, an SSE channel that
+sends the job's status every time it changes and closes once the job has succeeded or failed.
+Disconnecting from either has no effect on the job.
+"""
+
+import time
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+
+from src.api_router.chat_router import SUPPORTED_SERVICES, sse_event
+from src.config import settings
+from src.database import conversations_collection, jobs_collection
+from src.deps import get_current_user
+from src.jobs import TERMINAL_STATUSES, job_runner
+from src.purge import NOT_DELETED
+from src.schemas import JobStatus, UserInput
+
+JOBS = settings.Jobs
+
+KEEPALIVE_INTERVAL = 15  # Seconds; an SSE comment keeps proxies from closing a quiet channel
+
+router = APIRouter(prefix="/chat", tags=["Chat"])
+
+
+def serialize_job(job: dict) -> JobStatus:
+    return JobStatus(
+        id=str(job["_id"]),
+        kind=job.get("kind", "query"),
+        status=job["status"],
+        service_name=job["input"].get("service_name"),
+        conversation_id=job["input"].get("conversation_id"),
+        attempts=job.get("attempts", 0),
+        result=job.get("result"),
+        error=job.get("error"),
+        progress=job.get("progress"),
+        created_at=job["created_at"],
+        started_at=job.get("started_at"),
+        finished_at=job.get("finished_at"),
+    )
+
+
+async def get_user_job(job_id: str, user_id: str) -> dict:
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    job = await jobs_collection.find_one({"_id": ObjectId(job_id), "user_id": user_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# ---------------- SUBMIT JOB ----------------
+@router.post("/jobs", response_model=JobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(
+    user_input: UserInput,
+    response: Response,
+    current_user=Depends(get_current_user)
+):
+    service_name = user_input.service_name.strip().lower()
+    user_id = str(current_user["_id"])
+
+    # Reject what the job would fail on anyway before queuing it
+    if service_name not in SUPPORTED_SERVICES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Service '{service_name}' not supported"
+        )
+    if user_input.conversation_id:
+        if not ObjectId.is_valid(user_input.conversation_id):
+            raise HTTPException(status_code=400, detail="Invalid conversation ID")
+        conversation = await conversations_collection.find_one(
+            {"_id": ObjectId(user_input.conversation_id), "user_id": user_id, **NOT_DELETED}, {"_id": 1}
+        )
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+
+    job = await job_runner.submit(user_id, user_input.model_dump())
+    response.headers["Location"] = f"{router.prefix}/jobs/{job['_id']}"
+    return serialize_job(job)
+
+
+# ---------------- GET JOB STATUS ----------------
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str, current_user=Depends(get_current_user)):
+    return serialize_job(await get_user_job(job_id, str(current_user["_id"])))
+
+
+# ---------------- JOB STATUS CHANNEL (SSE) ----------------
+@router.get("/jobs/{job_id}/events", status_code=status.HTTP_200_OK)
+async def job_status_events(job_id: str, current_user=Depends(get_current_user)):
+    user_id = str(current_user["_id"])
+    job = await get_user_job(job_id, user_id)
+
+    async def status_stream():
+        nonlocal job
+        last_sent, last_frame_at = None, time.monotonic()
+        while True:
+            current = serialize_job(job)
+            if current != last_sent:
+                yield sse_event({'type': 'status', 'job': current.model_dump()})
+                last_sent, last_frame_at = current, time.monotonic()
+            elif time.monotonic() - last_frame_at >= KEEPALIVE_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_frame_at = time.monotonic()
+
+            if job["status"] in TERMINAL_STATUSES:
+                return
+
+            # Woken early when this worker runs the job; otherwise the store is re-read every POLL_INTERVAL
+            await job_runner.wait_for_change(job_id, JOBS.POLL_INTERVAL)
+            job = await jobs_collection.find_one({"_id": ObjectId(job_id), "user_id": user_id})
+            if job is None:
+                yield sse_event({'type': 'error', 'detail': 'Job not found'})
+                return
+
+    return StreamingResponse(
+        status_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
@@ -1,17 +1,21 @@
 import logging
 from datetime import UTC, datetime, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-from src.database import conversations_collection, messages_collection, users_collection
+from src.database import usage_collection, users_collection
 from src.deps import RoleChecker, get_current_user
+from src.jobs import job_runner
+from src.purge import soft_delete
 from src.schemas import (
     ForgotPasswordRequest,
     ResetPasswordRequest,
     ResetPasswordWithOTP,
     Token,
     UpdateUserNameRequest,
+    UsageReport,
+    UsageRollup,
     UserCreate,
     UserLogin,
 )
@@ -118,31 +122,19 @@ async def update_user_name(data: UpdateUserNameRequest, current_user=Depends(get
 
 
 # ---------------- DELETE ACCOUNT ----------------
-@router.delete("/delete-user")
+@router.delete("/delete-user", status_code=status.HTTP_202_ACCEPTED)
 async def delete_user(current_user=Depends(get_current_user)):
     user_id = str(current_user["_id"])
-    
-    # 1. Find all conversations for this user to get their IDs
-    cursor = conversations_collection.find({"user_id": user_id}, {"_id": 1})
-    conversation_ids = [doc["_id"] async for doc in cursor] # extraction requires async iteration
-    
-    # 2. Convert ObjectIds to strings if stored as strings in messages (based on chat_router), 
-    #    but chat_router uses string conversation_id in messages. 
-    #    Let's check chat_router again: 
-    #    conversation_id = str(result.inserted_id) -> stored as string in messages "chat_id"
-    chat_ids_str = [str(cid) for cid in conversation_ids]
-
-    if chat_ids_str:
-        # 3. Delete all messages for these conversations
-        await messages_collection.delete_many({"chat_id": {"$in": chat_ids_str}})
 
-    # 4. Delete all conversations for this user
-    await conversations_collection.delete_many({"user_id": user_id})
+    # 1. Hide all of the user's conversations; a background purge job deletes them and their messages in chunks
+    await soft_delete(user_id)
+    job = await job_runner.submit(user_id, {"conversation_id": None}, kind="purge")
 
-    # 5. Delete the user
+    # 2. Delete the user and their usage rollups (one per active day, so a single delete)
     await users_collection.delete_one({"_id": current_user["_id"]})
+    await usage_collection.delete_many({"user_id": user_id})
     
-    return {"message": "User and all associated data deleted successfully"}
+    return {"message": "User deleted; associated data is being removed", "job_id": str(job["_id"])}
 
 
 # ---------------- FORGOT PASSWORD ----------------
@@ -201,4 +193,49 @@ async def admin_only_route(admin_user=Depends(RoleChecker(["ROLE_ADMIN"]))):
 
 
 
-    
\ No newline at end of file
+    
+
+
+# ---------------- ADMIN USAGE REPORT ----------------
+@router.get("/admin/usage", response_model=UsageReport)
+async def admin_usage_report(
+    user_id: str | None = None,
+    start_date: str | None = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="Inclusive, YYYY-MM-DD (UTC)"),
+    end_date: str | None = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="Inclusive, YYYY-MM-DD (UTC)"),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    admin_user=Depends(RoleChecker(["ROLE_ADMIN"]))
+):
+    # Reads the per-user daily rollups maintained at write time; never aggregates over messages
+    query = {}
+    if user_id:
+        query["user_id"] = user_id
+    if start_date or end_date:
+        query["date"] = {}
+        if start_date:
+            query["date"]["$gte"] = start_date
+        if end_date:
+            query["date"]["$lte"] = end_date
+
+    report = UsageReport(start_date=start_date, end_date=end_date)
+    cursor = usage_collection.find(query, {"_id": 0}).sort("date", -1).limit(limit)
+    async for doc in cursor:
+        report.rollups.append(UsageRollup(**doc))
+
+    # Totals cover the whole filter, not just the first `limit` rollups returned
+    totals = usage_collection.aggregate([
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "input_tokens": {"$sum": "$input_tokens"},
+            "output_tokens": {"$sum": "$output_tokens"},
+            "turns": {"$sum": "$turns"},
+            "rollups": {"$sum": 1},
+        }},
+    ])
+    async for total in totals:
+        report.input_tokens = total["input_tokens"]
+        report.output_tokens = total["output_tokens"]
+        report.turns = total["turns"]
+        report.truncated = total["rollups"] > len(report.rollups)
+
+    return report
@@ -0,0 +1,44 @@
+"""
+Helpers for fire-and-forget work that must outlive the request that started it.
+
+asyncio only keeps weak references to running tasks, so a task created with create_task()
+and never awaited can be garbage collected mid-flight. spawn() keeps a strong reference until
+the task finishes and logs failures; drain() lets the lifespan wait for pending work on shutdown.
+"""
+
+import asyncio
+import logging
+from typing import Coroutine
+
+logger = logging.getLogger(__name__)
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _on_task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc:
+        logger.error(f"Background task '{task.get_name()}' failed: {exc}", exc_info=exc)
+
+
+def spawn(coro: Coroutine, name: str | None = None) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
+
+
+async def drain(timeout: float) -> None:
+    if not _background_tasks:
+        return
+
+    pending = list(_background_tasks)
+    logger.info(f"Waiting for {len(pending)} background task(s) to finish")
+    done, not_done = await asyncio.wait(pending, timeout=timeout)
+
+    for task in not_done:
+        logger.warning(f"Cancelling background task '{task.get_name()}' after {timeout}s")
+        task.cancel()
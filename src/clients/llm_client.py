@@ -1,15 +1,11 @@
 import os, logging
-from dotenv import load_dotenv
-from src.utils import load_config
+from src.config import settings
 from src.llms import LLMFactory
 
-load_dotenv()
-cfg = load_config()
 logger = logging.getLogger(__name__)
 
 def get_llm_model():
-    llm_cfg = cfg.get("LLM", {})
-    inference_type = llm_cfg.get("Provider", "").lower()
+    inference_type = settings.LLM.Provider.lower()
 
     if not inference_type:
         raise ValueError("LLM Provider not specified in configuration.")
@@ -28,7 +24,22 @@ def get_llm_model():
                    or os.getenv("GROQ_API_KEY")
     }
 
-    return provider.create_model(llm_cfg.get(inference_type, {}), **kwargs)
+    model = provider.create_model(settings.LLM.provider_config(inference_type), **kwargs)
 
-# Maintain compatibility or provide a singleton if needed
-llm_model = get_llm_model()
+    if settings.Tracing.ENABLED:
+        from src.tracing import LLMSpanHandler
+        model.callbacks = [*(model.callbacks or []), LLMSpanHandler(inference_type)]
+
+    return model
+
+# Process-wide model, built by the app lifespan (init_llm_model) rather than at import time
+_llm_model = None
+
+def init_llm_model():
+    global _llm_model
+    _llm_model = get_llm_model()
+    return _llm_model
+
+def get_llm():
+    """The shared model; built on first use if the lifespan has not run (scripts, tests)."""
+    return _llm_model if _llm_model is not None else init_llm_model()
@@ -0,0 +1,7 @@
+from .settings import Settings, get_settings, settings
+
+__all__ = [
+    "Settings",
+    "get_settings",
+    "settings",
+]
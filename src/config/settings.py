@@ -0,0 +1,283 @@
+"""
+Application settings, parsed once per process.
+
+config.yml is resolved relative to this package (not the working directory), environment
+overrides are applied, and the result is validated into frozen Pydantic models that every
+module shares through `settings`. Field names mirror the YAML keys one-to-one.
+
+Environment overrides:
+    - AICHATAPP__<SECTION>__<KEY>[__<KEY>...]=value, matched case-insensitively against the YAML
+      keys, e.g. AICHATAPP__LLM__PROVIDER=fake or AICHATAPP__FASTAPI__WORKERS=4. Values are parsed
+      as YAML scalars, so numbers and booleans keep their types.
+    - The secrets JWT_SECRET_KEY, SENDER_EMAIL and SENDER_PASSWORD keep their plain names.
+"""
+
+import copy
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Literal, Mapping
+
+import yaml
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, model_validator
+
+CONFIG_DIR = Path(__file__).resolve().parent
+ENV_PREFIX = "AICHATAPP__"
+
+# Plain-named secrets and where they live in the settings tree
+SECRET_ENV_VARS = {
+    "JWT_SECRET_KEY": ("Security", "JWT_SECRET_KEY"),
+    "SENDER_EMAIL": ("Email", "SENDER_EMAIL"),
+    "SENDER_PASSWORD": ("Email", "SENDER_PASSWORD"),
+}
+
+
+class _Section(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+
+class FastAPISettings(_Section):
+    HOST: str
+    PORT: int
+    WORKERS: int
+    LOG_LEVEL: str
+    TIMEOUT: int
+    GRACEFUL_TIMEOUT: int
+    BACKGROUND_DRAIN_TIMEOUT: float = 30
+
+
+class MongoDBSettings(_Section):
+    MONGO_URL: str
+    DB_NAME: str
+    USER_COLLECTION: str
+    CHAT_HISTORY_COLLECTION: str
+    MESSAGES_COLLECTION: str
+    USAGE_COLLECTION: str
+    JOBS_COLLECTION: str = "chat_jobs"
+
+
+class SecuritySettings(_Section):
+    ALGORITHM: str
+    ACCESS_TOKEN_EXPIRE_MINUTES: int
+    JWT_SECRET_KEY: str | None = None
+
+
+class EmailSettings(_Section):
+    SMTP_SERVER: str
+    SMTP_PORT: int
+    SENDER_EMAIL: str | None = None
+    SENDER_PASSWORD: str | None = None
+
+
+class LoggingSettings(_Section):
+    LOG_DIR: str
+    LOG_LEVEL: str
+    DEBUG_LOG_FILE_NAME: str
+    INFO_LOG_FILE_NAME: str
+    WARNING_LOG_FILE_NAME: str
+    ERROR_LOG_FILE_NAME: str
+    MAX_FILE_SIZE: int
+    MAX_FILE_COUNT: int
+    LOG_FORMAT: str
+    NOISY_LOGGERS: tuple[str, ...] = ()
+    FORMAT: Literal["text", "json"] = "text"
+    QUEUE_SIZE: int = 10000
+    DROP_POLICY: Literal["drop_new", "drop_oldest"] = "drop_new"
+
+
+class MetricsSettings(_Section):
+    ENABLED: bool = True
+    MULTIPROC_DIR: str = "metrics"
+
+
+class StreamingSettings(_Section):
+    DISCONNECT_POLICY: Literal["cancel", "background"] = "cancel"
+    DISCONNECT_POLL_INTERVAL: float = 0.5
+
+
+class WarmupSettings(_Section):
+    ENABLED: bool = True
+    GENERATION: bool = True
+    PROMPT: str = "Hi"
+    MONGO_CONNECTIONS: int = 4
+    TIMEOUT: float = 120
+    FAIL_ON_ERROR: bool = False
+
+
+class DeepSearchSettings(_Section):
+    ENABLED: bool = False
+    TOP_K: int = 4
+    LATENCY_BUDGET: float = 5
+    PAGE_TIMEOUT: float = 3
+    MAX_CONCURRENCY: int = 8
+    PER_HOST_CONCURRENCY: int = 2
+    MAX_PAGE_BYTES: int = 1024 * 1024
+    MAX_TEXT_CHARS: int = 30000
+    PASSAGE_TOKENS: int = 300
+    CONTEXT_TOKEN_BUDGET: int = 1500
+    CACHE_ENTRIES: int = 256
+    CACHE_TTL: float = 600
+    MAX_REDIRECTS: int = 5
+    USER_AGENT: str = "Mozilla/5.0 (compatible; AIChatApp/1.0)"
+
+
+class WebSearchSettings(_Section):
+    REGION: str = "in-en"
+    MAX_RESULTS: int = 8
+    SEARCH_TIMEOUT: float = 10
+    CONTEXT_TOKEN_BUDGET: int = 700
+    DEDUPE_THRESHOLD: float = 0.8
+    BLOCKED_DOMAINS: tuple[str, ...] = ("zhidao",)
+    DEEP_SEARCH: DeepSearchSettings = DeepSearchSettings()
+
+
+class SummarySettings(_Section):
+    ENABLED: bool = True
+    RECENT_TURNS: int = 4
+    FOLD_BATCH: int = 4
+    MAX_FOLD_TURNS: int = 20
+    MAX_WORDS: int = 250
+    TURN_CHAR_LIMIT: int = 2000
+    HISTORY_TURNS: int = 5
+
+
+class BatchSettings(_Section):
+    MAX_ITEMS: int = 1000
+    CONCURRENCY: int = 4
+    MAX_CONCURRENCY: int = 16
+    WRITE_BATCH_SIZE: int = 100
+    WRITE_INTERVAL: float = 1
+
+
+class JobsSettings(_Section):
+    CONCURRENCY: int = 2
+    HEARTBEAT_INTERVAL: float = 10
+    STALE_AFTER: float = 60
+    RECOVERY_INTERVAL: float = 30
+    MAX_ATTEMPTS: int = 2
+    MAX_RUNTIME: float = 1800
+    POLL_INTERVAL: float = 1
+    RETENTION_DAYS: int = 7
+
+
+class DeletionSettings(_Section):
+    CHUNK_SIZE: int = 500
+    CONVERSATION_CHUNK_SIZE: int = 50
+    THROTTLE: float = 0.1
+    CONCURRENCY: int = 1
+
+
+class SearchSettings(_Section):
+    BACKEND: Literal["auto", "text", "local"] = "auto"
+    SNIPPET_CHARS: int = 160
+    MAX_LIMIT: int = 50
+    MAX_OFFSET: int = 1000
+    LOCAL_INDEX_USERS: int = 128
+    LOCAL_INDEX_MAX_TURNS: int = 20000
+
+
+class TracingSettings(_Section):
+    ENABLED: bool = False
+    SERVICE_NAME: str = "aichatapp"
+    SAMPLER: Literal["always_on", "always_off", "ratio"] = "ratio"
+    SAMPLE_RATIO: float = 0.1
+    PARENT_BASED: bool = True
+    EXPORTER: Literal["jsonl", "otlp"] = "jsonl"
+    JSONL_FILE: str = "logs/traces.jsonl"
+    MAX_FILE_SIZE: int = 10 * 1024 * 1024
+    MAX_FILE_COUNT: int = 5
+    OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    OTLP_TIMEOUT: float = 5
+    QUEUE_SIZE: int = 10000
+    BATCH_SIZE: int = 512
+    EXPORT_INTERVAL: float = 2
+
+
+class ServicesSettings(_Section):
+    SUPPORTED_SERVICES: tuple[str, ...]
+    SUPPORTED_MODEL_TYPE: tuple[str, ...]
+    SUPPORTED_LLM_PROVIDER: tuple[str, ...]
+
+
+class LLMSettings(_Section):
+    # Provider sections (ollama, vllm, ...) differ per backend and are kept as extra fields
+    model_config = ConfigDict(frozen=True, extra="allow")
+
+    Provider: str
+
+    def provider_config(self, provider: str | None = None) -> dict:
+        """A copy of the named (default: active) provider's section, as passed to create_model()."""
+        section = (self.model_extra or {}).get((provider or self.Provider).lower(), {})
+        return copy.deepcopy(section)
+
+
+class Settings(_Section):
+    FastAPI: FastAPISettings
+    MongoDB: MongoDBSettings
+    Security: SecuritySettings
+    Email: EmailSettings
+    Logging: LoggingSettings
+    Metrics: MetricsSettings = MetricsSettings()
+    Streaming: StreamingSettings = StreamingSettings()
+    Warmup: WarmupSettings = WarmupSettings()
+    WebSearch: WebSearchSettings = WebSearchSettings()
+    Summary: SummarySettings = SummarySettings()
+    Batch: BatchSettings = BatchSettings()
+    Jobs: JobsSettings = JobsSettings()
+    Deletion: DeletionSettings = DeletionSettings()
+    Search: SearchSettings = SearchSettings()
+    Tracing: TracingSettings = TracingSettings()
+    Services: ServicesSettings
+    LLM: LLMSettings
+
+    @model_validator(mode="after")
+    def check_llm_provider(self):
+        provider = self.LLM.Provider.lower()
+        if provider not in self.Services.SUPPORTED_LLM_PROVIDER:
+            raise ValueError(f"LLM provider '{provider}' is not in SUPPORTED_LLM_PROVIDER")
+        if provider not in (self.LLM.model_extra or {}):
+            raise ValueError(f"No configuration section for LLM provider '{provider}'")
+        return self
+
+
+def _set_path(tree: dict, path: list[str], value: Any):
+    """Set a nested key, reusing existing keys whose name matches case-insensitively."""
+    node = tree
+    for index, part in enumerate(path):
+        key = next((existing for existing in node if existing.lower() == part.lower()), part)
+        if index == len(path) - 1:
+            node[key] = value
+        else:
+            node = node.setdefault(key, {})
+
+
+def apply_env_overrides(raw: dict, environ: Mapping[str, str]) -> dict:
+    config = copy.deepcopy(raw)
+
+    for env_name, path in SECRET_ENV_VARS.items():
+        if environ.get(env_name):
+            _set_path(config, list(path), environ[env_name])
+
+    for env_name, value in environ.items():
+        if env_name.startswith(ENV_PREFIX):
+            path = [part for part in env_name[len(ENV_PREFIX):].split("__") if part]
+            if path:
+                _set_path(config, path, yaml.safe_load(value))
+
+    return config
+
+
+@lru_cache
+def read_config_file(filename: str = "config.yml") -> dict:
+    with open(CONFIG_DIR / filename, "r") as f:
+        return yaml.safe_load(f)
+
+
+@lru_cache
+def get_settings(filename: str = "config.yml") -> Settings:
+    load_dotenv()
+    return Settings.model_validate(apply_env_overrides(read_config_file(filename), os.environ))
+
+
+settings = get_settings()
@@ -1,20 +1,51 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import timezone
-from src.utils import load_config
+from src.metrics import MongoCommandMetrics
+from src.config import settings
+from src.tracing import MongoCommandTracer
 
-cfg = load_config()
+MONGO_URL = settings.MongoDB.MONGO_URL
+DB_NAME = settings.MongoDB.DB_NAME
+USER_COLLECTION = settings.MongoDB.USER_COLLECTION
+CHAT_HISTORY_COLLECTION = settings.MongoDB.CHAT_HISTORY_COLLECTION
+MESSAGES_COLLECTION = settings.MongoDB.MESSAGES_COLLECTION
+USAGE_COLLECTION = settings.MongoDB.USAGE_COLLECTION
+JOBS_COLLECTION = settings.MongoDB.JOBS_COLLECTION
 
-MONGO_URL = cfg["MongoDB"]["MONGO_URL"]
-DB_NAME = cfg["MongoDB"]["DB_NAME"]
-USER_COLLECTION = cfg["MongoDB"]["USER_COLLECTION"]
-CHAT_HISTORY_COLLECTION = cfg["MongoDB"]["CHAT_HISTORY_COLLECTION"]
-MESSAGES_COLLECTION = cfg["MongoDB"]["MESSAGES_COLLECTION"]
-
-client = AsyncIOMotorClient(MONGO_URL, tz_aware=True, tzinfo=timezone.utc)
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    tz_aware=True,
+    tzinfo=timezone.utc,
+    event_listeners=[MongoCommandMetrics()] + ([MongoCommandTracer()] if settings.Tracing.ENABLED else []),
+)
 db = client[DB_NAME]
 
 users_collection = db[USER_COLLECTION]
 conversations_collection = db[CHAT_HISTORY_COLLECTION]
 messages_collection = db[MESSAGES_COLLECTION]
+usage_collection = db[USAGE_COLLECTION]
+jobs_collection = db[JOBS_COLLECTION]
+
+
+async def ensure_indexes():
+    # One rollup document per user per day; also serves date-range reads
+    await usage_collection.create_index([("user_id", 1), ("date", 1)], unique=True)
+    await usage_collection.create_index([("date", 1)])
+    # Per-user conversation reads (and soft deletes); per-conversation turn reads and chunked purges
+    await conversations_collection.create_index([("user_id", 1), ("updated_at", -1)])
+    await messages_collection.create_index([("chat_id", 1), ("seq", 1)])
+    # A user's soft-deleted conversations (purges, and the filter search applies to its hits)
+    await conversations_collection.create_index([("user_id", 1), ("deleted_at", 1)])
+    # Per-user turn reads (recent activity, export) and per-user reads of one conversation's turns
+    await messages_collection.create_index([("user_id", 1), ("created_at", -1)])
+    await messages_collection.create_index([("user_id", 1), ("chat_id", 1), ("seq", 1)])
+    # Full-text search, always scoped to one user (GET /chat/search)
+    await messages_collection.create_index([("user_id", 1), ("user", "text"), ("assistant", "text")], name="turn_text")
+    await conversations_collection.create_index([("user_id", 1), ("title", "text")], name="title_text")
+    # Job status reads per user, the recovery sweep, and removal of finished jobs
+    await jobs_collection.create_index([("user_id", 1), ("created_at", -1)])
+    await jobs_collection.create_index([("status", 1), ("heartbeat_at", 1)])
+    await jobs_collection.create_index([("status", 1), ("kind", 1), ("created_at", 1)])  # Queued jobs per kind, oldest first
+    await jobs_collection.create_index([("expire_at", 1)], expireAfterSeconds=0)
 
 
@@ -11,25 +11,30 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 
 from src.database import users_collection
+from src.logger import set_log_field
+from src.timing import stage
+from src.tracing import span
 from src.utils import JWT_SECRET_KEY, ALGORITHM
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
+    with stage("auth"), span("auth.get_current_user"):
+        try:
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+            email = payload.get("sub")
 
-        if not email:
-            raise HTTPException(status_code=401, detail="Invalid token")
+            if not email:
+                raise HTTPException(status_code=401, detail="Invalid token")
 
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        user = await users_collection.find_one({"email": email})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        set_log_field("user_id", str(user["_id"]))
 
     return user
 
@@ -0,0 +1,10 @@
+"""
+Gunicorn server hooks, loaded by main_prod with `-c python:src.gunicorn_conf`.
+"""
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges (e.g. in-flight streams) from the aggregated metrics
+    multiprocess.mark_process_dead(worker.pid)
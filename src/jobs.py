@@ -0,0 +1,301 @@
+"""
+Async chat jobs.
+
+The thinking service and slow reasoning models can run close to gunicorn's TIMEOUT, holding a
+worker connection the whole time. In job mode POST /chat/jobs stores a job document and returns its
+ID straight away; the pipeline runs in a background task of whichever worker claims the job, and
+clients poll GET /chat/jobs/{id} or follow GET /chat/jobs/{id}/events (SSE).
+
+Job document (MongoDB.JOBS_COLLECTION):
+    - kind:                     "query" (a UserInput through the pipeline) or "purge" (src.purge)
+    - status:                   queued -> running -> succeeded | failed
+    - user_id, input:           the owner and what to run
+    - worker_id, heartbeat_at:  the worker running it; the heartbeat is refreshed every HEARTBEAT_INTERVAL
+    - attempts:                 claims so far
+    - result | error, progress, created_at, updated_at, started_at, finished_at
+    - expire_at:                set when the job finishes; a TTL index removes it RETENTION_DAYS later
+
+A claim is one find_one_and_update on {status: queued}, so a job runs in one worker at a time no
+matter how many workers see it. Jobs do not belong to the request that created them, so a client
+disconnect changes nothing. A worker that shuts down hands its running jobs back to the queue; one
+that dies stops heartbeating, and the recovery sweep of any live worker requeues its jobs once the
+heartbeat is older than STALE_AFTER (or fails them after MAX_ATTEMPTS runs). A job lost after its
+turn was saved but before it was marked finished runs again, so delivery is at least once.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from collections import Counter
+from datetime import UTC, datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from src.background import spawn
+from src.config import settings
+from src.database import jobs_collection
+from src.metrics import CHAT_JOBS
+from src.purge import purge_conversations
+from src.schemas import UserInput
+from src.timing import timer_scope
+
+logger = logging.getLogger(__name__)
+
+JOBS = settings.Jobs
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def get_current_timestamp() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+def worker_id() -> str:
+    # Evaluated per call: gunicorn workers are forked after import
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def job_document(user_id: str, job_input: dict, kind: str = "query") -> dict:
+    timestamp = get_current_timestamp()
+    return {
+        "kind": kind,
+        "user_id": user_id,
+        "status": "queued",
+        "input": job_input,
+        "attempts": 0,
+        "worker_id": None,
+        "heartbeat_at": None,
+        "result": None,
+        "error": None,
+        "created_at": timestamp,
+        "updated_at": timestamp,
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+async def run_job(job: dict) -> dict:
+    """Run the job's query and save its turn; returns the UserQueryResponse fields."""
+    from src.api_router.chat_router import answer_query  # chat_router submits purge jobs
+    with timer_scope():
+        return await answer_query(UserInput(**job["input"]), job["user_id"])
+
+
+# Handler and time limit per job kind. Purges have none: they are throttled on purpose and resume if interrupted.
+JOB_KINDS = {
+    "query": (run_job, JOBS.MAX_RUNTIME),
+    "purge": (purge_conversations, None),
+}
+# Jobs of each kind run at once per worker. Separate slots, so long purges cannot hold up user queries.
+KIND_CONCURRENCY = {
+    "query": JOBS.CONCURRENCY,
+    "purge": settings.Deletion.CONCURRENCY,
+}
+
+
+class JobRunner:
+    """Claims and runs jobs in this worker, at most KIND_CONCURRENCY of each kind at a time."""
+
+    def __init__(self):
+        self._slots = {kind: asyncio.Semaphore(limit) for kind, limit in KIND_CONCURRENCY.items()}
+        self._running: dict[str, asyncio.Task] = {}  # Scheduled in this worker, waiting for a slot or running
+        self._scheduled = Counter()  # Entries of _running per kind
+        self._changed: dict[str, set[asyncio.Event]] = {}  # One event per status subscriber in this worker
+        self._sweeper: asyncio.Task | None = None
+
+    async def submit(self, user_id: str, job_input: dict, kind: str = "query") -> dict:
+        job = job_document(user_id, job_input, kind)
+        result = await jobs_collection.insert_one(job)
+        job["_id"] = result.inserted_id
+        self.schedule(str(result.inserted_id), kind)
+        return job
+
+    def schedule(self, job_id: str, kind: str = "query"):
+        if job_id in self._running:
+            return
+        task = spawn(self._run(job_id, kind), name=f"job-{job_id}")
+        self._running[job_id] = task
+        self._scheduled[kind] += 1
+
+        def on_done(_):
+            self._running.pop(job_id, None)
+            self._scheduled[kind] -= 1
+
+        task.add_done_callback(on_done)
+
+    async def _run(self, job_id: str, kind: str):
+        async with self._slots[kind]:
+            timestamp = get_current_timestamp()
+            job = await jobs_collection.find_one_and_update(
+                {"_id": ObjectId(job_id), "status": "queued"},
+                {
+                    "$set": {
+                        "status": "running",
+                        "worker_id": worker_id(),
+                        "heartbeat_at": datetime.now(UTC),
+                        "started_at": timestamp,
+                        "updated_at": timestamp,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                return_document=True,
+            )
+            if job is None:
+                return  # Claimed by another worker, or no longer queued
+            self.notify(job_id)
+
+            handler, max_runtime = JOB_KINDS[job.get("kind", "query")]
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                result = await asyncio.wait_for(handler(job), timeout=max_runtime)
+                await self._finish(job_id, "succeeded", result=result)
+            except asyncio.CancelledError:
+                # Worker shutting down: hand the job back so a live (or restarted) worker picks it up
+                await self._requeue(job_id)
+                raise
+            except asyncio.TimeoutError:
+                await self._finish(job_id, "failed", error=f"Job did not finish within {max_runtime}s")
+            except HTTPException as e:
+                await self._finish(job_id, "failed", error=str(e.detail))
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+                await self._finish(job_id, "failed", error=str(e))
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOBS.HEARTBEAT_INTERVAL)
+            try:
+                await jobs_collection.update_one(
+                    {"_id": ObjectId(job_id), "status": "running", "worker_id": worker_id()},
+                    {"$set": {"heartbeat_at": datetime.now(UTC)}},
+                )
+            except Exception as e:
+                logger.warning(f"Heartbeat of job {job_id} failed: {e}")
+
+    async def _finish(self, job_id: str, status: str, result: dict | None = None, error: str | None = None):
+        timestamp = get_current_timestamp()
+        update = await jobs_collection.update_one(
+            {"_id": ObjectId(job_id), "status": "running", "worker_id": worker_id()},
+            {
+                "$set": {
+                    "status": status,
+                    "result": result,
+                    "error": error,
+                    "heartbeat_at": None,
+                    "finished_at": timestamp,
+                    "updated_at": timestamp,
+                    "expire_at": datetime.now(UTC) + timedelta(days=JOBS.RETENTION_DAYS),
+                }
+            },
+        )
+        if update.matched_count == 0:
+            # Our heartbeat went stale and the job was requeued; the newer run owns the outcome
+            logger.warning(f"Job {job_id} was taken over by another worker; dropping its {status} result")
+            return
+        CHAT_JOBS.labels(result=status).inc()
+        self.notify(job_id)
+
+    async def _requeue(self, job_id: str):
+        try:
+            await jobs_collection.update_one(
+                {"_id": ObjectId(job_id), "status": "running", "worker_id": worker_id()},
+                {
+                    "$set": {"status": "queued", "worker_id": None, "heartbeat_at": None, "updated_at": get_current_timestamp()},
+                    "$inc": {"attempts": -1},  # An orderly handback is not a failed attempt
+                },
+            )
+            CHAT_JOBS.labels(result="requeued").inc()
+            self.notify(job_id)
+        except Exception as e:
+            logger.error(f"Could not requeue job {job_id}; recovery will pick it up: {e}")
+
+    async def recover(self):
+        """Requeue (or fail) jobs whose worker stopped heartbeating, then claim queued jobs up to the free slots."""
+        timestamp = get_current_timestamp()
+        stale = {"status": "running", "heartbeat_at": {"$lt": datetime.now(UTC) - timedelta(seconds=JOBS.STALE_AFTER)}}
+
+        failed = await jobs_collection.update_many(
+            {**stale, "attempts": {"$gte": JOBS.MAX_ATTEMPTS}},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "Job was lost with its worker too many times",
+                    "heartbeat_at": None,
+                    "finished_at": timestamp,
+                    "updated_at": timestamp,
+                    "expire_at": datetime.now(UTC) + timedelta(days=JOBS.RETENTION_DAYS),
+                }
+            },
+        )
+        requeued = await jobs_collection.update_many(
+            stale, {"$set": {"status": "queued", "worker_id": None, "heartbeat_at": None, "updated_at": timestamp}}
+        )
+        if failed.modified_count:
+            CHAT_JOBS.labels(result="failed").inc(failed.modified_count)
+        if requeued.modified_count:
+            CHAT_JOBS.labels(result="recovered").inc(requeued.modified_count)
+            logger.warning(f"Requeued {requeued.modified_count} job(s) from lost workers")
+
+        for kind, limit in KIND_CONCURRENCY.items():
+            free = limit - self._scheduled[kind]
+            if free <= 0:
+                continue
+            cursor = jobs_collection.find({"status": "queued", "kind": kind}, {"_id": 1}).sort("created_at", 1).limit(free)
+            async for job in cursor:
+                self.schedule(str(job["_id"]), kind)
+
+    async def _sweep(self):
+        while True:
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.warning(f"Job recovery sweep failed: {e}")
+            await asyncio.sleep(JOBS.RECOVERY_INTERVAL)
+
+    def start(self):
+        """Start the recovery sweep; its first pass picks up jobs left behind by a restart."""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep(), name="job-recovery")
+
+    async def stop(self, timeout: float):
+        """Give running jobs up to `timeout` seconds, then hand the rest back to the queue."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+        tasks = list(self._running.values())
+        if not tasks:
+            return
+        logger.info(f"Waiting for {len(tasks)} job(s) to finish")
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def notify(self, job_id: str):
+        for event in self._changed.get(job_id, ()):
+            event.set()
+
+    async def wait_for_change(self, job_id: str, timeout: float):
+        """Wait until this worker changes the job, or `timeout` passes (the job may run in another worker)."""
+        event = asyncio.Event()
+        self._changed.setdefault(job_id, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Nothing local may ever notify a job running elsewhere, so the entry goes with its last subscriber
+            subscribers = self._changed.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(event)
+                if not subscribers:
+                    del self._changed[job_id]
+
+
+job_runner = JobRunner()
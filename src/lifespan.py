@@ -2,11 +2,39 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import logging
 
+from src.background import drain
+from src.database import ensure_indexes
+from src.jobs import job_runner
+from src.pipelines.page_fetcher import close_fetcher
+from src.config import settings
+from src.tracing import shutdown_tracing
+from src.warmup import warm_up
+
 logger = logging.getLogger(__name__)
 
+BACKGROUND_DRAIN_TIMEOUT = settings.FastAPI.BACKGROUND_DRAIN_TIMEOUT
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Readiness stays false until warm-up is done, so cold workers are not put into rotation
+    app.state.ready = False
     try:
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            # Don't block startup on index creation; the app works without them, only slower
+            logger.warning(f"Could not ensure MongoDB indexes: {e}")
+
+        app.state.warmup_timings = await warm_up()
+        app.state.ready = True
+        # Recovery sweep: picks up queued jobs and jobs lost with a previous worker
+        job_runner.start()
         yield
     finally:
-        pass
+        app.state.ready = False
+        # Running jobs get the drain timeout too; unfinished ones go back to the queue for another worker
+        await job_runner.stop(timeout=BACKGROUND_DRAIN_TIMEOUT)
+        # Let detached work (e.g. persisting streams whose client went away) finish before exit
+        await drain(timeout=BACKGROUND_DRAIN_TIMEOUT)
+        await close_fetcher()
+        shutdown_tracing()  # Flush spans still queued for export
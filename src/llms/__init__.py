@@ -1,15 +1,32 @@
-from .ollama import OllamaProvider
-from .vllm import VLLMProvider
-from .aws_bedrock import AWSBedrockProvider
-from .groq import GroqProvider
-from .nvidia import NVIDIAProvider
-from .google import GoogleProvider
-from .huggingface import HuggingFaceProvider
-from .llamacpp import LlamaCppProvider
+import importlib
+
 from .llm_factory import LLMFactory
 from .base import BaseLLMProvider
 from .llm_parser import parse_response
 
+# Provider classes are resolved lazily (PEP 562) so importing src.llms does not pull in every SDK
+_lazy_exports = {
+    "OllamaProvider": ".ollama",
+    "VLLMProvider": ".vllm",
+    "AWSBedrockProvider": ".aws_bedrock",
+    "GroqProvider": ".groq",
+    "NVIDIAProvider": ".nvidia",
+    "GoogleProvider": ".google",
+    "HuggingFaceProvider": ".huggingface",
+    "LlamaCppProvider": ".llamacpp",
+    "FakeProvider": ".fake",
+    "FakeChatModel": ".fake",
+}
+
+
+def __getattr__(name):
+    if name in _lazy_exports:
+        value = getattr(importlib.import_module(_lazy_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "OllamaProvider",
     "VLLMProvider",
@@ -19,6 +36,8 @@ __all__ = [
     "GoogleProvider",
     "HuggingFaceProvider",
     "LlamaCppProvider",
+    "FakeProvider",
+    "FakeChatModel",
     "LLMFactory",
     "BaseLLMProvider",
     "parse_response"
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from .base import BaseLLMProvider
+from .llm_parser import estimate_message_tokens
+
+# Vocabulary for synthetic answers; one word is treated as one token
+WORDS = (
+    "the model answers questions about data systems latency streaming tokens users history search "
+    "results context summary request response server worker queue cache index memory compute network"
+).split()
+
+
+class FakeLLMError(RuntimeError):
+    """Raised by FakeChatModel when error injection fires."""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for a real chat model, for benchmarks and tests without a network.
+
+    Timing follows a simple model: wait `ttft` seconds, then emit one token every
+    `inter_token_latency` seconds (or 1 / `tokens_per_second`). Answers are synthetic text whose
+    length is drawn from a clipped normal distribution, or recorded answers served from a JSONL
+    replay file. Streaming is native, so astream_events behaves like a real streaming model.
+    """
+
+    model_name: str = "fake"
+    ttft: float = 0.2
+    tokens_per_second: float = 50.0
+    inter_token_latency: Optional[float] = None
+    response_tokens_mean: int = 120
+    response_tokens_stddev: int = 40
+    response_tokens_min: int = 1
+    response_tokens_max: int = 1024
+    usage: bool = True
+    error_rate: float = 0.0
+    error_mid_stream: bool = False
+    seed: Optional[int] = 42
+    replay_file: Optional[str] = None
+
+    _rng: random.Random = PrivateAttr()
+    _replay_by_prompt: dict = PrivateAttr(default_factory=dict)
+    _replay_records: list = PrivateAttr(default_factory=list)
+    _replay_index: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+        if self.replay_file:
+            self._load_replay(self.replay_file)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "ttft": self.ttft, "tokens_per_second": self.tokens_per_second}
+
+    # ---------------- REPLAY ----------------
+    @staticmethod
+    def prompt_key(messages: list[BaseMessage]) -> str:
+        """Recorded responses are matched on a hash of the last message's content."""
+        content = messages[-1].content if messages else ""
+        return hashlib.sha256(str(content).encode("utf-8")).hexdigest()
+
+    def _load_replay(self, path: str):
+        # One JSON object per line: {"prompt": "...", "response": "...", "usage": {"input_tokens": .., "output_tokens": ..}}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._replay_records.append(record)
+                if "prompt" in record:
+                    key = hashlib.sha256(record["prompt"].encode("utf-8")).hexdigest()
+                    self._replay_by_prompt[key] = record
+
+    def _next_replay(self, messages: list[BaseMessage]) -> dict:
+        record = self._replay_by_prompt.get(self.prompt_key(messages))
+        if record is None:
+            # Unknown prompt: cycle through the recording so capacity tests still get realistic lengths
+            record = self._replay_records[self._replay_index % len(self._replay_records)]
+            self._replay_index += 1
+        return record
+
+    # ---------------- RESPONSE PLANNING ----------------
+    def _token_delay(self) -> float:
+        if self.inter_token_latency is not None:
+            return self.inter_token_latency
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _plan(self, messages: list[BaseMessage]) -> tuple[list[str], dict, bool]:
+        """Decide the tokens to emit, their usage metadata, and whether to fail this call."""
+        fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+
+        if self._replay_records:
+            record = self._next_replay(messages)
+            text = record.get("response", "")
+            # Keep the whitespace with each word so joined chunks reproduce the recording exactly
+            tokens = [word + " " for word in text.split(" ")]
+            tokens[-1] = tokens[-1][:-1]
+            recorded_usage = record.get("usage") or {}
+        else:
+            count = round(self._rng.gauss(self.response_tokens_mean, self.response_tokens_stddev))
+            count = max(self.response_tokens_min, min(self.response_tokens_max, count))
+            tokens = [self._rng.choice(WORDS) + (" " if i < count - 1 else "") for i in range(count)]
+            recorded_usage = {}
+
+        input_tokens = recorded_usage.get("input_tokens", estimate_message_tokens(messages))
+        output_tokens = recorded_usage.get("output_tokens", len(tokens))
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return tokens, usage, fail
+
+    def _fail_at(self, tokens: list[str], fail: bool) -> Optional[int]:
+        if not fail:
+            return None
+        return len(tokens) // 2 if self.error_mid_stream else 0
+
+    def _final_message(self, tokens: list[str], usage: dict) -> AIMessage:
+        return AIMessage(
+            content="".join(tokens),
+            usage_metadata=usage if self.usage else None,
+            response_metadata={"model_name": self.model_name},
+        )
+
+    # ---------------- SYNC ----------------
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens, usage, fail = self._plan(messages)
+        time.sleep(self.ttft)
+        if fail:
+            raise FakeLLMError("Injected fake LLM failure")
+        time.sleep(self._token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._final_message(tokens, usage))])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        tokens, usage, fail = self._plan(messages)
+        fail_at = self._fail_at(tokens, fail)
+        time.sleep(self.ttft)
+        for index, token in enumerate(tokens):
+            if index == fail_at:
+                raise FakeLLMError("Injected fake LLM failure")
+            if index:
+                time.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield self._usage_chunk(usage)
+
+    # ---------------- ASYNC ----------------
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens, usage, fail = self._plan(messages)
+        await asyncio.sleep(self.ttft)
+        if fail:
+            raise FakeLLMError("Injected fake LLM failure")
+        await asyncio.sleep(self._token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._final_message(tokens, usage))])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tokens, usage, fail = self._plan(messages)
+        fail_at = self._fail_at(tokens, fail)
+        await asyncio.sleep(self.ttft)
+        for index, token in enumerate(tokens):
+            if index == fail_at:
+                raise FakeLLMError("Injected fake LLM failure")
+            if index:
+                await asyncio.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield self._usage_chunk(usage)
+
+    def _usage_chunk(self, usage: dict) -> ChatGenerationChunk:
+        # Real providers report usage on the final (empty) chunk of a stream
+        return ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=usage if self.usage else None, chunk_position="last")
+        )
+
+
+class FakeProvider(BaseLLMProvider):
+    def create_model(self, config: dict, **kwargs):
+        return FakeChatModel(
+            model_name=config.get("MODEL", "fake"),
+            ttft=config.get("TTFT", 0.2),
+            tokens_per_second=config.get("TOKENS_PER_SECOND", 50.0),
+            inter_token_latency=config.get("INTER_TOKEN_LATENCY"),
+            response_tokens_mean=config.get("RESPONSE_TOKENS_MEAN", 120),
+            response_tokens_stddev=config.get("RESPONSE_TOKENS_STDDEV", 40),
+            response_tokens_min=config.get("RESPONSE_TOKENS_MIN", 1),
+            response_tokens_max=config.get("RESPONSE_TOKENS_MAX", 1024),
+            usage=config.get("USAGE", True),
+            error_rate=config.get("ERROR_RATE", 0.0),
+            error_mid_stream=config.get("ERROR_MID_STREAM", False),
+            seed=config.get("SEED", 42),
+            replay_file=config.get("REPLAY_FILE"),
+        )
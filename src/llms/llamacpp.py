@@ -1,18 +1,20 @@
-import multiprocessing
-from langchain_community.chat_models import ChatLlamaCpp
 from .base import BaseLLMProvider
+from .llamacpp_sidecar import ChatLlamaCppSidecar, sidecar_config, sidecar_enabled, socket_path
+from .llamacpp_worker import ChatLlamaCppWorker, build_worker
 
 class LlamaCppProvider(BaseLLMProvider):
     def create_model(self, config: dict, **kwargs):
-        return ChatLlamaCpp(
-            model_path=config["MODEL"],
-            temperature=config["TEMPERATURE"],
-            n_ctx=config["N_CTX"],
-            n_gpu_layers=config["N_GPU_LAYERS"],
-            n_batch=config["N_BATCH"],
-            max_tokens=config["MAX_TOKENS"],
-            n_threads=multiprocessing.cpu_count() - 1,
-            repeat_penalty=config["REPEAT_PENALTY"],
-            top_p=config["TOP_P"],
-            verbose=config["VERBOSE"],
-        )
+        if sidecar_enabled(config):
+            # The model lives in the shared sidecar process started by main_prod
+            return ChatLlamaCppSidecar(
+                socket_path=socket_path(config),
+                model_name=config["MODEL"],
+                max_tokens=config["MAX_TOKENS"],
+                temperature=config["TEMPERATURE"],
+                top_p=config["TOP_P"],
+                repeat_penalty=config["REPEAT_PENALTY"],
+                timeout=sidecar_config(config).get("REQUEST_TIMEOUT", 240),
+            )
+
+        # In-process: a dedicated generation worker keeps llama.cpp off the event loop
+        return ChatLlamaCppWorker(worker=build_worker(config), model_name=config["MODEL"])
@@ -0,0 +1,182 @@
+"""
+Conversation-scoped KV-state cache for llama.cpp.
+
+Every chat turn re-sends the full history, and llama.cpp would otherwise re-evaluate the whole
+prompt. PrefixStateCache plugs into llama-cpp-python's cache hook (Llama.set_cache). After a
+generation, Llama saves its state under prompt + completion tokens. On the next request, it asks
+the cache for the state with the longest matching token prefix, loads it, and evaluates only the
+tokens after that prefix.
+
+States are scoped to the conversation the request belongs to (ChatLlamaCppWorker takes it from
+the run metadata). Each conversation keeps only its latest state, and the cache is a bounded LRU
+by entry count and by bytes.
+
+Reported: lookups, prompt tokens reused, and the prefill time saved. The saving is estimated
+from the measured per-token prefill time of the same model. Llama only loads a cached state when
+its prefix is longer than what the slot's context has already evaluated, so a lookup is a "hit"
+only then; a match the context already holds is "resident" and credits nothing.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from src.metrics import (
+    LLAMACPP_PREFILL_SECONDS_SAVED,
+    LLAMACPP_PREFILL_TOKENS_REUSED,
+    LLAMACPP_PREFIX_CACHE_BYTES,
+    LLAMACPP_PREFIX_CACHE_LOOKUPS,
+)
+
+# Smoothing for the per-token prefill time estimate
+PREFILL_RATE_ALPHA = 0.2
+
+
+def longest_token_prefix(a: Sequence[int], b: Sequence[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+@dataclass
+class CacheEntry:
+    conversation_id: str
+    tokens: tuple[int, ...]
+    state: Any  # llama_cpp.LlamaState
+    size: int
+
+
+class PrefixStateCache:
+    """Bounded LRU of llama.cpp states, keyed by conversation and token prefix."""
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 2 * 1024**3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple[str, tuple[int, ...]], CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Each slot thread serves one request at a time; its conversation and lookup live here
+        self._request = threading.local()
+        self.cache_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.resident = 0
+        self.tokens_reused = 0
+        self.prefill_seconds_saved = 0.0
+        self.prefill_seconds_per_token: Optional[float] = None
+
+    # ---------------- REQUEST SCOPE (called by the generation worker) ----------------
+    def begin(self, conversation_id: Optional[str], llm: Any = None):
+        """`llm` is the slot's Llama, whose evaluated tokens decide whether a cached state gets loaded."""
+        self._request.conversation_id = conversation_id
+        self._request.llm = llm
+        self._request.reused = 0
+        self._request.resident = 0
+
+    def finish(self, prefill_seconds: Optional[float], prompt_tokens: int):
+        """
+        End the request scope. With a measured prefill (None when generation failed), also update the
+        prefill-time estimate and credit the saving for this request's reused prefix.
+        """
+        reused = min(getattr(self._request, "reused", 0), prompt_tokens)
+        evaluated = prompt_tokens - max(reused, min(getattr(self._request, "resident", 0), prompt_tokens))
+        with self._lock:
+            if prefill_seconds and evaluated > 0:
+                rate = prefill_seconds / evaluated
+                previous = self.prefill_seconds_per_token
+                self.prefill_seconds_per_token = (
+                    rate if previous is None else previous + PREFILL_RATE_ALPHA * (rate - previous)
+                )
+            if prefill_seconds is not None and reused and self.prefill_seconds_per_token is not None:
+                saved = reused * self.prefill_seconds_per_token
+                self.prefill_seconds_saved += saved
+                LLAMACPP_PREFILL_SECONDS_SAVED.inc(saved)
+        self._request.conversation_id = None
+        self._request.llm = None
+        self._request.reused = 0
+        self._request.resident = 0
+
+    # ---------------- llama-cpp-python cache protocol ----------------
+    def __getitem__(self, key: Sequence[int]):
+        conversation_id = getattr(self._request, "conversation_id", None)
+        tokens = tuple(key)
+        # The prefix the slot's context already holds; Llama skips it with or without the cache
+        llm = getattr(self._request, "llm", None)
+        resident = longest_token_prefix(getattr(llm, "input_ids", ()), tokens) if llm is not None else 0
+        self._request.resident = resident
+        best, best_length = None, 0
+        with self._lock:
+            if conversation_id is not None:
+                for entry_key, entry in self._entries.items():
+                    if entry.conversation_id != conversation_id:
+                        continue
+                    length = longest_token_prefix(entry.tokens, tokens)
+                    if length > best_length:
+                        best, best_length = entry_key, length
+
+            if best is None:
+                self.misses += 1
+                LLAMACPP_PREFIX_CACHE_LOOKUPS.labels(result="miss").inc()
+                raise KeyError("No cached state for this conversation")
+
+            self._entries.move_to_end(best)
+            if best_length <= resident:
+                # Llama will not load it: the context is already at least this far along
+                self.resident += 1
+                LLAMACPP_PREFIX_CACHE_LOOKUPS.labels(result="resident").inc()
+                return self._entries[best].state
+
+            self.hits += 1
+            self.tokens_reused += best_length
+            LLAMACPP_PREFIX_CACHE_LOOKUPS.labels(result="hit").inc()
+            LLAMACPP_PREFILL_TOKENS_REUSED.inc(best_length)
+            self._request.reused = best_length
+            return self._entries[best].state
+
+    def __contains__(self, key: Sequence[int]) -> bool:
+        conversation_id = getattr(self._request, "conversation_id", None)
+        tokens = tuple(key)
+        with self._lock:
+            return any(
+                entry.conversation_id == conversation_id and longest_token_prefix(entry.tokens, tokens) > 0
+                for entry in self._entries.values()
+            )
+
+    def __setitem__(self, key: Sequence[int], state: Any):
+        conversation_id = getattr(self._request, "conversation_id", None)
+        if conversation_id is None:
+            return  # Nothing to key it on (e.g. the first turn, before the conversation exists)
+
+        entry = CacheEntry(conversation_id, tuple(key), state, int(getattr(state, "llama_state_size", 0)))
+        with self._lock:
+            # The newest state of a conversation supersedes its older ones
+            for stale_key in [k for k, e in self._entries.items() if e.conversation_id == conversation_id]:
+                self.cache_size -= self._entries.pop(stale_key).size
+            self._entries[(conversation_id, entry.tokens)] = entry
+            self.cache_size += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self.cache_size > self.max_bytes):
+                self.cache_size -= self._entries.popitem(last=False)[1].size
+            LLAMACPP_PREFIX_CACHE_BYTES.set(self.cache_size)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        # Llama checks `if self.cache:`; an empty cache must still be consulted and filled
+        return True
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "resident": self.resident,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "tokens_reused": self.tokens_reused,
+            "prefill_seconds_saved": round(self.prefill_seconds_saved, 3),
+        }
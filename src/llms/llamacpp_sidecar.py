@@ -0,0 +1,302 @@
+"""
+Shared llama.cpp inference sidecar.
+
+With LLM.llamacpp.SIDECAR.ENABLED, main_prod starts one sidecar process that loads the GGUF model
+and serves every gunicorn worker over a Unix domain socket, so the weights are loaded once and the
+CPU threads are not oversubscribed by several workers. Workers talk to it through
+ChatLlamaCppSidecar, a regular LangChain chat model, so the pipeline does not know the difference.
+Inside the sidecar, requests from all workers share one GenerationWorker queue.
+
+Protocol: one JSON object per line. A client sends a single request line and reads response lines
+until an "end" or "error" line:
+    -> {"type": "generate", "messages": [{"role": "user", "content": "..."}], "params": {...},
+        "conversation_id": "..."}
+    <- {"type": "token", "content": "..."}                       (repeated)
+    <- {"type": "end", "usage": {"input_tokens": n, "output_tokens": m}}
+    -> {"type": "ping"}
+    <- {"type": "pong"}
+Closing the connection cancels the generation, whether it is running or still queued.
+
+Run directly with: python -m src.llms.llamacpp_sidecar
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from .llamacpp_worker import GenerationError, GenerationWorker, build_worker, event_to_chunk, to_chat_messages
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_SOCKET_PATH = "run/llamacpp.sock"  # Relative paths are resolved against ROOT_DIR, like config.yml
+PARENT_CHECK_INTERVAL = 2.0  # seconds between checks that the managing process is still alive
+
+
+def sidecar_config(config: dict) -> dict:
+    return config.get("SIDECAR") or {}
+
+
+def sidecar_enabled(config: dict) -> bool:
+    return bool(sidecar_config(config).get("ENABLED"))
+
+
+def socket_path(config: dict) -> str:
+    # Not the working directory: main_prod, the sidecar and every worker must agree on one socket
+    return str(ROOT_DIR / sidecar_config(config).get("SOCKET_PATH", DEFAULT_SOCKET_PATH))
+
+
+def encode(payload: dict) -> bytes:
+    return (json.dumps(payload) + "\n").encode("utf-8")
+
+
+# ---------------- SERVER ----------------
+class SidecarServer:
+    """Serves one GenerationWorker (and so one set of loaded weights) to every connected worker."""
+
+    def __init__(self, worker: GenerationWorker):
+        self.worker = worker
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            request = json.loads(line)
+
+            if request.get("type") == "ping":
+                writer.write(encode({"type": "pong"}))
+                await writer.drain()
+                return
+
+            # The client sends nothing after its request line, so the read below only returns at EOF:
+            # the worker went away. Noticing it here rather than on the next write cancels the
+            # generation while it is still queued, not only once it runs and produces a token.
+            relay = asyncio.create_task(self.relay(request, writer))
+            disconnected = asyncio.create_task(reader.read())
+            try:
+                await asyncio.wait({relay, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                disconnected.cancel()
+                if not relay.done():
+                    relay.cancel()  # Leaving the stream cancels the generation
+                    await asyncio.gather(relay, return_exceptions=True)
+            if disconnected.done() and not disconnected.cancelled():
+                disconnected.exception()  # A reset connection is a disconnect too
+            if not relay.cancelled():
+                relay.result()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The worker went away (client disconnect, cancelled stream)
+        except Exception as e:
+            logger.error(f"Sidecar request failed: {e}", exc_info=True)
+            try:
+                writer.write(encode({"type": "error", "message": str(e)}))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def relay(self, request: dict, writer: asyncio.StreamWriter):
+        async for event in self.worker.stream(
+            request["messages"], request.get("params") or {}, request.get("conversation_id")
+        ):
+            writer.write(encode(event))
+            await writer.drain()
+
+    async def serve(self, path: str, parent_pid: Optional[int] = None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)  # Stale socket from a previous run
+
+        server = await asyncio.start_unix_server(self.handle, path=path)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        logger.info(f"llama.cpp sidecar listening on {path}")
+        async with server:
+            while not stop.is_set():
+                # Exit with the managing process even if it could not terminate us
+                if parent_pid and os.getppid() != parent_pid:
+                    logger.warning("llama.cpp sidecar parent exited; shutting down")
+                    break
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=PARENT_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_sidecar():
+    from src.config import settings
+    from src.logger import setup_logging
+
+    setup_logging()
+    config = settings.LLM.provider_config("llamacpp")
+    parent_pid = int(os.environ["AICHATAPP_SIDECAR_PARENT"]) if os.environ.get("AICHATAPP_SIDECAR_PARENT") else None
+    server = SidecarServer(build_worker(config))
+    asyncio.run(server.serve(socket_path(config), parent_pid=parent_pid))
+
+
+# ---------------- PROCESS MANAGEMENT ----------------
+def ping(path: str, timeout: float = 1.0) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(encode({"type": "ping"}))
+            return json.loads(sock.makefile("rb").readline()).get("type") == "pong"
+    except (OSError, ValueError):
+        return False
+
+
+def start_sidecar(config: dict) -> subprocess.Popen:
+    """Start the sidecar and block until it answers on its socket (the model is loaded)."""
+    path = socket_path(config)
+    timeout = sidecar_config(config).get("STARTUP_TIMEOUT", 300)
+    env = {**os.environ, "AICHATAPP_SIDECAR_PARENT": str(os.getpid())}
+    process = subprocess.Popen([sys.executable, "-m", "src.llms.llamacpp_sidecar"], env=env)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"llama.cpp sidecar exited during startup with code {process.returncode}")
+        if ping(path):
+            logger.info(f"llama.cpp sidecar ready (pid {process.pid})")
+            return process
+        time.sleep(0.2)
+
+    stop_sidecar(process)
+    raise RuntimeError(f"llama.cpp sidecar did not become ready within {timeout}s")
+
+
+def stop_sidecar(process: subprocess.Popen, timeout: float = 10.0):
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# ---------------- CLIENT ----------------
+class ChatLlamaCppSidecar(BaseChatModel):
+    """Chat model that streams generations from the shared llama.cpp sidecar."""
+
+    socket_path: str
+    model_name: str = "llamacpp"
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    repeat_penalty: Optional[float] = None
+    timeout: float = 240.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "llamacpp-sidecar"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "socket_path": self.socket_path}
+
+    def _request(self, messages: list[BaseMessage], stop: Optional[list[str]], run_manager=None, **kwargs: Any) -> bytes:
+        params = {
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "repeat_penalty": self.repeat_penalty,
+            "stop": stop,
+        }
+        params.update({key: kwargs[key] for key in params if key in kwargs})
+        return encode({
+            "type": "generate",
+            "messages": to_chat_messages(messages),
+            "params": params,
+            # Scopes llama.cpp KV-state reuse in the sidecar; set by the chat router through run metadata
+            "conversation_id": (getattr(run_manager, "metadata", None) or {}).get("conversation_id"),
+        })
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(self._request(messages, stop, run_manager, **kwargs))
+            for line in sock.makefile("rb"):
+                chunk = event_to_chunk(json.loads(line))
+                if run_manager and chunk.text:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                if chunk.message.chunk_position == "last":
+                    return
+        raise GenerationError("llama.cpp sidecar closed the connection mid-generation")
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            writer.write(self._request(messages, stop, run_manager, **kwargs))
+            await writer.drain()
+            while line := await asyncio.wait_for(reader.readline(), timeout=self.timeout):
+                chunk = event_to_chunk(json.loads(line))
+                if run_manager and chunk.text:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                if chunk.message.chunk_position == "last":
+                    return
+            raise GenerationError("llama.cpp sidecar closed the connection mid-generation")
+        finally:
+            # Closing early (client disconnect, cancellation) tells the sidecar to stop generating
+            writer.close()
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+
+if __name__ == "__main__":
+    run_sidecar()
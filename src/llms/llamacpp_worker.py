@@ -0,0 +1,366 @@
+"""
+Non-blocking llama.cpp generation worker.
+
+llama_cpp.Llama is synchronous and not thread-safe. Instead of letting LangChain's async
+fallback push calls into the default executor (where concurrent requests contend on one model
+with unbounded queueing), requests go through an explicit, bounded asyncio queue served by a
+fixed set of slots. Each slot owns one llama.cpp context and one thread; tokens are handed back
+to the event loop as they are produced.
+
+Batching: llama-cpp-python's high-level API decodes a single sequence per context, so
+concurrent prompts are batched across PARALLEL slots. Each slot is its own Llama instance. Layers
+kept on the CPU are memory-mapped from the same GGUF file, so they are shared in RAM; layers
+offloaded to the GPU (N_GPU_LAYERS) are uploaded by every slot, so VRAM use grows with PARALLEL,
+as does the KV cache. CPU threads are split evenly between slots.
+
+With PREFIX_CACHE enabled, all slots share a PrefixStateCache (see llamacpp_cache.py) so a
+follow-up turn only evaluates the tokens after the conversation's cached prefix.
+
+Events, as dicts (also the sidecar wire format):
+    {"type": "token", "content": "..."}
+    {"type": "end", "usage": {"input_tokens": n, "output_tokens": m}}
+    {"type": "error", "message": "..."}
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from .llamacpp_cache import PrefixStateCache
+from src.metrics import (
+    LLAMACPP_PHASE_DURATION,
+    LLAMACPP_QUEUE_DEPTH,
+    LLAMACPP_QUEUE_WAIT,
+    LLAMACPP_REJECTED,
+    LLAMACPP_SLOTS_BUSY,
+    LLAMACPP_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+# LangChain message type -> chat-completion role
+ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+
+
+class WorkerBusyError(RuntimeError):
+    """Raised when the generation queue is full."""
+
+
+class GenerationError(RuntimeError):
+    """Raised on the client side when a generation reports an error event."""
+
+
+def default_threads(config: dict) -> int:
+    return config.get("N_THREADS") or max(1, multiprocessing.cpu_count() - 1)
+
+
+def to_chat_messages(messages: list[BaseMessage]) -> list[dict]:
+    return [{"role": ROLES.get(message.type, "user"), "content": str(message.content)} for message in messages]
+
+
+def event_to_chunk(event: dict) -> ChatGenerationChunk:
+    """Convert a worker event into a LangChain chunk; the end event carries usage like real providers."""
+    if event["type"] == "token":
+        return ChatGenerationChunk(message=AIMessageChunk(content=event["content"]))
+    if event["type"] == "end":
+        usage = event.get("usage") or {}
+        usage_metadata = {
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "total_tokens": usage.get("input_tokens", 0) + usage.get("output_tokens", 0),
+        }
+        return ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=usage_metadata, chunk_position="last")
+        )
+    raise GenerationError(event.get("message", "llama.cpp generation failed"))
+
+
+@dataclass
+class GenerationRequest:
+    messages: list[dict]
+    options: dict
+    emit: Callable[[dict], None]
+    conversation_id: Optional[str] = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class Slot:
+    index: int
+    llm: Any
+    executor: ThreadPoolExecutor
+
+
+class GenerationWorker:
+    """Serves generation requests from a bounded queue on PARALLEL llama.cpp slots."""
+
+    def __init__(self, model_factory: Callable[[int], Any], config: dict):
+        """`model_factory(n_threads)` builds one llama.cpp context; it is called once per slot."""
+        parallel = max(1, config.get("PARALLEL") or 1)
+        threads_per_slot = max(1, (config.get("N_THREADS") or 1) // parallel)
+        self.defaults = {
+            "max_tokens": config.get("MAX_TOKENS"),
+            "temperature": config.get("TEMPERATURE"),
+            "top_p": config.get("TOP_P"),
+            "repeat_penalty": config.get("REPEAT_PENALTY"),
+        }
+        self.max_queue = config.get("MAX_QUEUE") or 0
+        self.slots = [
+            Slot(index, model_factory(threads_per_slot), ThreadPoolExecutor(1, thread_name_prefix=f"llamacpp-{index}"))
+            for index in range(parallel)
+        ]
+
+        cache_config = config.get("PREFIX_CACHE") or {}
+        self.prefix_cache: Optional[PrefixStateCache] = None
+        if cache_config.get("ENABLED"):
+            self.prefix_cache = PrefixStateCache(
+                max_entries=cache_config.get("MAX_ENTRIES", 64),
+                max_bytes=cache_config.get("MAX_BYTES", 2 * 1024**3),
+            )
+            for slot in self.slots:
+                slot.llm.set_cache(self.prefix_cache)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+
+    # ---------------- GENERATION (slot thread) ----------------
+    def _options(self, params: dict) -> dict:
+        # Parameters the caller left unset fall back to the configured defaults
+        options = {key: value for key, value in self.defaults.items() if value is not None}
+        options.update({key: value for key, value in params.items() if value is not None})
+        return options
+
+    def _generate(self, slot: Slot, request: GenerationRequest) -> dict:
+        start_time = time.perf_counter()
+        first_token_at = None
+        output_tokens = 0
+        prefill_seconds = None
+        input_tokens = 0
+        if self.prefix_cache is not None:
+            self.prefix_cache.begin(request.conversation_id, slot.llm)
+
+        try:
+            stream = slot.llm.create_chat_completion(messages=request.messages, stream=True, **request.options)
+            try:
+                for chunk in stream:
+                    if request.cancelled.is_set():
+                        break
+                    content = chunk["choices"][0].get("delta", {}).get("content")
+                    if content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        output_tokens += 1
+                        request.emit({"type": "token", "content": content})
+            finally:
+                stream.close()
+
+            end_time = time.perf_counter()
+            # Streamed chunks carry no usage; the context holds prompt + generated tokens
+            input_tokens = max(0, getattr(slot.llm, "n_tokens", 0) - output_tokens)
+            first_token_at = first_token_at or end_time
+            prefill_seconds = first_token_at - start_time
+        finally:
+            # Also when generation fails, so the request's cache scope does not carry over to the slot's next one
+            if self.prefix_cache is not None:
+                self.prefix_cache.finish(prefill_seconds, input_tokens)
+
+        LLAMACPP_PHASE_DURATION.labels(phase="prefill").observe(first_token_at - start_time)
+        LLAMACPP_PHASE_DURATION.labels(phase="decode").observe(end_time - first_token_at)
+        LLAMACPP_TOKENS.labels(kind="prompt").inc(input_tokens)
+        LLAMACPP_TOKENS.labels(kind="completion").inc(output_tokens)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens}
+
+    def generate_blocking(
+        self, messages: list[dict], params: dict, emit: Callable[[dict], None], conversation_id: Optional[str] = None
+    ) -> dict:
+        """Synchronous path for non-async callers; still serialized on the first slot's thread."""
+        request = GenerationRequest(messages, self._options(params), emit, conversation_id)
+        slot = self.slots[0]
+        return slot.executor.submit(self._generate, slot, request).result()
+
+    # ---------------- QUEUE (event loop) ----------------
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # First use, or a new event loop (e.g. tests): bind the queue and slot tasks to it
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [
+            loop.create_task(self._run_slot(slot, self._queue), name=f"llamacpp-slot-{slot.index}")
+            for slot in self.slots
+        ]
+
+    async def _run_slot(self, slot: Slot, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            request: GenerationRequest = await queue.get()
+            LLAMACPP_QUEUE_DEPTH.dec()
+            if request.cancelled.is_set():
+                continue  # The caller went away while queued
+
+            LLAMACPP_QUEUE_WAIT.observe(time.perf_counter() - request.enqueued_at)
+            LLAMACPP_SLOTS_BUSY.inc()
+            try:
+                usage = await loop.run_in_executor(slot.executor, self._generate, slot, request)
+                request.emit({"type": "end", "usage": usage})
+            except Exception as e:
+                logger.error(f"llama.cpp generation failed on slot {slot.index}: {e}", exc_info=True)
+                request.emit({"type": "error", "message": str(e)})
+            finally:
+                LLAMACPP_SLOTS_BUSY.dec()
+
+    async def stream(
+        self, messages: list[dict], params: Optional[dict] = None, conversation_id: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """Queue a generation and yield its events; leaving early cancels it."""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def emit(payload: dict):
+            loop.call_soon_threadsafe(events.put_nowait, payload)
+
+        request = GenerationRequest(messages, self._options(params or {}), emit, conversation_id)
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            LLAMACPP_REJECTED.inc()
+            raise WorkerBusyError(f"llama.cpp queue is full ({self.max_queue} requests waiting)")
+        LLAMACPP_QUEUE_DEPTH.inc()
+
+        try:
+            while True:
+                event = await events.get()
+                yield event
+                if event["type"] in ("end", "error"):
+                    return
+        finally:
+            request.cancelled.set()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "parallel": len(self.slots),
+            "queue_depth": self.queue_depth(),
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None,
+        }
+
+
+def llama_model_factory(config: dict) -> Callable[[int], Any]:
+    def build(n_threads: int):
+        from llama_cpp import Llama
+
+        return Llama(
+            model_path=config["MODEL"],
+            n_ctx=config["N_CTX"],
+            n_gpu_layers=config["N_GPU_LAYERS"],
+            n_batch=config["N_BATCH"],
+            n_threads=n_threads,
+            verbose=config["VERBOSE"],
+        )
+
+    return build
+
+
+def build_worker(config: dict) -> GenerationWorker:
+    """Load PARALLEL llama.cpp contexts for the configured GGUF model."""
+    if (config.get("PARALLEL") or 1) > 1 and config.get("N_GPU_LAYERS"):
+        logger.warning(
+            f"llama.cpp PARALLEL={config['PARALLEL']} with N_GPU_LAYERS={config['N_GPU_LAYERS']}: "
+            "every slot uploads its own copy of the offloaded layers to VRAM"
+        )
+    return GenerationWorker(llama_model_factory(config), {**config, "N_THREADS": default_threads(config)})
+
+
+class ChatLlamaCppWorker(BaseChatModel):
+    """In-process llama.cpp chat model backed by a GenerationWorker."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    worker: GenerationWorker
+    model_name: str = "llamacpp"
+
+    @property
+    def _llm_type(self) -> str:
+        return "llamacpp-worker"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "parallel": len(self.worker.slots)}
+
+    @staticmethod
+    def _params(stop: Optional[list[str]], kwargs: dict) -> dict:
+        params = {key: kwargs.get(key) for key in ("max_tokens", "temperature", "top_p", "repeat_penalty")}
+        params["stop"] = stop
+        return params
+
+    @staticmethod
+    def _conversation_id(run_manager) -> Optional[str]:
+        # Set by the chat router through the run config metadata
+        return (getattr(run_manager, "metadata", None) or {}).get("conversation_id")
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        events: list[dict] = []
+        usage = self.worker.generate_blocking(
+            to_chat_messages(messages), self._params(stop, kwargs), events.append, self._conversation_id(run_manager)
+        )
+        for event in [*events, {"type": "end", "usage": usage}]:
+            chunk = event_to_chunk(event)
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for event in self.worker.stream(
+            to_chat_messages(messages), self._params(stop, kwargs), self._conversation_id(run_manager)
+        ):
+            chunk = event_to_chunk(event)
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
@@ -1,29 +1,33 @@
-from .ollama import OllamaProvider
-from .vllm import VLLMProvider
-from .aws_bedrock import AWSBedrockProvider
-from .groq import GroqProvider
-from .nvidia import NVIDIAProvider
-from .google import GoogleProvider
-from .huggingface import HuggingFaceProvider
-from .llamacpp import LlamaCppProvider
+import importlib
+
+from .base import BaseLLMProvider
 
 class LLMFactory:
     """Factory class to create LLM provider instances."""
-    
+
+    # Provider name -> (module, class). Modules are imported on first use so a worker only pays
+    # for the SDK of the provider it actually runs.
     _providers = {
-        "ollama": OllamaProvider,
-        "vllm": VLLMProvider,
-        "aws_bedrock": AWSBedrockProvider,
-        "groq": GroqProvider,
-        "nvidia": NVIDIAProvider,
-        "google": GoogleProvider,
-        "huggingface": HuggingFaceProvider,
-        "llamacpp": LlamaCppProvider,
+        "ollama": (".ollama", "OllamaProvider"),
+        "vllm": (".vllm", "VLLMProvider"),
+        "aws_bedrock": (".aws_bedrock", "AWSBedrockProvider"),
+        "groq": (".groq", "GroqProvider"),
+        "nvidia": (".nvidia", "NVIDIAProvider"),
+        "google": (".google", "GoogleProvider"),
+        "huggingface": (".huggingface", "HuggingFaceProvider"),
+        "llamacpp": (".llamacpp", "LlamaCppProvider"),
+        "fake": (".fake", "FakeProvider"),
     }
 
     @classmethod
-    def get_provider(cls, provider_type: str):
-        provider_class = cls._providers.get(provider_type.lower())
-        if not provider_class:
+    def get_provider_class(cls, provider_type: str) -> type[BaseLLMProvider]:
+        entry = cls._providers.get(provider_type.lower())
+        if not entry:
             raise ValueError(f"Unsupported LLM provider: {provider_type}")
-        return provider_class()
+        module_name, class_name = entry
+        module = importlib.import_module(module_name, __package__)
+        return getattr(module, class_name)
+
+    @classmethod
+    def get_provider(cls, provider_type: str):
+        return cls.get_provider_class(provider_type)()
@@ -1,10 +1,8 @@
 from typing import Any, Optional, Dict
 from langchain_core.messages import AIMessage
-from src.utils import load_config
+from src.config import settings
 
-cfg = load_config()
-llm_cfg = cfg.get("LLM", {})
-default_inference_type = llm_cfg.get("Provider", "").lower()
+default_inference_type = settings.LLM.Provider.lower()
 
 
 def parse_response(llm_response: Any, inference_type: str = default_inference_type) -> AIMessage:
@@ -33,3 +31,87 @@ def parse_response(llm_response: Any, inference_type: str = default_inference_ty
         additional_kwargs={"reasoning_content": reasoning_content},
         response_metadata=metadata,
     )
+
+
+# Provider-specific (input, output) token key pairs, tried in order when usage_metadata is missing
+USAGE_KEY_PAIRS = [
+    ("input_tokens", "output_tokens"),                      # LangChain standard / Anthropic / Bedrock (snake case)
+    ("prompt_tokens", "completion_tokens"),                 # OpenAI, vLLM, Groq, NVIDIA, Hugging Face
+    ("inputTokens", "outputTokens"),                        # Bedrock Converse raw usage
+    ("prompt_eval_count", "eval_count"),                    # Ollama
+    ("prompt_token_count", "candidates_token_count"),       # Google GenAI
+]
+
+# Rough characters-per-token ratio for English text across common BPE tokenizers
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4  # Role and separator overhead added by chat templates
+
+
+def _get(source: Any, key: str) -> Any:
+    if isinstance(source, dict):
+        return source.get(key)
+    return getattr(source, key, None)
+
+
+def _usage_from(source: Any) -> Optional[Dict[str, int]]:
+    if not source:
+        return None
+    for input_key, output_key in USAGE_KEY_PAIRS:
+        input_tokens = _get(source, input_key)
+        output_tokens = _get(source, output_key)
+        if isinstance(input_tokens, int) or isinstance(output_tokens, int):
+            return {"input_tokens": input_tokens or 0, "output_tokens": output_tokens or 0}
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    if not isinstance(text, str) or not text:
+        return 0
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+def estimate_message_tokens(messages: Any) -> int:
+    if isinstance(messages, str):
+        return estimate_tokens(messages)
+    total = 0
+    for message in messages or []:
+        content = _get(message, "content")
+        total += estimate_tokens(content if isinstance(content, str) else str(content or "")) + TOKENS_PER_MESSAGE
+    return total
+
+
+def extract_usage(llm_response: Any, prompt_messages: Any = None) -> Dict[str, Any]:
+    """
+    Return {"input_tokens", "output_tokens", "estimated"} for any provider's response.
+
+    Looks at LangChain's standard usage_metadata first, then the provider-specific shapes found
+    in response_metadata (or the raw OpenAI usage object), and finally falls back to a local
+    character-based estimate of the prompt and completion.
+    """
+    candidates = [
+        _get(llm_response, "usage_metadata"),
+        _get(llm_response, "usage"),
+    ]
+    response_metadata = _get(llm_response, "response_metadata") or {}
+    candidates += [
+        response_metadata,
+        response_metadata.get("token_usage"),
+        response_metadata.get("usage"),
+        response_metadata.get("usage_metadata"),
+    ]
+
+    for candidate in candidates:
+        usage = _usage_from(candidate)
+        if usage and (usage["input_tokens"] or usage["output_tokens"]):
+            return {**usage, "estimated": False}
+
+    content = _get(llm_response, "content")
+    if isinstance(content, list):
+        # Content blocks, e.g. Bedrock reasoning + text
+        content = "".join(_get(block, "text") or "" for block in content if not isinstance(block, str))
+
+    return {
+        "input_tokens": estimate_message_tokens(prompt_messages),
+        "output_tokens": estimate_tokens(content),
+        "estimated": True,
+    }
@@ -1,17 +1,33 @@
-import os, sys, logging
-from logging.handlers import RotatingFileHandler
-from src.utils import cfg
+import atexit, copy, json, os, queue, sys, logging, time, uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from src.config import settings
 
 # Configuration extraction
-LOG_DIR = cfg["Logging"]["LOG_DIR"]
-DEBUG_LOG_FILE_NAME = cfg["Logging"]["DEBUG_LOG_FILE_NAME"]
-INFO_LOG_FILE_NAME = cfg["Logging"]["INFO_LOG_FILE_NAME"]
-WARNING_LOG_FILE_NAME = cfg["Logging"]["WARNING_LOG_FILE_NAME"]
-ERROR_LOG_FILE_NAME = cfg["Logging"]["ERROR_LOG_FILE_NAME"]
-MAX_FILE_SIZE = cfg["Logging"]["MAX_FILE_SIZE"]
-MAX_FILE_COUNT = cfg["Logging"]["MAX_FILE_COUNT"] 
-LOG_FORMAT = cfg["Logging"]["LOG_FORMAT"]
-LOG_LEVEL = cfg["Logging"]["LOG_LEVEL"]
+LOG_DIR = settings.Logging.LOG_DIR
+DEBUG_LOG_FILE_NAME = settings.Logging.DEBUG_LOG_FILE_NAME
+INFO_LOG_FILE_NAME = settings.Logging.INFO_LOG_FILE_NAME
+WARNING_LOG_FILE_NAME = settings.Logging.WARNING_LOG_FILE_NAME
+ERROR_LOG_FILE_NAME = settings.Logging.ERROR_LOG_FILE_NAME
+MAX_FILE_SIZE = settings.Logging.MAX_FILE_SIZE
+MAX_FILE_COUNT = settings.Logging.MAX_FILE_COUNT
+LOG_FORMAT = settings.Logging.LOG_FORMAT
+LOG_LEVEL = settings.Logging.LOG_LEVEL
+LOG_OUTPUT_FORMAT = settings.Logging.FORMAT
+QUEUE_SIZE = settings.Logging.QUEUE_SIZE
+DROP_POLICY = settings.Logging.DROP_POLICY
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Per-request fields attached to every record. The dict is shared by reference, so values set
+# later in the request (e.g. user_id by the auth dependency) are visible to the whole request.
+_log_context: ContextVar[dict | None] = ContextVar("log_context", default=None)
+
+# Extra attributes the JSON formatter copies from records (logger.info(..., extra={...}))
+JSON_EXTRA_FIELDS = ("latency_ms", "method", "path", "status", "trace_id")
+
+_listener: QueueListener | None = None
 
 # Custom Filter for Exact Level Matching
 class ExactLevelFilter(logging.Filter):
@@ -21,13 +37,119 @@ class ExactLevelFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         return record.levelno == self.level
 
+class RequestContextFilter(logging.Filter):
+    """Stamp request_id / user_id on records in the calling thread, before they cross the queue."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get() or {}
+        record.request_id = context.get("request_id", "-")
+        record.user_id = context.get("user_id", "-")
+        if "trace_id" in context:
+            record.trace_id = context["trace_id"]  # Set by the tracing middleware, when enabled
+        return True
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "user_id": getattr(record, "user_id", "-"),
+        }
+        for field in JSON_EXTRA_FIELDS:
+            if hasattr(record, field):
+                payload[field] = getattr(record, field)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without ever blocking the caller.
+    When the queue is full, "drop_new" discards the incoming record and "drop_oldest" evicts the oldest queued one.
+    """
+
+    def __init__(self, log_queue: queue.Queue, drop_policy: str = "drop_new"):
+        super().__init__(log_queue)
+        self.drop_policy = drop_policy
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve message args and the traceback text now (the objects may change or die before the
+        # listener runs), but keep them separate so each handler's formatter lays them out itself
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if self.drop_policy == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+        # Lazy import: logging is configured before the rest of the app is imported
+        from src.metrics import LOG_RECORDS_DROPPED
+        LOG_RECORDS_DROPPED.inc()
+
+def get_log_context() -> dict | None:
+    return _log_context.get()
+
+def set_log_field(name: str, value):
+    """Attach a field (e.g. user_id) to every record logged for the rest of the current request."""
+    context = _log_context.get()
+    if context is not None:
+        context[name] = value
+
+async def request_logging(request, call_next):
+    """HTTP middleware: assign a request ID, echo it back, and log one access line with latency."""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    context = {"request_id": request_id}
+    token = _log_context.set(context)
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        latency_ms = round((time.perf_counter() - start_time) * 1000, 2)
+        logging.getLogger("aichatapp.access").info(
+            f"{request.method} {request.url.path} {status_code} {latency_ms}ms",
+            extra={"latency_ms": latency_ms, "method": request.method, "path": request.url.path, "status": status_code},
+        )
+        _log_context.reset(token)
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def setup_logging():
     # Ensure logs directory exists
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
     
     # Create formatter
-    formatter = logging.Formatter(LOG_FORMAT)
+    formatter = JSONFormatter() if LOG_OUTPUT_FORMAT == "json" else logging.Formatter(LOG_FORMAT)
     
     # Determine log level
     root_level = logging.DEBUG if str(LOG_LEVEL).lower() == "debug" else logging.INFO
@@ -37,8 +159,10 @@ def setup_logging():
     root_logger.setLevel(root_level)
     
     # Clear existing handlers to prevent duplicates
+    stop_logging()
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
+    handlers = []
 
     # -------- DEBUG (Exact) --------
     # Only attach debug handler if we include debug logs
@@ -51,7 +175,7 @@ def setup_logging():
         debug_handler.setLevel(logging.DEBUG)
         debug_handler.addFilter(ExactLevelFilter(logging.DEBUG))
         debug_handler.setFormatter(formatter)
-        root_logger.addHandler(debug_handler)
+        handlers.append(debug_handler)
 
     # -------- INFO (Exact) --------
     info_handler = RotatingFileHandler(
@@ -87,8 +211,17 @@ def setup_logging():
     stream_handler.setLevel(root_level) # Match the root level configuration
     stream_handler.setFormatter(formatter)
 
-    # Attach handlers
-    root_logger.addHandler(info_handler)
-    root_logger.addHandler(warning_handler)
-    root_logger.addHandler(error_handler)
-    root_logger.addHandler(stream_handler)
+    handlers.extend([info_handler, warning_handler, error_handler, stream_handler])
+
+    # Only the queue handler sits on the root logger; formatting, file writes and rotation
+    # happen on the listener thread so logging calls never block the event loop
+    global _listener
+    queue_handler = BoundedQueueHandler(queue.Queue(maxsize=QUEUE_SIZE), drop_policy=DROP_POLICY)
+    queue_handler.addFilter(RequestContextFilter())
+    root_logger.addHandler(queue_handler)
+
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+# Flush whatever is still queued on interpreter exit
+atexit.register(stop_logging)
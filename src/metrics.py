@@ -0,0 +1,275 @@
+"""
+Prometheus metrics for the chat hot path.
+
+Under gunicorn every worker is a separate process, so metrics are written to a shared
+directory (PROMETHEUS_MULTIPROC_DIR, set by main_prod before the workers start) and
+aggregated at scrape time by MultiProcessCollector. In single-process mode (uvicorn dev)
+the default in-memory registry is used.
+"""
+
+import functools
+import logging
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# LLM generation spans anything from sub-second to minutes for reasoning models
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 240)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 120, 160, 250, 500)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts, per route",
+    ["method", "route", "status"],
+    buckets=LLM_BUCKETS,
+)
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from pipeline start to the first streamed token",
+    ["provider", "service"],
+    buckets=LLM_BUCKETS,
+)
+
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_output_tokens_per_second",
+    "Output tokens generated per second",
+    ["provider", "service"],
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+
+PIPELINE_NODE_LATENCY = Histogram(
+    "pipeline_node_duration_seconds",
+    "Execution time of each LangGraph node",
+    ["node"],
+    buckets=LLM_BUCKETS,
+)
+
+WEB_SEARCH_LATENCY = Histogram(
+    "web_search_duration_seconds",
+    "DDGS text search latency",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15),
+)
+
+WEB_SEARCH_ERRORS = Counter(
+    "web_search_errors_total",
+    "DDGS text searches that raised an error",
+)
+
+PAGE_FETCHES = Counter(
+    "web_page_fetches_total",
+    "Deep-search page fetches by outcome",
+    ["result"],  # ok | cached | not_modified | skipped | blocked | timeout | over_budget | error
+)
+
+PAGE_FETCH_LATENCY = Histogram(
+    "web_page_fetch_duration_seconds",
+    "Deep-search page download and extraction time",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5),
+)
+
+WEB_CONTEXT_TOKENS_SAVED = Counter(
+    "web_context_tokens_saved_total",
+    "Estimated prompt tokens saved by deduplicating, ranking and budgeting web search context",
+)
+
+MONGO_OPERATION_LATENCY = Histogram(
+    "mongo_operation_duration_seconds",
+    "MongoDB command latency per collection and operation",
+    ["collection", "operation"],
+    buckets=MONGO_BUCKETS,
+)
+
+STREAMS_IN_FLIGHT = Gauge(
+    "chat_streams_in_flight",
+    "SSE chat streams currently open",
+    multiprocess_mode="livesum",
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records discarded because the logging queue was full",
+)
+
+CONVERSATION_SUMMARY_UPDATES = Counter(
+    "conversation_summary_updates_total",
+    "Background folds of older turns into a conversation's rolling summary",
+    ["result"],  # updated | conflict | failed
+)
+
+CHAT_JOBS = Counter(
+    "chat_jobs_total",
+    "Async chat job transitions",
+    ["result"],  # succeeded | failed | requeued | recovered
+)
+
+# llama.cpp generation worker (in-process or in the shared sidecar); used to size N_BATCH / N_CTX
+LLAMACPP_QUEUE_DEPTH = Gauge(
+    "llamacpp_queue_depth",
+    "Generation requests waiting for a free llama.cpp slot",
+    multiprocess_mode="livesum",
+)
+
+LLAMACPP_SLOTS_BUSY = Gauge(
+    "llamacpp_slots_busy",
+    "llama.cpp slots currently generating",
+    multiprocess_mode="livesum",
+)
+
+LLAMACPP_QUEUE_WAIT = Histogram(
+    "llamacpp_queue_wait_seconds",
+    "Time a generation request waited in the queue",
+    buckets=LLM_BUCKETS,
+)
+
+LLAMACPP_PHASE_DURATION = Histogram(
+    "llamacpp_phase_duration_seconds",
+    "Prompt evaluation (prefill) and token generation (decode) time per request",
+    ["phase"],
+    buckets=LLM_BUCKETS,
+)
+
+LLAMACPP_TOKENS = Counter(
+    "llamacpp_tokens_total",
+    "Tokens processed by llama.cpp; rate() over llamacpp_phase_duration_seconds_sum gives throughput",
+    ["kind"],
+)
+
+LLAMACPP_REJECTED = Counter(
+    "llamacpp_rejected_total",
+    "Generation requests rejected because the queue was full",
+)
+
+LLAMACPP_PREFIX_CACHE_LOOKUPS = Counter(
+    "llamacpp_prefix_cache_lookups_total",
+    "Conversation KV-state cache lookups (hit, miss, or resident: already in the context)",
+    ["result"],
+)
+
+LLAMACPP_PREFILL_TOKENS_REUSED = Counter(
+    "llamacpp_prefill_tokens_reused_total",
+    "Prompt tokens restored from a cached KV state instead of being evaluated",
+)
+
+LLAMACPP_PREFILL_SECONDS_SAVED = Counter(
+    "llamacpp_prefill_seconds_saved_total",
+    "Estimated prefill time saved by KV-state reuse",
+)
+
+LLAMACPP_PREFIX_CACHE_BYTES = Gauge(
+    "llamacpp_prefix_cache_bytes",
+    "Memory held by cached llama.cpp KV states",
+    multiprocess_mode="livesum",
+)
+
+
+def observe_node(name: str):
+    """Decorator recording the latency of an async pipeline node."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                PIPELINE_NODE_LATENCY.labels(node=name).observe(time.perf_counter() - start_time)
+        return wrapper
+    return decorator
+
+
+def observe_generation(provider: str, service: str, output_tokens: int | None, generation_time: float | None):
+    if output_tokens and generation_time and generation_time > 0:
+        LLM_TOKENS_PER_SECOND.labels(provider=provider, service=service).observe(output_tokens / generation_time)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """PyMongo command listener feeding MONGO_OPERATION_LATENCY; attached to the Motor client."""
+
+    # Commands that are connection housekeeping rather than collection operations
+    IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+
+    def __init__(self):
+        self._collections: dict[tuple, str] = {}
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        # The collection name is the value of the command's first key, e.g. {"find": "chats", ...}
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _observe(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        MONGO_OPERATION_LATENCY.labels(
+            collection=collection, operation=event.command_name
+        ).observe(event.duration_micros / 1_000_000)
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+
+
+def _route_template(request: Request) -> str:
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+async def track_request_latency(request: Request, call_next):
+    """HTTP middleware; labels by route template so path parameters don't explode cardinality."""
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route_path = _route_template(request)
+        if route_path != "/metrics":
+            REQUEST_LATENCY.labels(
+                method=request.method, route=route_path, status=str(status_code)
+            ).observe(time.perf_counter() - start_time)
+
+
+def metrics_response(request: Request) -> Response:
+    if os.getenv(MULTIPROC_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def prepare_multiprocess_dir(path: str):
+    """Create (and empty) the shared metrics directory before gunicorn forks its workers."""
+    os.makedirs(path, exist_ok=True)
+    for filename in os.listdir(path):
+        if filename.endswith(".db"):
+            os.remove(os.path.join(path, filename))
+    os.environ[MULTIPROC_ENV] = os.path.abspath(path)
@@ -1,14 +1,35 @@
-import logging, time
+import asyncio, logging, time
 from ddgs import DDGS
+from langchain_core.callbacks.manager import adispatch_custom_event
 from langchain_core.prompts import PromptTemplate
 from langchain_core.messages import HumanMessage
 
-from src.clients.llm_client import llm_model
-from src.llms.llm_parser import parse_response
+from src.clients.llm_client import get_llm
+from src.config import settings
+from src.llms.llm_parser import extract_usage, parse_response
+from src.metrics import WEB_CONTEXT_TOKENS_SAVED, WEB_SEARCH_ERRORS, WEB_SEARCH_LATENCY, observe_node
 from src.pipelines.pipeline_state import PipelineState
+from src.pipelines.page_fetcher import get_fetcher
+from src.pipelines.web_context import best_passages, build_web_context
+from src.timing import stage
+from src.tracing import traced
 
 logger = logging.getLogger(__name__)
 
+WEB_SEARCH = settings.WebSearch
+DEEP_SEARCH = settings.WebSearch.DEEP_SEARCH
+SOURCES_EVENT = "sources"
+
+# Built once; sources are numbered [n] in the context so the answer can cite them
+WEB_SEARCH_PROMPT = """You are a helpful assistant. Answer the question using the numbered web sources below, and cite the sources you rely on as [n].
+
+Web sources:
+{web_context}
+
+Question:
+{user_input}
+"""
+
 
 # async def select_tool_node(state: PipelineState):
 #     if state["service_name"] == "web_search":
@@ -16,7 +37,7 @@ logger = logging.getLogger(__name__)
 #     else:
 #         user_input = state["user_input"]
 #         prompt = f"Does this query require real-time web search for an accurate answer? Query: {user_input}. Answer 'yes' or 'no'."
-#         response = await llm_model.ainvoke(prompt)
+#         response = await get_llm().ainvoke(prompt)
 
 #         state["service_name"] = "web_search" if "yes" in response.content.lower() else "chat"
 #         logger.info(f"Selected service: {state['service_name']}")
@@ -24,6 +45,8 @@ logger = logging.getLogger(__name__)
 #     return state
 
 
+@observe_node("select_tool_node")
+@traced("node.select_tool_node")
 async def select_tool_node(state: PipelineState):
     if state["service_name"] == "web_search":
         return state
@@ -40,18 +63,22 @@ async def select_tool_node(state: PipelineState):
         self_inquery = ["who are you", "what are you", "tell me about you", "what is your name", "who is you"]
         
         # Check if any keyword is in the user input
-        if any(keyword in user_input for keyword in search_keywords):
-            state["service_name"] = "web_search"
-        
-        if any(keyword in user_input for keyword in self_inquery):
-            state["service_name"] = "self"
+        with stage("routing"):
+            if any(keyword in user_input for keyword in search_keywords):
+                state["service_name"] = "web_search"
+            
+            if any(keyword in user_input for keyword in self_inquery):
+                state["service_name"] = "self"
         return state
     
 
 
+@observe_node("chat_node")
+@traced("node.chat_node")
 async def chat_node(state: PipelineState):
     start_time = time.perf_counter()
-    response = await llm_model.ainvoke(state["llm_messages"])
+    with stage("generation"):
+        response = await get_llm().ainvoke(state["llm_messages"])
     end_time = time.perf_counter()
 
     parsed_response = parse_response(response)
@@ -62,77 +89,119 @@ async def chat_node(state: PipelineState):
     
     state["llm_response"] = parsed_response.content
     state["response_time"] = round(end_time - start_time, 3)
-    
-    if parsed_response.response_metadata:
-        state["input_tokens"] = parsed_response.response_metadata.get("input_tokens", 0)
-        state["output_tokens"] = parsed_response.response_metadata.get("output_tokens", 0)
+
+    usage = extract_usage(response, state["llm_messages"])
+    state["input_tokens"] = usage["input_tokens"]
+    state["output_tokens"] = usage["output_tokens"]
 
     return state
 
 
-async def web_search_node(state: PipelineState):
-    try: 
-        web_search_result = DDGS().text(query=state["user_input"], region="in-en", max_results=5)
-
-        # Extract body and links safely
-        web_content = [item["body"] for item in web_search_result if "body" in item]
-        links = [item["href"] for item in web_search_result if "href" in item]
-
-        # Remove links containing "zhidao"
-        links = [l for l in links if "zhidao" not in l.lower()]
-
-        # Format links nicely with length check
-        if links:
-            filtered_links = [link for link in links if len(link) <= 200]
-            if filtered_links:
-                formatted_links = "\n".join(f"- {link}" for link in filtered_links)
-                links_section = f"\n\n**Related Links:**\n{formatted_links}"
-            else:
-                links_section = ""
-        else:
-            links_section = ""
-
-        # Prompt template
-        prompt = PromptTemplate.from_template("""
-        You are a helpful assistant that can answer questions based on the following web content:
-        {web_content}
+async def publish_sources(sources: list[dict]):
+    """Emit a custom stream event the chat router forwards as an SSE "sources" frame."""
+    try:
+        await adispatch_custom_event(SOURCES_EVENT, {"sources": sources})
+    except RuntimeError:
+        pass  # Not inside a pipeline run (e.g. the node called directly); nobody is listening
 
-        Answer the following question:
-        {user_input}
-        """)
 
-        # Format the prompt
-        prompt = prompt.format(web_content=web_content, user_input=state["user_input"])
+def search_web(query: str) -> list[dict]:
+    return DDGS().text(query=query, region=WEB_SEARCH.REGION, max_results=WEB_SEARCH.MAX_RESULTS)
 
-        # Invoke the LLM
-        start_time = time.perf_counter()
-        response = await llm_model.ainvoke([HumanMessage(content=prompt)])
-        end_time = time.perf_counter()
-        
-        parsed_response = parse_response(response)
-        content = parsed_response.content
-        state["response_time"] = round(end_time - start_time, 3)
-        
-        if parsed_response.response_metadata:
-            state["input_tokens"] = parsed_response.response_metadata.get("input_tokens", 0)
-            state["output_tokens"] = parsed_response.response_metadata.get("output_tokens", 0)
 
-        # Combine response and links
-        final_response = content.strip() + links_section
+@observe_node("web_search_node")
+@traced("node.web_search_node")
+async def web_search_node(state: PipelineState):
+    try: 
+        deep_search = DEEP_SEARCH.ENABLED if state.get("deep_search") is None else state["deep_search"]
+        # In deep-search mode the search and the page fetches share one latency budget
+        deadline = time.monotonic() + DEEP_SEARCH.LATENCY_BUDGET
+        search_timeout = min(WEB_SEARCH.SEARCH_TIMEOUT, DEEP_SEARCH.LATENCY_BUDGET) if deep_search else WEB_SEARCH.SEARCH_TIMEOUT
+
+        search_start = time.perf_counter()
+        try:
+            with stage("search"):
+                # DDGS is blocking; keep it off the event loop
+                web_search_result = await asyncio.wait_for(
+                    asyncio.to_thread(search_web, state["user_input"]), timeout=search_timeout
+                )
+        except Exception:
+            WEB_SEARCH_ERRORS.inc()
+            raise
+        finally:
+            WEB_SEARCH_LATENCY.observe(time.perf_counter() - search_start)
+
+        results = [
+            item for item in web_search_result
+            if not any(domain in item.get("href", "").lower() for domain in WEB_SEARCH.BLOCKED_DOMAINS)
+        ]
 
-        # Store the final response in the state
-        state["llm_response"] = final_response
-        return state
+        if deep_search:
+            # Replace the snippets of the top pages with their most relevant passages
+            with stage("fetch"):
+                pages = await get_fetcher().fetch_all(
+                    [item.get("href", "") for item in results[:DEEP_SEARCH.TOP_K]], deadline
+                )
+            results = [
+                {**item, "body": best_passages(state["user_input"], pages[item["href"]], DEEP_SEARCH.PASSAGE_TOKENS) or item.get("body", "")}
+                if item.get("href") in pages else item
+                for item in results
+            ]
+            logger.info(f"Deep search: fetched {len(pages)}/{min(len(results), DEEP_SEARCH.TOP_K)} pages")
+
+        # Normalize, dedupe, rank and pack into the token budget
+        with stage("context"):
+            context = build_web_context(
+                state["user_input"],
+                results,
+                DEEP_SEARCH.CONTEXT_TOKEN_BUDGET if deep_search else WEB_SEARCH.CONTEXT_TOKEN_BUDGET,
+                WEB_SEARCH.DEDUPE_THRESHOLD,
+            )
+        WEB_CONTEXT_TOKENS_SAVED.inc(context.tokens_saved)
+        logger.info(f"Web context: {context.stats()}")
 
     except Exception as e:
         logger.error(f"Failed to fetch web search results: {e}")
-        response = await llm_model.ainvoke([HumanMessage(content=state["user_input"])])
+        with stage("generation"):
+            response = await get_llm().ainvoke([HumanMessage(content=state["user_input"])])
         parsed_response = parse_response(response)
         state["llm_response"] = parsed_response.content 
+
+        usage = extract_usage(response, state["user_input"])
+        state["input_tokens"] = usage["input_tokens"]
+        state["output_tokens"] = usage["output_tokens"]
         return state
 
+    # Only search failures fall back to a plain answer; from here on the sources are published and the
+    # answer must use their context. Numbered like the context, so [n] citations in the answer resolve
+    # to them, and published now so streaming clients can show them while the answer is generated.
+    state["sources"] = [{"number": s.number, "title": s.title, "url": s.url} for s in context.sources]
+    await publish_sources(state["sources"])
 
+    prompt = WEB_SEARCH_PROMPT.format(web_context=context.text, user_input=state["user_input"])
 
+    # Invoke the LLM
+    start_time = time.perf_counter()
+    with stage("generation"):
+        response = await get_llm().ainvoke([HumanMessage(content=prompt)])
+    end_time = time.perf_counter()
+    
+    parsed_response = parse_response(response)
+    content = parsed_response.content
+    state["response_time"] = round(end_time - start_time, 3)
+
+    usage = extract_usage(response, prompt)
+    state["input_tokens"] = usage["input_tokens"]
+    state["output_tokens"] = usage["output_tokens"]
+
+    # Sources travel separately (state["sources"]) instead of being appended to the answer
+    state["llm_response"] = content.strip()
+    return state
+
+
+
+@observe_node("self_node")
+@traced("node.self_node")
 async def self_node(state: PipelineState):
        # Prompt template
         prompt = PromptTemplate.from_template("""
@@ -163,16 +232,17 @@ User Question:
 
         # Invoke the LLM
         start_time = time.perf_counter()
-        response = await llm_model.ainvoke([HumanMessage(content=prompt)])
+        with stage("generation"):
+            response = await get_llm().ainvoke([HumanMessage(content=prompt)])
         end_time = time.perf_counter()
         
         parsed_response = parse_response(response)
         content = parsed_response.content
         state["response_time"] = round(end_time - start_time, 3)
-        
-        if parsed_response.response_metadata:
-            state["input_tokens"] = parsed_response.response_metadata.get("input_tokens", 0)
-            state["output_tokens"] = parsed_response.response_metadata.get("output_tokens", 0)
+
+        usage = extract_usage(response, prompt)
+        state["input_tokens"] = usage["input_tokens"]
+        state["output_tokens"] = usage["output_tokens"]
 
         # Store the final response in the state
         state["llm_response"] = content
@@ -0,0 +1,298 @@
+"""
+Concurrent page fetching for deep web search.
+
+DDGS snippets are often too thin to answer from. In deep-search mode web_search_node fetches the
+top result pages and extracts their main text, within a fixed latency budget:
+    - one shared httpx.AsyncClient per event loop (connection pooling, HTTP keep-alive)
+    - a global concurrency limit and a per-host limit, so one slow site cannot take every slot
+    - a strict per-page timeout and a byte cap; oversized or non-HTML responses are cut or skipped
+    - main-text extraction with lxml (drops scripts, navigation, headers, footers; prefers
+      <article>/<main>), run off the event loop
+    - an in-process LRU cache by URL: fresh entries are served directly, stale ones are
+      revalidated with If-None-Match / If-Modified-Since
+    - URLs come from search results, so they are untrusted: only http(s) is fetched, hosts that
+      resolve to a non-global address (loopback, private, link-local, cloud metadata) are refused,
+      and redirects are followed here, up to MAX_REDIRECTS, checking every hop the same way
+Pages that miss the deadline are simply left out; the caller falls back to their snippets.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import httpx
+import lxml.html
+from lxml.etree import ParserError
+
+from src.config import settings
+from src.metrics import PAGE_FETCHES, PAGE_FETCH_LATENCY
+
+logger = logging.getLogger(__name__)
+
+DEEP_SEARCH = settings.WebSearch.DEEP_SEARCH
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+BOILERPLATE_XPATH = (
+    "//script|//style|//noscript|//template|//svg|//iframe|//form|//nav|//header|//footer|//aside"
+)
+TEXT_TAGS = ("h1", "h2", "h3", "h4", "p", "li", "blockquote", "pre", "td", "dd")
+MIN_BLOCK_CHARS = 40  # Shorter blocks are mostly menus, buttons and captions
+ALLOWED_SCHEMES = ("http", "https")
+
+
+class BlockedURLError(Exception):
+    """The URL is not fetched: not http(s), or its host does not resolve to public addresses only."""
+
+
+async def resolve_host(host: str, port: int) -> list[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])  # Drop an IPv6 zone
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global
+
+
+def extract_main_text(content: bytes, max_chars: int) -> str:
+    """Readable text of the page's main content, one block per line."""
+    try:
+        document = lxml.html.fromstring(content)
+    except (ParserError, ValueError):
+        return ""
+    for element in document.xpath(BOILERPLATE_XPATH):
+        element.drop_tree()
+
+    root = next(iter(document.xpath("//article") or document.xpath("//main") or document.xpath("//body")), document)
+    blocks, seen, size = [], set(), 0
+    for element in root.iter(*TEXT_TAGS):
+        text = " ".join(element.text_content().split())
+        if len(text) < MIN_BLOCK_CHARS or text in seen:
+            continue
+        seen.add(text)
+        blocks.append(text)
+        size += len(text) + 1
+        if size >= max_chars:
+            break
+
+    if not blocks:
+        # No block structure (plain text, or a div soup): fall back to all the text
+        return " ".join(root.text_content().split())[:max_chars]
+    return "\n".join(blocks)[:max_chars]
+
+
+@dataclass
+class CachedPage:
+    text: str
+    etag: str | None
+    last_modified: str | None
+    validated_at: float
+
+
+class PageCache:
+    """LRU of extracted pages by URL, with the validators needed to revalidate them."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._pages: "OrderedDict[str, CachedPage]" = OrderedDict()
+
+    def get(self, url: str) -> CachedPage | None:
+        page = self._pages.get(url)
+        if page is not None:
+            self._pages.move_to_end(url)
+        return page
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return time.monotonic() - page.validated_at < self.ttl
+
+    def put(self, url: str, page: CachedPage):
+        self._pages[url] = page
+        self._pages.move_to_end(url)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+class PageFetcher:
+    """Fetches and extracts pages concurrently; bound to the event loop it was created on."""
+
+    def __init__(self, cache: PageCache, config=DEEP_SEARCH):
+        self.config = config
+        self.cache = cache
+        self.resolve = resolve_host
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.PAGE_TIMEOUT),
+            follow_redirects=False,  # Followed in _download, so every hop is checked
+            headers={"User-Agent": config.USER_AGENT, "Accept": "text/html,application/xhtml+xml;q=0.9,text/plain;q=0.8"},
+            limits=httpx.Limits(max_connections=config.MAX_CONCURRENCY, max_keepalive_connections=config.MAX_CONCURRENCY),
+        )
+        self._global = asyncio.Semaphore(config.MAX_CONCURRENCY)
+        # Per-host semaphores exist only while fetches hold or wait for them, so the map stays as
+        # small as the hosts in flight however many different hosts the worker ever sees
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+        self._host_users: Counter[str] = Counter()
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        host = urlsplit(url).hostname or ""
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.config.PER_HOST_CONCURRENCY)
+        semaphore = self._hosts[host]
+        self._host_users[host] += 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._host_users[host], self._hosts[host]
+
+    async def check_url(self, url: str):
+        """Raise BlockedURLError unless `url` is http(s) on a host with only public addresses."""
+        parts = urlsplit(url)
+        if parts.scheme not in ALLOWED_SCHEMES or not parts.hostname:
+            raise BlockedURLError(f"Unsupported URL: {url}")
+        try:
+            addresses = await self.resolve(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        except (OSError, UnicodeError) as e:
+            raise BlockedURLError(f"Cannot resolve {parts.hostname}: {e}") from e
+        if not addresses or not all(is_public_address(address) for address in addresses):
+            raise BlockedURLError(f"{parts.hostname} resolves to a non-public address")
+
+    async def _download(self, url: str, headers: dict) -> tuple[int, bytes | None, httpx.Headers]:
+        for _ in range(self.config.MAX_REDIRECTS + 1):
+            await self.check_url(url)
+            async with self.client.stream("GET", url, headers=headers) as response:
+                if response.has_redirect_location:
+                    url = str(response.url.join(response.headers["location"]))
+                    headers = {}  # The validators belong to the original URL
+                    continue
+                if response.status_code == 304 or response.status_code >= 400:
+                    return response.status_code, None, response.headers
+                content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                if content_type and content_type not in HTML_CONTENT_TYPES:
+                    return 415, None, response.headers
+
+                # Pages over the cap are cut rather than skipped; the main text is usually near the top
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) >= self.config.MAX_PAGE_BYTES:
+                        del body[self.config.MAX_PAGE_BYTES:]
+                        break
+                return response.status_code, bytes(body), response.headers
+        raise httpx.TooManyRedirects(f"More than {self.config.MAX_REDIRECTS} redirects", request=response.request)
+
+    async def fetch(self, url: str) -> str | None:
+        """Main text of the page, from the cache or the network; None if it could not be fetched."""
+        cached = self.cache.get(url)
+        if cached is not None and self.cache.is_fresh(cached):
+            PAGE_FETCHES.labels(result="cached").inc()
+            return cached.text
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        start_time = time.perf_counter()
+        result = "error"
+        try:
+            # Host first: pages queued behind a busy host must not hold global slots other hosts could use
+            async with self._host_slot(url), self._global:
+                status, body, response_headers = await asyncio.wait_for(
+                    self._download(url, headers), timeout=self.config.PAGE_TIMEOUT
+                )
+
+            if status == 304 and cached is not None:
+                cached.validated_at = time.monotonic()
+                self.cache.put(url, cached)
+                result = "not_modified"
+                return cached.text
+            if body is None:
+                result = "skipped"
+                return None
+
+            text = await asyncio.to_thread(extract_main_text, body, self.config.MAX_TEXT_CHARS)
+            self.cache.put(url, CachedPage(
+                text=text,
+                etag=response_headers.get("etag"),
+                last_modified=response_headers.get("last-modified"),
+                validated_at=time.monotonic(),
+            ))
+            result = "ok"
+            return text or None
+
+        except BlockedURLError as e:
+            logger.debug(f"Not fetching {url}: {e}")
+            result = "blocked"
+            return None
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            result = "timeout"
+            return None
+        except asyncio.CancelledError:
+            result = "over_budget"
+            raise
+        except httpx.HTTPError as e:
+            logger.debug(f"Fetching {url} failed: {e}")
+            return None
+        finally:
+            PAGE_FETCHES.labels(result=result).inc()
+            PAGE_FETCH_LATENCY.observe(time.perf_counter() - start_time)
+
+    async def fetch_all(self, urls: list[str], deadline: float) -> dict[str, str]:
+        """Fetch pages concurrently until `deadline` (time.monotonic()); returns the ones that made it."""
+        urls = list(dict.fromkeys(url for url in urls if url.startswith(("http://", "https://"))))
+        remaining = deadline - time.monotonic()
+        if not urls or remaining <= 0:
+            return {}
+
+        tasks = {asyncio.create_task(self.fetch(url)): url for url in urls}
+        done, pending = await asyncio.wait(tasks, timeout=remaining)
+        for task in pending:
+            task.cancel()  # Over budget: answer from what we have
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        pages = {}
+        for task in done:
+            if not task.cancelled() and task.exception() is None and task.result():
+                pages[tasks[task]] = task.result()
+        return pages
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# The cache outlives fetchers; a fetcher (client + semaphores) belongs to one event loop
+_cache = PageCache(DEEP_SEARCH.CACHE_ENTRIES, DEEP_SEARCH.CACHE_TTL)
+_fetcher: PageFetcher | None = None
+_fetcher_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_fetcher() -> PageFetcher:
+    global _fetcher, _fetcher_loop
+    loop = asyncio.get_running_loop()
+    if _fetcher is None or _fetcher_loop is not loop:
+        _fetcher, _fetcher_loop = PageFetcher(_cache), loop
+    return _fetcher
+
+
+async def close_fetcher():
+    global _fetcher, _fetcher_loop
+    if _fetcher is not None:
+        await _fetcher.aclose()
+    _fetcher, _fetcher_loop = None, None
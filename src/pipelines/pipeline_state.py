@@ -5,6 +5,8 @@ class PipelineState(TypedDict):
     service_name: str
     user_input: str
     llm_messages: List[Dict[str, Any]]
+    deep_search: Optional[bool] = None
+    sources: Optional[List[Dict[str, Any]]] = None # Web search: [{"number", "title", "url"}]
     llm_response: Optional[str] = None
     input_tokens: Optional[int] = 0
     output_tokens: Optional[int] = 0
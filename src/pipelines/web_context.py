@@ -0,0 +1,199 @@
+"""
+Context building for web_search_node.
+
+Raw DDGS results overlap heavily (mirrors, syndicated copies, the same sentence under different
+URLs) and carry boilerplate such as dates, ellipses and HTML entities. Sending them as-is costs
+prompt tokens and prefill time. build_web_context() reduces them to a small, ranked, numbered
+context:
+    1. normalize: unescape HTML, NFKC, collapse whitespace, strip leading dates and trailing "..."
+    2. dedupe:    drop repeated URLs, and snippets whose word shingles mostly overlap an earlier
+                  (higher placed by DDGS) one
+    3. rank:      BM25 against the query, computed over the result set itself; snippets sharing no
+                  term with the query are dropped when any other snippet matches
+    4. pack:      best-first into a token budget, numbered [1], [2], ... with their source URLs
+
+The returned WebContext reports the tokens the raw results would have used and the tokens sent.
+"""
+
+import html
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+
+from src.llms.llm_parser import estimate_tokens
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+SHINGLE_SIZE = 3
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were "
+    "what when where which who why will with".split()
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_LEADING_DATE = re.compile(
+    r"^(?:\d{1,2}\s+\w{3,9}\s+\d{4}|\w{3,9}\s+\d{1,2},?\s+\d{4}|\d{4}-\d{2}-\d{2}|\d+\s+\w+\s+ago)\s*[—\-–·:|]\s*",
+    re.IGNORECASE,
+)
+_TRAILING_ELLIPSIS = re.compile(r"\s*(?:\.{3}|…)+\s*$")
+
+
+@dataclass
+class Source:
+    number: int
+    title: str
+    url: str
+    text: str
+    score: float
+
+
+@dataclass
+class WebContext:
+    text: str
+    sources: list[Source] = field(default_factory=list)
+    raw_tokens: int = 0
+    context_tokens: int = 0
+    candidates: int = 0
+    duplicates: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.raw_tokens - self.context_tokens)
+
+    def stats(self) -> dict:
+        return {
+            "candidates": self.candidates,
+            "duplicates": self.duplicates,
+            "sources": len(self.sources),
+            "raw_tokens": self.raw_tokens,
+            "context_tokens": self.context_tokens,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", html.unescape(text or ""))
+    text = " ".join(text.split())
+    text = _LEADING_DATE.sub("", text)
+    return _TRAILING_ELLIPSIS.sub("", text).strip()
+
+
+def tokenize(text: str) -> list[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def shingles(words: list[str]) -> set[tuple[str, ...]]:
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def bm25_scores(query: list[str], documents: list[list[str]]) -> list[float]:
+    """Okapi BM25 of each document for the query, with IDF taken over the documents themselves."""
+    if not documents:
+        return []
+    avg_length = sum(len(doc) for doc in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+    n = len(documents)
+
+    scores = []
+    for doc in documents:
+        frequencies = Counter(doc)
+        score = 0.0
+        for term in set(query):
+            tf = frequencies.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+
+def best_passages(query: str, text: str, max_tokens: int, passage_words: int = 60) -> str:
+    """The page's passages most relevant to the query that fit max_tokens, in page order."""
+    passages, current = [], []
+    for line in text.splitlines():
+        current.append(line)
+        if sum(len(part.split()) for part in current) >= passage_words:
+            passages.append(" ".join(current))
+            current = []
+    if current:
+        passages.append(" ".join(current))
+    if not passages:
+        return ""
+
+    scores = bm25_scores(tokenize(query), [tokenize(passage) for passage in passages])
+    chosen, used = [], 0
+    for score, index in sorted(zip(scores, range(len(passages))), key=lambda pair: (-pair[0], pair[1])):
+        cost = estimate_tokens(passages[index])
+        if used + cost > max_tokens:
+            continue
+        chosen.append(index)
+        used += cost
+    return " … ".join(passages[index] for index in sorted(chosen))
+
+
+def format_source(number: int, title: str, text: str, url: str) -> str:
+    heading = f"[{number}] {title}" if title else f"[{number}]"
+    return f"{heading}\n{text}\nSource: {url}"
+
+
+def build_web_context(
+    query: str,
+    results: list[dict],
+    token_budget: int,
+    dedupe_threshold: float = 0.8,
+) -> WebContext:
+    """Normalize, dedupe, rank and pack DDGS results ({"title", "href", "body"}) for the prompt."""
+    # What the old prompt sent: the repr of the raw body list
+    raw_tokens = estimate_tokens(str([item.get("body", "") for item in results])) if results else 0
+
+    candidates, seen_urls, seen_shingles, duplicates = [], set(), [], 0
+    for item in results:
+        text = normalize(item.get("body", ""))
+        url = (item.get("href") or "").strip()
+        if not text:
+            continue
+        words = tokenize(text)
+        item_shingles = shingles(words)
+        if (url and url in seen_urls) or any(
+            item_shingles and len(item_shingles & other) / min(len(item_shingles), len(other)) >= dedupe_threshold
+            for other in seen_shingles if other
+        ):
+            duplicates += 1
+            continue
+        seen_urls.add(url)
+        seen_shingles.append(item_shingles)
+        title = normalize(item.get("title", ""))
+        # Titles are strong relevance evidence and short; count them with the body
+        candidates.append((title, url, text, tokenize(title) + words))
+
+    scores = bm25_scores(tokenize(query), [candidate[3] for candidate in candidates])
+    ranked = sorted(zip(scores, range(len(candidates))), key=lambda pair: (-pair[0], pair[1]))
+    if ranked and ranked[0][0] > 0:
+        # Snippets sharing no term with the query are noise once anything relevant was found
+        ranked = [pair for pair in ranked if pair[0] > 0]
+
+    sources, blocks, used = [], [], 0
+    for score, index in ranked:
+        title, url, text, _ = candidates[index]
+        block = format_source(len(sources) + 1, title, text, url)
+        cost = estimate_tokens(block)
+        if used + cost > token_budget:
+            continue  # A shorter, lower-ranked snippet may still fit
+        sources.append(Source(len(sources) + 1, title, url, text, round(score, 4)))
+        blocks.append(block)
+        used += cost
+
+    return WebContext(
+        text="\n\n".join(blocks),
+        sources=sources,
+        raw_tokens=raw_tokens,
+        context_tokens=used,
+        candidates=len(results),
+        duplicates=duplicates,
+    )
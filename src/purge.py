@@ -0,0 +1,85 @@
+"""
+Background cascade deletes.
+
+Deleting a conversation, all of a user's conversations or the account used to collect every
+conversation ID and send one delete_many with all of them in an $in, which for heavy users timed
+out and held up the primary. The routes now only mark the conversations and answer 202:
+    - soft_delete() sets deleted_at on them in one indexed update. Reads filter on NOT_DELETED,
+      so the conversations disappear from the API straight away (and no turn can be added to them)
+    - a "purge" job (src.jobs) then removes them: message IDs in chunks of Deletion.CHUNK_SIZE,
+      deleted by _id, then the emptied conversations CONVERSATION_CHUNK_SIZE at a time, sleeping
+      THROTTLE between chunks so the deletes do not crowd out live traffic
+    - progress is kept on the job document (GET /chat/jobs/{job_id})
+A purge only looks at conversations that are already marked, so running it again after a lost
+worker carries on where the last run stopped.
+"""
+
+import asyncio
+import logging
+from datetime import UTC, datetime
+
+from bson import ObjectId
+
+from src.config import settings
+from src.database import conversations_collection, jobs_collection, messages_collection
+
+logger = logging.getLogger(__name__)
+
+DELETION = settings.Deletion
+
+# Filter for live conversations; also matches documents written before the marker existed
+NOT_DELETED = {"deleted_at": None}
+# Filter for conversations marked by soft_delete() and not purged yet
+DELETED = {"deleted_at": {"$ne": None}}
+
+
+async def soft_delete(user_id: str, conversation_id: str | None = None) -> int:
+    """Mark the user's conversation (or all of them) as deleted; returns how many were marked."""
+    query = {"user_id": user_id, **NOT_DELETED}
+    if conversation_id:
+        query["_id"] = ObjectId(conversation_id)
+    result = await conversations_collection.update_many(
+        query, {"$set": {"deleted_at": datetime.now(UTC).isoformat()}}
+    )
+    return result.modified_count
+
+
+async def purge_conversations(job: dict) -> None:
+    """Job handler: delete the user's soft-deleted conversations (or the one in the job input) in chunks."""
+    from src.search import forget_conversations  # search imports the filters from here
+    query = {"user_id": job["user_id"], **DELETED}
+    if job["input"].get("conversation_id"):
+        query["_id"] = ObjectId(job["input"]["conversation_id"])
+
+    async def report(**counts):
+        await jobs_collection.update_one(
+            {"_id": job["_id"], "worker_id": job["worker_id"]},
+            {"$inc": {f"progress.{name}": count for name, count in counts.items()}},
+        )
+
+    if not (job.get("progress") or {}).get("conversations_total"):
+        await jobs_collection.update_one(
+            {"_id": job["_id"], "worker_id": job["worker_id"]}, {"$set": {"progress.conversations_total": await conversations_collection.count_documents(query)}}
+        )
+
+    while True:
+        cursor = conversations_collection.find(query, {"_id": 1}).limit(DELETION.CONVERSATION_CHUNK_SIZE)
+        conversation_ids = [conversation["_id"] async for conversation in cursor]
+        if not conversation_ids:
+            return
+        chat_ids = [str(conversation_id) for conversation_id in conversation_ids]
+
+        while True:
+            cursor = messages_collection.find({"chat_id": {"$in": chat_ids}}, {"_id": 1}).limit(DELETION.CHUNK_SIZE)
+            message_ids = [message["_id"] async for message in cursor]
+            if not message_ids:
+                break
+            result = await messages_collection.delete_many({"_id": {"$in": message_ids}})
+            await report(messages_deleted=result.deleted_count)
+            await asyncio.sleep(DELETION.THROTTLE)
+
+        forget_conversations(job["user_id"], chat_ids)
+        result = await conversations_collection.delete_many({"_id": {"$in": conversation_ids}})
+        await report(conversations_deleted=result.deleted_count)
+        logger.debug(f"Purged {result.deleted_count} conversation(s) of user {job['user_id']}")
+        await asyncio.sleep(DELETION.THROTTLE)
@@ -38,6 +38,11 @@ class ResetPasswordWithOTP(BaseModel):
     new_password: str = Field(min_length=6)
 
 
+class Source(BaseModel):
+    number: int                 # Matches the [n] citations in the answer
+    title: str | None = None
+    url: str
+
 class Message(BaseModel):
     id: str | None = None
     chat_id: str
@@ -46,8 +51,12 @@ class Message(BaseModel):
     input_tokens: int | None = 0
     output_tokens: int | None = 0
     response_time: float | None = 0.0
+    truncated: bool = False
+    ttft: float | None = None                  # Seconds from request start to first streamed token
+    timings: dict[str, float] | None = None    # Stage durations in milliseconds, up to (not including) persistence
     created_at: str
     seq: int | None = None
+    sources: list[Source] | None = None        # Web search results the answer was based on
 
 class ConversationBase(BaseModel):
     title: str = Field(
@@ -63,11 +72,20 @@ class ConversationCreate(ConversationBase):
 class ConversationUpdate(ConversationBase):
     pass
 
+class ConversationPreview(BaseModel):
+    user: str                   # Start of the last user message
+    assistant: str              # Start of the last answer
+    seq: int                    # seq of the last turn
+    total_tokens: int = 0       # Input + output tokens over the whole conversation
+
 class Conversation(ConversationBase):
     id: str
     user_id: str
     messages: list[Message] = []
     message_count: int = 0
+    total_input_tokens: int = 0
+    total_output_tokens: int = 0
+    preview: ConversationPreview | None = None  # Maintained by save_turn; None until the first turn
     created_at: str
     updated_at: str
 
@@ -76,7 +94,73 @@ class UserInput(BaseModel):
     service_name: str = "chat"
     user_query: str
     conversation_id: str | None = None
+    deep_search: bool | None = None # Web search only: read the result pages, not just snippets (default from config)
 
 class UserQueryResponse(BaseModel):
     conversation_id: str
     message: str
+    sources: list[Source] = []
+
+class BatchRequest(BaseModel):
+    items: list[UserInput] = Field(min_length=1)
+    concurrency: int | None = Field(default=None, ge=1) # Capped by Batch.MAX_CONCURRENCY
+
+class BatchItemResult(BaseModel):
+    """One NDJSON line of a batch response; `index` refers to the position in the request."""
+    index: int
+    status: int = 201
+    conversation_id: str | None = None
+    message: str | None = None
+    sources: list[Source] = []
+    error: str | None = None
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str = "query"         # query | purge
+    status: str                 # queued | running | succeeded | failed
+    service_name: str | None = None     # Query jobs only
+    conversation_id: str | None = None  # The conversation the job continues (or purges), if any; see result for new ones
+    attempts: int = 0
+    result: UserQueryResponse | None = None
+    error: str | None = None
+    progress: dict[str, int] | None = None  # Purge jobs: conversations_total, conversations_deleted, messages_deleted
+    created_at: str
+    started_at: str | None = None
+    finished_at: str | None = None
+
+
+class SearchResult(BaseModel):
+    conversation_id: str
+    title: str | None = None
+    kind: str                   # turn | title
+    seq: int | None = None      # Turn results: position of the turn in the conversation
+    matched_in: str             # user | assistant | title: where the snippet comes from
+    snippet: str
+    highlights: list[list[int]] = []    # [start, end) character ranges of the matches in the snippet
+    score: float
+    created_at: str | None = None
+
+class SearchResponse(BaseModel):
+    query: str
+    backend: str                # text | local (auto before the first search)
+    offset: int
+    limit: int
+    has_more: bool = False
+    results: list[SearchResult] = []
+
+
+class UsageRollup(BaseModel):
+    user_id: str
+    date: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    turns: int = 0
+
+class UsageReport(BaseModel):
+    start_date: str | None = None
+    end_date: str | None = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    turns: int = 0
+    truncated: bool = False         # More rollups match than `limit`; totals still cover all of them
+    rollups: list[UsageRollup] = []
@@ -0,0 +1,282 @@
+"""
+Search over a user's conversations (GET /chat/search).
+
+Matches turns (prompt and answer) and conversation titles, ranked by relevance and paged with
+offset/limit. Each result carries a snippet around its best match and the character ranges of the
+matched words, for highlighting.
+
+Backends (Search.BACKEND):
+    - text:  MongoDB $text on the compound text indexes from ensure_indexes() ({user_id, user,
+             assistant} on turns, {user_id, title} on conversations), ranked by textScore
+    - local: a per-user inverted index of turns held by this worker, ranked with BM25. It is built
+             on the user's first search from their turns (by user_id), updated by save_turn whenever
+             a turn is inserted here, and before each search topped up with turns other workers
+             wrote since the newest one it holds. Purges drop their conversations' turns from
+             this worker's index. Titles are scored at query time.
+    - auto:  text, switching to local for the rest of the worker's life the first time MongoDB
+             reports there is no text index (e.g. a Mongo-compatible store without $text)
+Soft-deleted conversations are left out before results are ranked and paged (in the $text queries
+themselves for the text backend, by the few IDs still waiting for a purge), and titles are only read
+for the page being returned. Only turns that carry user_id are found, so older data needs
+scripts/backfill_message_user_id.py.
+"""
+
+import logging
+import math
+import re
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from src.config import settings
+from src.database import conversations_collection, messages_collection
+from src.pipelines.web_context import BM25_B, BM25_K1, bm25_scores, tokenize
+from src.purge import DELETED, NOT_DELETED
+from src.schemas import SearchResponse, SearchResult
+
+logger = logging.getLogger(__name__)
+
+SEARCH = settings.Search
+
+INDEX_NOT_FOUND = 27  # MongoDB error code for $text without a text index
+TURN_FIELDS = {"chat_id": 1, "seq": 1, "user": 1, "assistant": 1, "created_at": 1}
+
+_backend = SEARCH.BACKEND  # "auto" becomes "local" once MongoDB turns out to have no text index
+
+
+@dataclass
+class Hit:
+    kind: str               # turn | title
+    conversation_id: str
+    score: float
+    turn_id: ObjectId | None = None
+
+
+class InvertedIndex:
+    """Postings of one user's turns: term -> {turn_id: term frequency}."""
+
+    def __init__(self):
+        self.postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self.turns: dict[str, tuple[str, int]] = {}  # turn_id -> (chat_id, length in terms)
+        self.total_length = 0
+        self.indexed_until = ""  # created_at of the newest turn added
+
+    def add(self, turn: dict):
+        turn_id = str(turn["_id"])
+        if turn_id in self.turns:
+            return
+        terms = tokenize(f"{turn.get('user', '')} {turn.get('assistant', '')}")
+        for term, frequency in Counter(terms).items():
+            self.postings[term][turn_id] = frequency
+        self.turns[turn_id] = (turn["chat_id"], len(terms))
+        self.total_length += len(terms)
+        self.indexed_until = max(self.indexed_until, turn.get("created_at") or "")
+
+    def search(self, query_terms: list[str]) -> list[tuple[str, float]]:
+        """BM25 score of every turn containing a query term, best first."""
+        n = len(self.turns)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores: dict[str, float] = defaultdict(float)
+        for term in set(query_terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for turn_id, tf in posting.items():
+                length = self.turns[turn_id][1]
+                scores[turn_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def remove_conversations(self, chat_ids: set[str]):
+        removed = {turn_id for turn_id, (chat_id, _) in self.turns.items() if chat_id in chat_ids}
+        if not removed:
+            return
+        for term in list(self.postings):
+            posting = self.postings[term]
+            for turn_id in removed.intersection(posting):
+                del posting[turn_id]
+            if not posting:
+                del self.postings[term]
+        for turn_id in removed:
+            self.total_length -= self.turns.pop(turn_id)[1]
+
+
+# Most recently searched users first out; bounded by Search.LOCAL_INDEX_USERS
+_indexes: "OrderedDict[str, InvertedIndex]" = OrderedDict()
+
+
+async def user_index(user_id: str) -> InvertedIndex:
+    index = _indexes.get(user_id)
+    if index is None:
+        index = InvertedIndex()
+        cursor = messages_collection.find({"user_id": user_id}, TURN_FIELDS).sort("created_at", -1).limit(
+            SEARCH.LOCAL_INDEX_MAX_TURNS
+        )
+    else:
+        # Turns saved by other workers since; the newest one we hold is skipped by add()
+        cursor = messages_collection.find({"user_id": user_id, "created_at": {"$gte": index.indexed_until}}, TURN_FIELDS)
+    async for turn in cursor:
+        index.add(turn)
+
+    _indexes[user_id] = index
+    _indexes.move_to_end(user_id)
+    while len(_indexes) > SEARCH.LOCAL_INDEX_USERS:
+        _indexes.popitem(last=False)
+    return index
+
+
+def index_turn(turn_doc: dict):
+    """Called once a turn is inserted; only users whose index is loaded in this worker need it."""
+    index = _indexes.get(turn_doc.get("user_id"))
+    if index is not None and "_id" in turn_doc:
+        index.add(turn_doc)
+
+
+def forget_conversations(user_id: str, chat_ids: list[str]):
+    """Called when conversations are purged, so this worker's index stops matching their turns."""
+    index = _indexes.get(user_id)
+    if index is not None:
+        index.remove_conversations(set(chat_ids))
+
+
+async def text_hits(user_id: str, query: str, limit: int, deleted_ids: list[str]) -> list[Hit]:
+    score = {"score": {"$meta": "textScore"}}
+    by_score = [("score", {"$meta": "textScore"})]
+    # Turns of soft-deleted conversations are excluded here, so they cannot use up the limit. Only the
+    # deleted IDs are listed: they are few and gone once purged, where a user's live ones are unbounded
+    turn_query = {"user_id": user_id, "$text": {"$search": query}}
+    if deleted_ids:
+        turn_query["chat_id"] = {"$nin": deleted_ids}
+    turns = messages_collection.find(turn_query, {"chat_id": 1, **score}).sort(by_score).limit(limit)
+    titles = conversations_collection.find(
+        {"user_id": user_id, **NOT_DELETED, "$text": {"$search": query}}, score
+    ).sort(by_score).limit(limit)
+
+    hits = [Hit("turn", turn["chat_id"], turn["score"], turn["_id"]) async for turn in turns]
+    hits += [Hit("title", str(conversation["_id"]), conversation["score"]) async for conversation in titles]
+    return hits
+
+
+async def local_hits(user_id: str, terms: list[str]) -> list[Hit]:
+    index = await user_index(user_id)
+    hits = [Hit("turn", index.turns[turn_id][0], score, ObjectId(turn_id)) for turn_id, score in index.search(terms)]
+
+    # BM25 needs every title for its statistics, so unlike $text this reads all of the user's live ones
+    cursor = conversations_collection.find({"user_id": user_id, **NOT_DELETED}, {"title": 1})
+    titles = {str(conversation["_id"]): conversation.get("title") async for conversation in cursor}
+    conversation_ids = list(titles)
+    title_scores = bm25_scores(terms, [tokenize(titles[conversation_id] or "") for conversation_id in conversation_ids])
+    hits += [Hit("title", conversation_id, score) for conversation_id, score in zip(conversation_ids, title_scores) if score > 0]
+    return hits
+
+
+async def find_hits(user_id: str, query: str, terms: list[str], deleted_ids: set[str], limit: int) -> tuple[str, list[Hit]]:
+    global _backend
+    if _backend != "local":
+        try:
+            return "text", await text_hits(user_id, query, limit, list(deleted_ids))
+        except OperationFailure as e:
+            if _backend == "text" or e.code != INDEX_NOT_FOUND:
+                raise
+            logger.warning("No MongoDB text index for search; using the local inverted index from now on")
+            _backend = "local"
+    return "local", await local_hits(user_id, terms)
+
+
+def snippet(text: str, terms: list[str], max_chars: int) -> tuple[str, list[list[int]]]:
+    """The window of `text` with the most query-term matches, and the [start, end) ranges of those matches in it."""
+    text = " ".join((text or "").split())
+    # Prefix matches, so "run" also marks "running" (MongoDB's text search stems)
+    pattern = re.compile(r"\b(?:" + "|".join(sorted(map(re.escape, set(terms)), key=len, reverse=True)) + r")\w*", re.IGNORECASE)
+    matches = list(pattern.finditer(text))
+
+    start = 0
+    if matches and len(text) > max_chars:
+        best = 0
+        for i, match in enumerate(matches):
+            window_start = max(0, match.start() - max_chars // 4)
+            count = sum(1 for other in matches[i:] if other.end() <= window_start + max_chars)
+            if count > best:
+                best, start = count, window_start
+        if start > 0:
+            start = text.rfind(" ", 0, start) + 1  # Do not open on half a word
+    end = min(len(text), start + max_chars)
+    if end < len(text):
+        end = max(text.rfind(" ", start, end), start + max_chars // 2)
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    shift = len(prefix) - start
+    highlights = [[m.start() + shift, m.end() + shift] for m in matches if m.start() >= start and m.end() <= end]
+    return prefix + text[start:end] + suffix, highlights
+
+
+def turn_result(hit: Hit, turn: dict, title: str | None, terms: list[str]) -> SearchResult:
+    # The side of the turn with more matches; ties go to the answer
+    answer = snippet(turn.get("assistant", ""), terms, SEARCH.SNIPPET_CHARS)
+    prompt = snippet(turn.get("user", ""), terms, SEARCH.SNIPPET_CHARS)
+    matched_in, (text, highlights) = ("user", prompt) if len(prompt[1]) > len(answer[1]) else ("assistant", answer)
+    return SearchResult(
+        conversation_id=hit.conversation_id,
+        title=title,
+        kind="turn",
+        seq=turn.get("seq"),
+        matched_in=matched_in,
+        snippet=text,
+        highlights=highlights,
+        score=round(hit.score, 4),
+        created_at=turn.get("created_at"),
+    )
+
+
+async def search(user_id: str, query: str, offset: int, limit: int) -> SearchResponse:
+    terms = tokenize(query)
+    if not terms:
+        return SearchResponse(query=query, backend=_backend, offset=offset, limit=limit)
+
+    # Soft-deleted conversations waiting for their purge, whose hits are dropped before paging
+    cursor = conversations_collection.find({"user_id": user_id, **DELETED}, {"_id": 1})
+    deleted_ids = {str(conversation["_id"]) async for conversation in cursor}
+
+    backend, hits = await find_hits(user_id, query, terms, deleted_ids, offset + limit + 1)
+    hits = sorted((hit for hit in hits if hit.conversation_id not in deleted_ids), key=lambda hit: hit.score, reverse=True)
+    page = hits[offset:offset + limit]
+
+    # Titles only for the conversations on this page
+    conversation_ids = [ObjectId(conversation_id) for conversation_id in {hit.conversation_id for hit in page}]
+    titles = {}
+    if conversation_ids:
+        cursor = conversations_collection.find({"_id": {"$in": conversation_ids}, **NOT_DELETED}, {"title": 1})
+        titles = {str(conversation["_id"]): conversation.get("title") async for conversation in cursor}
+    turn_ids = [hit.turn_id for hit in page if hit.kind == "turn"]
+    turns = {}
+    if turn_ids:
+        turns = {turn["_id"]: turn async for turn in messages_collection.find({"_id": {"$in": turn_ids}}, TURN_FIELDS)}
+
+    results = []
+    for hit in page:
+        if hit.conversation_id not in titles:  # Deleted or purged since the hits were found
+            continue
+        title = titles[hit.conversation_id]
+        if hit.kind == "turn":
+            if hit.turn_id in turns:  # Purged since it was indexed
+                results.append(turn_result(hit, turns[hit.turn_id], title, terms))
+        else:
+            text, highlights = snippet(title or "", terms, SEARCH.SNIPPET_CHARS)
+            results.append(SearchResult(
+                conversation_id=hit.conversation_id,
+                title=title,
+                kind="title",
+                matched_in="title",
+                snippet=text,
+                highlights=highlights,
+                score=round(hit.score, 4),
+            ))
+
+    return SearchResponse(
+        query=query, backend=backend, offset=offset, limit=limit, has_more=len(hits) > offset + limit, results=results
+    )
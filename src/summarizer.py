@@ -0,0 +1,120 @@
+"""
+Rolling conversation summaries.
+
+Prompts used to carry the last five turns, so anything older was lost and a larger window meant
+ever-longer prefills. Instead, turns that age out of the recent window are folded into a summary
+stored on the conversation document:
+    - summary:      the running summary text
+    - summary_seq:  seq of the newest turn it covers
+
+After each saved turn, save_turn() checks whether at least FOLD_BATCH turns sit between the summary
+and the recent window, and if so starts update_summary() in the background. Prompts send the
+summary plus every turn after summary_seq (RECENT_TURNS up to RECENT_TURNS + FOLD_BATCH - 1), so
+between folds a conversation's prompt only grows at the end and its prefix stays reusable.
+"""
+
+import logging
+from datetime import UTC, datetime
+
+from bson import ObjectId
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from src.clients.llm_client import get_llm
+from src.config import settings
+from src.database import conversations_collection, messages_collection
+from src.llms.llm_parser import parse_response
+from src.metrics import CONVERSATION_SUMMARY_UPDATES
+
+logger = logging.getLogger(__name__)
+
+SUMMARY = settings.Summary
+
+SUMMARIZER_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Update the summary with the new turns. Keep facts, names, numbers, decisions, user preferences "
+    "and open questions; drop greetings and filler. Write at most {max_words} words in plain prose. "
+    "Reply with the updated summary only."
+)
+
+# Conversations with a fold in progress in this worker; another worker racing on the same
+# conversation is caught by the compare-and-set on summary_seq
+_folding: set[str] = set()
+
+
+def history_limit() -> int:
+    """Most turns a prompt carries: the recent window plus turns waiting for the next fold."""
+    if not SUMMARY.ENABLED:
+        return SUMMARY.HISTORY_TURNS
+    return SUMMARY.RECENT_TURNS + SUMMARY.FOLD_BATCH - 1
+
+
+def needs_summary(latest_seq: int, summary_seq: int | None) -> bool:
+    return SUMMARY.ENABLED and latest_seq - SUMMARY.RECENT_TURNS - (summary_seq or 0) >= SUMMARY.FOLD_BATCH
+
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=f"Summary of the earlier part of this conversation:\n{summary}")
+
+
+def _clip(text: str) -> str:
+    limit = SUMMARY.TURN_CHAR_LIMIT
+    return text if len(text) <= limit else text[:limit] + " …"
+
+
+def summarizer_messages(previous: str | None, turns: list[dict]) -> list:
+    transcript = "\n\n".join(f"User: {_clip(turn['user'])}\nAssistant: {_clip(turn['assistant'])}" for turn in turns)
+    return [
+        SystemMessage(content=SUMMARIZER_PROMPT.format(max_words=SUMMARY.MAX_WORDS)),
+        HumanMessage(content=f"Current summary:\n{previous or '(none yet)'}\n\nNew turns:\n{transcript}"),
+    ]
+
+
+async def update_summary(conversation_id: str):
+    """Fold the turns between the stored summary and the recent window into the summary."""
+    if conversation_id in _folding:
+        return
+    _folding.add(conversation_id)
+    try:
+        conversation = await conversations_collection.find_one(
+            {"_id": ObjectId(conversation_id)}, {"summary": 1, "summary_seq": 1, "message_count": 1}
+        )
+        if not conversation:
+            return
+        summary_seq = conversation.get("summary_seq")
+        latest_seq = conversation.get("message_count", 0)
+        if not needs_summary(latest_seq, summary_seq):
+            return
+
+        fold_to = min(latest_seq - SUMMARY.RECENT_TURNS, (summary_seq or 0) + SUMMARY.MAX_FOLD_TURNS)
+        cursor = messages_collection.find(
+            {"chat_id": conversation_id, "seq": {"$gt": summary_seq or 0, "$lte": fold_to}},
+            {"user": 1, "assistant": 1, "seq": 1},
+        ).sort("seq", 1)
+        turns = [turn async for turn in cursor]
+        if not turns:
+            return
+
+        # No conversation_id in the run metadata: this prompt must not replace the conversation's
+        # cached llama.cpp state, which the next chat turn wants to reuse
+        response = await get_llm().ainvoke(summarizer_messages(conversation.get("summary"), turns))
+        summary = parse_response(response).content.strip()
+        if not summary:
+            raise ValueError("Summarizer returned an empty summary")
+
+        # Compare-and-set: only advance from the summary this fold was built on
+        result = await conversations_collection.update_one(
+            {"_id": ObjectId(conversation_id), "summary_seq": summary_seq},
+            {"$set": {
+                "summary": summary,
+                "summary_seq": turns[-1]["seq"],
+                "summary_updated_at": datetime.now(UTC).isoformat(),
+            }},
+        )
+        CONVERSATION_SUMMARY_UPDATES.labels(result="updated" if result.modified_count else "conflict").inc()
+        logger.info(f"Folded turns {turns[0]['seq']}-{turns[-1]['seq']} into the summary of {conversation_id}")
+
+    except Exception:
+        CONVERSATION_SUMMARY_UPDATES.labels(result="failed").inc()
+        raise  # Logged by background.spawn; the prompt keeps the older summary until the next turn retries
+    finally:
+        _folding.discard(conversation_id)
@@ -0,0 +1,97 @@
+"""
+Per-request stage timing.
+
+A StageTimer is created for every HTTP request by the server_timing middleware and kept in a
+context variable, so dependencies, routers and pipeline nodes can record stages without having
+it passed around. All times come from the monotonic perf_counter clock and are relative to the
+start of the request.
+
+Stages: auth, history, routing, search, generation, persistence (plus "pipeline" for the whole
+graph run), and the first_token point for streams. Turn documents store the timings as they stand
+when the turn is saved, i.e. without persistence, and with a total that ends where it begins.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.requests import Request
+
+_current_timer: ContextVar["StageTimer | None"] = ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages: dict[str, float] = {}  # stage name -> seconds (repeated stages accumulate)
+        self.first_token: float | None = None  # seconds from request start
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.origin
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def as_dict(self) -> dict:
+        """Stage durations in milliseconds, as stored on turn documents and sent in the timing SSE event."""
+        timings = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        if self.first_token is not None:
+            timings["first_token"] = round(self.first_token * 1000, 2)
+        timings["total"] = round(self.elapsed() * 1000, 2)
+        return timings
+
+    def server_timing_header(self) -> str:
+        return ", ".join(f"{name};dur={duration}" for name, duration in self.as_dict().items())
+
+
+def current_timer() -> StageTimer | None:
+    return _current_timer.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block against the current request's timer; a no-op outside a request."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+@contextmanager
+def timer_scope(timer: StageTimer | None = None):
+    """Install a separate timer for a unit of work that is not a request of its own (a batch item, a job)."""
+    timer = timer or StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+async def server_timing(request: Request, call_next):
+    """HTTP middleware installing a StageTimer and emitting Server-Timing on non-streaming responses."""
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        response = await call_next(request)
+    finally:
+        _current_timer.reset(token)
+
+    # Streams send their timings as a final SSE event instead; headers are long gone by then
+    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+        response.headers["Server-Timing"] = timer.server_timing_header()
+    return response
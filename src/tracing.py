@@ -0,0 +1,485 @@
+"""
+Request-scoped tracing, modelled on OpenTelemetry.
+
+Every HTTP request gets a root span (continuing a W3C `traceparent` header if the caller sent
+one). Spans opened during the request nest under it through a context variable:
+    - auth:  get_current_user
+    - mongo: every MongoDB command, from a PyMongo command listener on the Motor client
+    - node:  each LangGraph node (the @traced decorator in src/pipelines/nodes.py)
+    - llm:   each chat model call, from a LangChain callback handler attached to the model
+
+Finished spans go through a bounded queue to a background thread, which batches them to the
+configured exporter: a rotating JSONL file, or an OTLP/HTTP collector (JSON encoding, e.g.
+http://localhost:4318/v1/traces). The sampler decides once per trace (always_on, always_off or
+ratio, optionally following the caller's sampled flag). Unsampled spans only propagate IDs.
+"""
+
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from pymongo import monitoring
+from starlette.requests import Request
+
+from src.config import settings
+from src.logger import get_log_context, set_log_field
+from src.metrics import MongoCommandMetrics, _route_template
+
+logger = logging.getLogger(__name__)
+
+TRACING = settings.Tracing
+TRACEPARENT_HEADER = "traceparent"
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str  # 32 hex chars
+    span_id: str   # 16 hex chars
+    sampled: bool
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(header: str | None) -> SpanContext | None:
+    try:
+        version, trace_id, span_id, flags = header.strip().split("-")
+        if len(trace_id) != 32 or len(span_id) != 16 or int(trace_id, 16) == 0:
+            return None
+        return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+    except (AttributeError, ValueError):
+        return None
+
+
+class Span:
+    def __init__(self, name: str, context: SpanContext, parent_id: str | None, kind: str, attributes: dict | None):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: dict[str, Any] = dict(attributes or {})
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: int | None = None
+        self.status = "UNSET"
+        self.status_message = ""
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value: Any):
+        if self.recording and value is not None:
+            self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_time_ns is not None:
+            return
+        self.end_time_ns = time.time_ns()
+        if self.recording:
+            get_processor().on_end(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": datetime.fromtimestamp(self.start_time_ns / 1e9, tz=timezone.utc).isoformat(),
+            "duration_ms": round((self.end_time_ns - self.start_time_ns) / 1e6, 3),
+            "status": self.status,
+            "status_message": self.status_message or None,
+            "attributes": self.attributes,
+            "service": TRACING.SERVICE_NAME,
+        }
+
+
+# ---------------- SAMPLING ----------------
+class Sampler:
+    def __init__(self, mode: str, ratio: float, parent_based: bool):
+        self.mode = mode
+        self.bound = int(max(0.0, min(1.0, ratio)) * (2**64 - 1))
+        self.parent_based = parent_based
+
+    def should_sample(self, trace_id: str, remote_parent: SpanContext | None) -> bool:
+        if remote_parent is not None and self.parent_based:
+            return remote_parent.sampled
+        if self.mode == "always_on":
+            return True
+        if self.mode == "always_off":
+            return False
+        # Deterministic on the trace id, so every service in the trace makes the same call
+        return int(trace_id[-16:], 16) < self.bound
+
+
+# ---------------- EXPORT ----------------
+class JSONLSpanExporter:
+    """One span per line, rotated like the application logs."""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def export(self, spans: list[Span]):
+        for span in spans:
+            self._handler.emit(logging.makeLogRecord({"msg": json.dumps(span.to_dict(), default=str)}))
+
+    def shutdown(self):
+        self._handler.close()
+
+
+class OTLPHTTPExporter:
+    """Posts batches to an OTLP/HTTP collector using the JSON encoding of ExportTraceServiceRequest."""
+
+    KINDS = {"internal": 1, "server": 2, "client": 3}
+    STATUS = {"UNSET": 0, "OK": 1, "ERROR": 2}
+
+    def __init__(self, endpoint: str, timeout: float, headers: dict | None = None):
+        import httpx
+
+        self.endpoint = endpoint
+        self._client = httpx.Client(timeout=timeout, headers=headers or {})
+
+    @staticmethod
+    def _value(value: Any) -> dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _span(self, span: Span) -> dict:
+        return {
+            "traceId": span.context.trace_id,
+            "spanId": span.context.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": self.KINDS.get(span.kind, 1),
+            "startTimeUnixNano": str(span.start_time_ns),
+            "endTimeUnixNano": str(span.end_time_ns),
+            "attributes": [{"key": key, "value": self._value(value)} for key, value in span.attributes.items()],
+            "status": {"code": self.STATUS[span.status], "message": span.status_message},
+        }
+
+    def export(self, spans: list[Span]):
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACING.SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "aichatapp"}, "spans": [self._span(span) for span in spans]}],
+            }]
+        }
+        response = self._client.post(self.endpoint, json=body)
+        response.raise_for_status()
+
+    def shutdown(self):
+        self._client.close()
+
+
+class SpanProcessor:
+    """Bounded queue + background thread that batches finished spans to the exporter; never blocks callers."""
+
+    def __init__(self, exporter, queue_size: int, batch_size: int, interval: float):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._flush_requested = threading.Event()
+        self._flushed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export(self, batch: list[Span]):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning(f"Span export failed ({len(batch)} spans dropped): {e}")
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._export(batch)
+                batch = []
+        if batch:
+            self._export(batch)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(timeout=self.interval)
+            self._flush_requested.clear()
+            self._drain()
+            self._flushed.set()
+        self._drain()
+
+    def force_flush(self, timeout: float = 5.0):
+        self._flushed.clear()
+        self._flush_requested.set()
+        self._flushed.wait(timeout)
+
+    def shutdown(self):
+        self._stopped.set()
+        self._flush_requested.set()
+        self._thread.join(timeout=5)
+        self.exporter.shutdown()
+
+
+_processor: SpanProcessor | None = None
+_processor_lock = threading.Lock()
+_sampler = Sampler(TRACING.SAMPLER, TRACING.SAMPLE_RATIO, TRACING.PARENT_BASED)
+
+
+def build_exporter():
+    if TRACING.EXPORTER == "otlp":
+        return OTLPHTTPExporter(TRACING.OTLP_ENDPOINT, timeout=TRACING.OTLP_TIMEOUT)
+    return JSONLSpanExporter(TRACING.JSONL_FILE, TRACING.MAX_FILE_SIZE, TRACING.MAX_FILE_COUNT)
+
+
+def get_processor() -> SpanProcessor:
+    # Created on first use so each gunicorn worker starts its own exporter thread after the fork
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                _processor = SpanProcessor(
+                    build_exporter(), TRACING.QUEUE_SIZE, TRACING.BATCH_SIZE, TRACING.EXPORT_INTERVAL
+                )
+    return _processor
+
+
+def configure(exporter=None, sampler: Sampler | None = None) -> SpanProcessor:
+    """Replace the exporter and/or sampler (tests, scripts)."""
+    global _processor, _sampler
+    shutdown_tracing()
+    if sampler is not None:
+        _sampler = sampler
+    with _processor_lock:
+        _processor = SpanProcessor(
+            exporter or build_exporter(), TRACING.QUEUE_SIZE, TRACING.BATCH_SIZE, TRACING.EXPORT_INTERVAL
+        )
+    return _processor
+
+
+def shutdown_tracing():
+    global _processor
+    with _processor_lock:
+        processor, _processor = _processor, None
+    if processor is not None:
+        processor.shutdown()
+
+
+atexit.register(shutdown_tracing)
+
+
+# ---------------- SPANS ----------------
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def start_span(
+    name: str,
+    attributes: dict | None = None,
+    kind: str = "internal",
+    parent: Span | None = None,
+    remote_parent: SpanContext | None = None,
+) -> Span:
+    """Create a span (not made current). Children inherit the trace and its sampling decision."""
+    parent = parent if parent is not None else _current_span.get()
+    if parent is not None:
+        context = SpanContext(parent.context.trace_id, secrets.token_hex(8), parent.context.sampled)
+        return Span(name, context, parent.context.span_id, kind, attributes)
+
+    trace_id = remote_parent.trace_id if remote_parent else secrets.token_hex(16)
+    sampled = _sampler.should_sample(trace_id, remote_parent)
+    context = SpanContext(trace_id, secrets.token_hex(8), sampled)
+    return Span(name, context, remote_parent.span_id if remote_parent else None, kind, attributes)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Open a child span of the current one for the duration of the block; a no-op when tracing is off."""
+    if not TRACING.ENABLED:
+        yield None
+        return
+    new_span = start_span(name, attributes, kind)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end()
+
+
+def traced(name: str):
+    """Decorator wrapping an async function in a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------------- INSTRUMENTATION ----------------
+async def trace_requests(request: Request, call_next):
+    """HTTP middleware opening the root span of each request and returning its traceparent."""
+    remote_parent = parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
+    route = _route_template(request)
+    root = start_span(
+        f"{request.method} {route}",
+        {"http.method": request.method, "http.route": route},
+        kind="server",
+        remote_parent=remote_parent,
+    )
+    root.set_attribute("request.id", (get_log_context() or {}).get("request_id"))
+    set_log_field("trace_id", root.context.trace_id)
+
+    token = _current_span.set(root)
+    try:
+        response = await call_next(request)
+    except BaseException as e:
+        # Starlette turns this into a 500 further out; end the span here, or the failed request is never exported
+        root.record_exception(e)
+        root.set_attribute("http.status_code", 500)
+        root.set_attribute("user.id", (get_log_context() or {}).get("user_id"))
+        root.end()
+        raise
+    finally:
+        _current_span.reset(token)
+
+    # user_id is filled in by the auth dependency while the request runs
+    root.set_attribute("user.id", (get_log_context() or {}).get("user_id"))
+
+    root.set_attribute("http.status_code", response.status_code)
+    if response.status_code >= 500:
+        root.status = "ERROR"
+    root.end()  # For streams this is when headers are sent; token generation shows up as later child spans
+    response.headers[TRACEPARENT_HEADER] = root.context.traceparent()
+    return response
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """
+    One client span per MongoDB command, parented to the span active when the command was issued.
+    Motor runs PyMongo on executor threads with the caller's context copied, so the current span is visible here.
+    Commands outside a traced request (warm-up pings, index creation) are not recorded.
+    """
+
+    def __init__(self):
+        self._spans: dict[tuple, Span] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None or not parent.recording or event.command_name in MongoCommandMetrics.IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        new_span = start_span(
+            f"mongo.{event.command_name}",
+            {
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection if isinstance(collection, str) else None,
+            },
+            kind="client",
+            parent=parent,
+        )
+        with self._lock:
+            self._spans[(event.request_id, event.connection_id)] = new_span
+
+    def _finish(self, event, error: str | None = None):
+        with self._lock:
+            finished = self._spans.pop((event.request_id, event.connection_id), None)
+        if finished is None:
+            return
+        if error:
+            finished.status, finished.status_message = "ERROR", error
+        finished.end()
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure))
+
+
+class LLMSpanHandler(BaseCallbackHandler):
+    """LangChain callback handler recording one span per chat model call, with token usage."""
+
+    run_inline = True  # Called in the caller's context, so the node span is the parent
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self._spans: dict[Any, Span] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        parent = _current_span.get()
+        if not TRACING.ENABLED or parent is None:
+            return
+        params = kwargs.get("invocation_params") or {}
+        self._spans[run_id] = start_span(
+            "llm.chat",
+            {
+                "llm.provider": self.provider,
+                "llm.model": params.get("model") or params.get("model_name") or params.get("model_id"),
+                "llm.messages": sum(len(batch) for batch in messages),
+            },
+            kind="client",
+            parent=parent,
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is None:
+            return
+        try:
+            usage = getattr(response.generations[0][0].message, "usage_metadata", None) or {}
+        except (IndexError, AttributeError):
+            usage = {}
+        llm_span.set_attribute("llm.input_tokens", usage.get("input_tokens"))
+        llm_span.set_attribute("llm.output_tokens", usage.get("output_tokens"))
+        llm_span.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is not None:
+            llm_span.record_exception(error)
+            llm_span.end()
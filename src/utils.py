@@ -8,32 +8,30 @@ from email.message import EmailMessage
 
 # Third-party
 import bcrypt
-import yaml
-from dotenv import load_dotenv
 from jose import jwt
 
+# Local
+from src.config import get_settings, settings
 
-# Load configuration from YAML file function
-def load_config(filename="config.yml"):
-    with open("src/config/" + filename, "r") as f:
-        config = yaml.safe_load(f)
-    return config
 
+# Plain-dict view of the shared settings (env overrides applied), for callers that index by key
+def load_config(filename="config.yml") -> dict:
+    return get_settings(filename).model_dump()
 
-# Load environment variables and configuration and set IST timezone
-load_dotenv()
-cfg = load_config()
 
 # Security Configuration
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY") or cfg["Security"]["JWT_SECRET_KEY"]
-ALGORITHM = cfg["Security"]["ALGORITHM"]
-ACCESS_TOKEN_EXPIRE_MINUTES = cfg["Security"]["ACCESS_TOKEN_EXPIRE_MINUTES"]
+JWT_SECRET_KEY = settings.Security.JWT_SECRET_KEY
+ALGORITHM = settings.Security.ALGORITHM
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.Security.ACCESS_TOKEN_EXPIRE_MINUTES
+
+if not JWT_SECRET_KEY:
+    raise RuntimeError("JWT_SECRET_KEY must be set in the environment or in Security.JWT_SECRET_KEY")
 
 # Email Configuration
-SMTP_SERVER = cfg["Email"]["SMTP_SERVER"]
-SMTP_PORT = cfg["Email"]["SMTP_PORT"]
-SENDER_EMAIL = os.getenv("SENDER_EMAIL") or cfg["Email"]["SENDER_EMAIL"]
-SENDER_PASSWORD = os.getenv("SENDER_PASSWORD") or cfg["Email"]["SENDER_PASSWORD"]
+SMTP_SERVER = settings.Email.SMTP_SERVER
+SMTP_PORT = settings.Email.SMTP_PORT
+SENDER_EMAIL = settings.Email.SENDER_EMAIL
+SENDER_PASSWORD = settings.Email.SENDER_PASSWORD
 
 # bcrypt salt generation
 # pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -0,0 +1,64 @@
+"""
+Worker warm-up, run by the app lifespan before the worker starts accepting requests.
+
+Builds the LLM client, primes the MongoDB connection pool and sends a tiny generation so model
+weights are loaded (Ollama, llama.cpp) and the upstream HTTP connection is open before the
+first real user arrives. Each step is timed and logged; failures are logged and, unless
+Warmup.FAIL_ON_ERROR is set, do not stop the worker from starting.
+"""
+
+import asyncio
+import logging
+import time
+
+from langchain_core.messages import HumanMessage
+
+from src.clients.llm_client import get_llm
+from src.config import settings
+from src.database import client as mongo_client
+
+logger = logging.getLogger(__name__)
+
+WARMUP = settings.Warmup
+
+
+async def prime_mongo_pool(connections: int):
+    # Concurrent pings make the driver open that many pooled connections up front
+    await asyncio.gather(*(mongo_client.admin.command("ping") for _ in range(max(1, connections))))
+
+
+async def warm_up_generation(model, prompt: str):
+    await model.ainvoke([HumanMessage(content=prompt)])
+
+
+async def _run_step(name: str, coro, timings: dict):
+    start_time = time.perf_counter()
+    try:
+        await asyncio.wait_for(coro, timeout=WARMUP.TIMEOUT)
+    except Exception as e:
+        if WARMUP.FAIL_ON_ERROR:
+            raise
+        logger.warning(f"Warm-up step '{name}' failed: {e!r}")
+    finally:
+        timings[name] = round((time.perf_counter() - start_time) * 1000, 2)
+
+
+async def warm_up() -> dict:
+    """Run the configured warm-up steps and return their durations in milliseconds."""
+    timings: dict[str, float] = {}
+
+    start_time = time.perf_counter()
+    # Building the model can block (llama.cpp loads the GGUF file), so keep it off the event loop
+    model = await asyncio.to_thread(get_llm)
+    timings["model"] = round((time.perf_counter() - start_time) * 1000, 2)
+
+    if WARMUP.ENABLED:
+        steps = []
+        if WARMUP.MONGO_CONNECTIONS > 0:
+            steps.append(_run_step("mongo", prime_mongo_pool(WARMUP.MONGO_CONNECTIONS), timings))
+        if WARMUP.GENERATION:
+            steps.append(_run_step("generation", warm_up_generation(model, WARMUP.PROMPT), timings))
+        await asyncio.gather(*steps)
+
+    logger.info(f"Worker warm-up finished: {timings}")
+    return timings
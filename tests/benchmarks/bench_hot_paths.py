@@ -0,0 +1,124 @@
+"""
+Micro-benchmarks for per-request hot functions (pytest-benchmark).
+
+Named bench_*.py so the regular test run never collects them; run through scripts/micro_bench.py,
+which records baselines and compares against them.
+    - bench_decode_token: get_current_user token decode and user lookup.
+    - bench_serialize_conversation_1k: Message construction and serialize_conversation for a 1k-turn chat.
+    - bench_parse_response: parse_response for each provider shape.
+    - bench_select_tool_node: keyword routing in select_tool_node.
+    - bench_build_llm_messages: history-to-llm_messages assembly.
+    - bench_sse_event: SSE frame encoding.
+"""
+
+import asyncio
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from bson import ObjectId
+from langchain_core.messages import AIMessage
+
+from src.api_router.chat_router import build_llm_messages, serialize_conversation, serialize_message, sse_event
+from src.deps import get_current_user
+from src.llms.llm_parser import parse_response
+from src.pipelines.nodes import select_tool_node
+from src.utils import create_access_token
+
+TURN_TEXT = "This is a fairly typical chat message with a few sentences of content. " * 4
+
+
+@pytest.fixture(scope="module")
+def event_loop_runner():
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def chat_turns():
+    chat_id = str(ObjectId())
+    now = datetime.now(UTC).isoformat()
+    return [
+        {
+            "_id": ObjectId(),
+            "chat_id": chat_id,
+            "user": TURN_TEXT,
+            "assistant": TURN_TEXT * 3,
+            "input_tokens": 120,
+            "output_tokens": 300,
+            "response_time": 1.5,
+            "timings": {"pipeline": 1500.0, "total": 1520.0},
+            "created_at": now,
+            "seq": seq,
+        }
+        for seq in range(1, 1001)
+    ]
+
+
+def bench_decode_token(benchmark, event_loop_runner):
+    token = create_access_token({"sub": "bench@example.com", "name": "Bench"})
+    user = {"_id": ObjectId(), "email": "bench@example.com"}
+
+    with patch("src.deps.users_collection") as mock_users:
+        mock_users.find_one = AsyncMock(return_value=user)
+        result = benchmark(lambda: event_loop_runner(get_current_user(token)))
+
+    assert result["email"] == "bench@example.com"
+
+
+def bench_serialize_conversation_1k(benchmark, chat_turns):
+    conversation = {
+        "_id": ObjectId(),
+        "user_id": str(ObjectId()),
+        "title": "Benchmark chat",
+        "message_count": len(chat_turns),
+        "created_at": chat_turns[0]["created_at"],
+        "updated_at": chat_turns[-1]["created_at"],
+    }
+
+    def serialize():
+        return serialize_conversation(conversation, messages=[serialize_message(turn) for turn in chat_turns])
+
+    result = benchmark(serialize)
+    assert len(result.messages) == 1000
+
+
+PROVIDER_RESPONSES = {
+    "openai": SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=TURN_TEXT, reasoning_content="thinking"))],
+        usage={"prompt_tokens": 10, "completion_tokens": 20},
+    ),
+    "aws_bedrock": AIMessage(
+        content=[{"type": "reasoning_content", "reasoning_content": {"text": "thinking"}}, {"type": "text", "text": TURN_TEXT}],
+        usage_metadata={"input_tokens": 10, "output_tokens": 20, "total_tokens": 30},
+    ),
+    "ollama": AIMessage(content=TURN_TEXT, response_metadata={"prompt_eval_count": 10, "eval_count": 20}),
+}
+
+
+@pytest.mark.parametrize("provider", list(PROVIDER_RESPONSES))
+def bench_parse_response(benchmark, provider):
+    result = benchmark(parse_response, PROVIDER_RESPONSES[provider], provider)
+    assert TURN_TEXT in result.content
+
+
+def bench_select_tool_node(benchmark, event_loop_runner):
+    def route():
+        state = {"service_name": "chat", "user_input": "Can you explain how transformers process long documents?"}
+        return event_loop_runner(select_tool_node(state))
+
+    result = benchmark(route)
+    assert result["service_name"] == "chat"
+
+
+def bench_build_llm_messages(benchmark, chat_turns):
+    history = chat_turns[-5:]
+    result = benchmark(build_llm_messages, history, "And what about the follow-up question?")
+    assert len(result) == 11
+
+
+def bench_sse_event(benchmark):
+    result = benchmark(sse_event, {"type": "content", "content": "token "})
+    assert result.startswith("data: ")
@@ -0,0 +1,110 @@
+"""
+This file contains test cases for scripts/backfill_message_user_id.py, run against mongomock.
+Unit Tests:
+    - test_backfill_sets_user_id: Turns get their conversation's user_id; conversations without one are skipped.
+    - test_backfill_resumes_after_interruption: A second run continues after the checkpointed conversation.
+    - test_backfill_restart_ignores_checkpoint: --restart walks every conversation again.
+    - test_backfill_dry_run_writes_nothing: --dry-run only counts, and leaves no checkpoint behind.
+"""
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+
+from src.config import settings
+
+mongomock = pytest.importorskip("mongomock")
+
+SCRIPT = Path(__file__).resolve().parent.parent / "scripts" / "backfill_message_user_id.py"
+spec = importlib.util.spec_from_file_location("backfill_message_user_id", SCRIPT)
+backfill_script = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(backfill_script)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(backfill_script.time, "sleep", lambda seconds: None)
+    db = mongomock.MongoClient()["backfill_test"]
+    conversations = db[settings.MongoDB.CHAT_HISTORY_COLLECTION]
+    messages = db[settings.MongoDB.MESSAGES_COLLECTION]
+
+    # Three owned conversations with two old turns each, and one conversation with no owner
+    for owner in ("alice", "bob", "carol", None):
+        conversation = {"_id": ObjectId()}
+        if owner:
+            conversation["user_id"] = owner
+        conversations.insert_one(conversation)
+        messages.insert_many([{"chat_id": str(conversation["_id"]), "seq": seq} for seq in (1, 2)])
+    # A turn written after chat_router started storing user_id is left as it is
+    messages.insert_one({"chat_id": str(conversations.find_one({"user_id": "alice"})["_id"]), "seq": 3, "user_id": "alice"})
+    return db
+
+
+def owners(db) -> dict[str, set]:
+    conversations = {str(c["_id"]): c.get("user_id") for c in db[settings.MongoDB.CHAT_HISTORY_COLLECTION].find()}
+    result = {}
+    for message in db[settings.MongoDB.MESSAGES_COLLECTION].find():
+        result.setdefault(conversations[message["chat_id"]], set()).add(message.get("user_id"))
+    return result
+
+
+def checkpoint(db) -> dict | None:
+    return db["migrations"].find_one({"_id": backfill_script.MIGRATION_ID})
+
+
+def run(db, **overrides):
+    options = {"batch_size": 2, "sleep": 0, "dry_run": False, "restart": False, **overrides}
+    backfill_script.backfill(db, **options)
+
+
+def test_backfill_sets_user_id(db):
+    run(db)
+
+    assert owners(db) == {"alice": {"alice"}, "bob": {"bob"}, "carol": {"carol"}, None: {None}}
+    saved = checkpoint(db)
+    assert saved["conversations"] == 4 and saved["messages"] == 6
+    assert saved["last_conversation_id"] == db[settings.MongoDB.CHAT_HISTORY_COLLECTION].find_one(sort=[("_id", -1)])["_id"]
+
+
+def test_backfill_resumes_after_interruption(db, monkeypatch, capsys):
+    def interrupt(seconds):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(backfill_script.time, "sleep", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        run(db)  # Stopped after the first batch
+
+    first = checkpoint(db)
+    assert first["conversations"] == 2 and first["messages"] == 4
+    assert owners(db)["carol"] == {None}
+
+    monkeypatch.setattr(backfill_script.time, "sleep", lambda seconds: None)
+    run(db)
+
+    assert f"Resuming after conversation {first['last_conversation_id']}" in capsys.readouterr().out
+    assert owners(db)["carol"] == {"carol"}
+    # Counts carry on from the checkpoint: the first batch is not walked again
+    assert checkpoint(db)["conversations"] == 4 and checkpoint(db)["messages"] == 6
+
+
+def test_backfill_restart_ignores_checkpoint(db):
+    run(db)
+    db[settings.MongoDB.MESSAGES_COLLECTION].update_many({}, {"$unset": {"user_id": ""}})
+
+    run(db)  # Nothing after the checkpoint
+    assert owners(db)["alice"] == {None}
+
+    run(db, restart=True)
+    assert owners(db)["alice"] == {"alice"}
+    assert checkpoint(db)["conversations"] == 4 and checkpoint(db)["messages"] == 7
+
+
+def test_backfill_dry_run_writes_nothing(db, capsys):
+    run(db, dry_run=True)
+
+    assert owners(db)["alice"] == {None, "alice"}
+    assert checkpoint(db) is None
+    # The ownerless conversation's turns are not counted, as a real run would skip them
+    assert "4 conversations, 6 messages to update" in capsys.readouterr().out
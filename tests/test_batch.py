@@ -0,0 +1,195 @@
+"""
+This file contains test cases for the batch query API.
+Unit Tests:
+    - test_batch_streams_results_and_bulk_writes: Every input gets one NDJSON line, errors are inline,
+      new conversations are bulk inserted and concurrency stays bounded.
+    - test_batch_size_limit: Oversized batches are rejected.
+    - test_batch_disconnect_keeps_generated_results: After a disconnect, finished and in-flight items
+      are still written and items not started are skipped.
+    - test_batch_disconnect_during_write: A disconnect in the middle of a bulk write neither loses nor repeats it.
+    - test_batch_rolls_back_conversations_without_turns: A failed turn insert removes the conversations just inserted.
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from src.api_router import batch_router
+from src.schemas import BatchRequest, UserInput
+
+USER = {"_id": ObjectId("507f1f77bcf86cd799439011"), "email": "test@example.com"}
+
+
+def empty_cursor():
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = []
+    return cursor
+
+
+def test_batch_streams_results_and_bulk_writes():
+    active, peak = 0, 0
+
+    async def fake_ainvoke(pipeline_input, config=None):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return {"llm_response": f"echo: {pipeline_input['user_input']}", "input_tokens": 3, "output_tokens": 2}
+
+    items = [UserInput(user_query=f"question {i}") for i in range(5)] + [
+        UserInput(user_query="bad service", service_name="unknown"),
+        UserInput(user_query="bad id", conversation_id="not-an-id"),
+        UserInput(user_query="someone else's", conversation_id=str(ObjectId())),
+    ]
+
+    async def run():
+        response = await batch_router.execute_batch(BatchRequest(items=items, concurrency=2), current_user=USER)
+        return [json.loads(line) async for line in response.body_iterator]
+
+    with patch.object(batch_router, "conversations_collection") as conversations, \
+         patch.object(batch_router, "messages_collection") as messages, \
+         patch.object(batch_router, "usage_collection") as usage, \
+         patch.object(batch_router, "pipeline") as pipeline:
+        pipeline.ainvoke = fake_ainvoke
+        conversations.find.return_value = empty_cursor()
+        conversations.insert_many = AsyncMock()
+        messages.insert_many = AsyncMock()
+        usage.update_one = AsyncMock()
+
+        lines = asyncio.run(run())
+
+    assert sorted(line["index"] for line in lines) == list(range(len(items)))
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[5]["status"] == 400 and "not supported" in by_index[5]["error"]
+    assert by_index[6]["status"] == 400
+    assert by_index[7]["status"] == 404
+    assert by_index[0]["status"] == 201 and by_index[0]["message"] == "echo: question 0"
+    assert peak <= 2
+
+    # The five new conversations and their turns are written in bulk, with one usage rollup
+    conversation_docs = [doc for call in conversations.insert_many.call_args_list for doc in call.args[0]]
+    turn_docs = [doc for call in messages.insert_many.call_args_list for doc in call.args[0]]
+    assert len(conversation_docs) == len(turn_docs) == 5
+    assert {str(doc["_id"]) for doc in conversation_docs} == {by_index[i]["conversation_id"] for i in range(5)}
+    assert all(doc["seq"] == 1 and doc["user_id"] == str(USER["_id"]) for doc in turn_docs)
+    rollups = [call.args[1]["$inc"] for call in usage.update_one.call_args_list]
+    assert sum(rollup["turns"] for rollup in rollups) == 5
+    assert sum(rollup["input_tokens"] for rollup in rollups) == 15
+
+
+def test_batch_size_limit():
+    items = [UserInput(user_query="q")] * (batch_router.BATCH.MAX_ITEMS + 1)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(batch_router.execute_batch(BatchRequest(items=items), current_user=USER))
+    assert error.value.status_code == 413
+
+
+def test_batch_disconnect_keeps_generated_results():
+    started = []
+
+    async def fake_ainvoke(pipeline_input, config=None):
+        started.append(pipeline_input["user_input"])
+        await asyncio.sleep(0.05 if pipeline_input["user_input"] == "q0" else 0.01)
+        return {"llm_response": "ok", "input_tokens": 1, "output_tokens": 1}
+
+    items = [UserInput(user_query=f"q{i}") for i in range(6)]
+
+    async def run():
+        response = await batch_router.execute_batch(BatchRequest(items=items, concurrency=2), current_user=USER)
+        body = response.body_iterator
+        await body.__anext__()  # q1 is flushed once the writer's interval passes...
+        await body.aclose()  # ...then the client goes away while q0 and others are generated or running
+        await asyncio.gather(*(task for task in asyncio.all_tasks() if task.get_name() == "batch-finish"))
+
+    batch_settings = batch_router.BATCH.model_copy(update={"WRITE_INTERVAL": 0.015})
+    with patch.object(batch_router, "conversations_collection") as conversations, \
+         patch.object(batch_router, "messages_collection") as messages, \
+         patch.object(batch_router, "usage_collection") as usage, \
+         patch.object(batch_router, "pipeline") as pipeline, \
+         patch.object(batch_router, "BATCH", batch_settings), \
+         patch.object(batch_router, "DISCONNECT_POLICY", "cancel"):
+        pipeline.ainvoke = fake_ainvoke
+        conversations.find.return_value = empty_cursor()
+        conversations.insert_many = AsyncMock()
+        messages.insert_many = AsyncMock()
+        usage.update_one = AsyncMock()
+
+        asyncio.run(run())
+
+    written = [doc["user"] for call in messages.insert_many.call_args_list for doc in call.args[0]]
+    assert sorted(written) == sorted(started)  # Every generated answer is saved, none twice
+    assert "q0" in written  # In flight at the disconnect
+    assert len(started) < len(items)  # Items not started yet are skipped
+
+
+def batch_mocks(conversations, messages, usage, pipeline):
+    async def fake_ainvoke(pipeline_input, config=None):
+        return {"llm_response": "ok", "input_tokens": 1, "output_tokens": 1}
+
+    pipeline.ainvoke = fake_ainvoke
+    conversations.find.return_value = empty_cursor()
+    conversations.insert_many = AsyncMock()
+    conversations.delete_many = AsyncMock()
+    messages.insert_many = AsyncMock()
+    messages.delete_many = AsyncMock()
+    usage.update_one = AsyncMock()
+
+
+def test_batch_disconnect_during_write():
+    items = [UserInput(user_query=f"q{i}") for i in range(4)]
+    writing = asyncio.Event()
+
+    async def slow_insert(docs, ordered=False):
+        writing.set()
+        await asyncio.sleep(0.05)
+
+    async def run():
+        response = await batch_router.execute_batch(BatchRequest(items=items, concurrency=4), current_user=USER)
+        consumer = asyncio.create_task(anext(response.body_iterator))
+        await writing.wait()
+        consumer.cancel()  # The client goes away while the conversations are being inserted
+        await asyncio.gather(consumer, return_exceptions=True)
+        await response.body_iterator.aclose()
+        while pending := [t for t in asyncio.all_tasks() if t.get_name() in ("batch-flush", "batch-finish")]:
+            await asyncio.gather(*pending)
+
+    with patch.object(batch_router, "conversations_collection") as conversations, \
+         patch.object(batch_router, "messages_collection") as messages, \
+         patch.object(batch_router, "usage_collection") as usage, \
+         patch.object(batch_router, "pipeline") as pipeline, \
+         patch.object(batch_router, "DISCONNECT_POLICY", "background"):
+        batch_mocks(conversations, messages, usage, pipeline)
+        conversations.insert_many = AsyncMock(side_effect=slow_insert)
+        asyncio.run(run())
+
+    conversation_docs = [doc for call in conversations.insert_many.call_args_list for doc in call.args[0]]
+    turn_docs = [doc for call in messages.insert_many.call_args_list for doc in call.args[0]]
+    assert sorted(doc["user"] for doc in turn_docs) == [f"q{i}" for i in range(4)]  # Each turn once
+    assert len(conversation_docs) == 4
+
+
+def test_batch_rolls_back_conversations_without_turns():
+    items = [UserInput(user_query=f"q{i}") for i in range(2)]
+
+    async def run():
+        response = await batch_router.execute_batch(BatchRequest(items=items), current_user=USER)
+        return [json.loads(line) async for line in response.body_iterator]
+
+    with patch.object(batch_router, "conversations_collection") as conversations, \
+         patch.object(batch_router, "messages_collection") as messages, \
+         patch.object(batch_router, "usage_collection") as usage, \
+         patch.object(batch_router, "pipeline") as pipeline:
+        batch_mocks(conversations, messages, usage, pipeline)
+        messages.insert_many = AsyncMock(side_effect=RuntimeError("write failed"))
+        lines = asyncio.run(run())
+
+    assert [line["status"] for line in lines] == [500, 500]
+    inserted = [doc["_id"] for call in conversations.insert_many.call_args_list for doc in call.args[0]]
+    deleted = [_id for call in conversations.delete_many.call_args_list for _id in call.args[0]["_id"]["$in"]]
+    assert sorted(map(str, deleted)) == sorted(map(str, inserted))
+    usage.update_one.assert_not_awaited()
@@ -65,6 +65,7 @@ def test_list_conversations(test_client, mock_user_id):
                 "user_id": mock_user_id,
                 "title": "Chat 2",
                 "message_count": 5,
+                "preview": {"user": "And pizza?", "assistant": "Pizza dough wants a hotter oven.", "seq": 5, "total_tokens": 420},
                 "created_at": "2023-01-02",
                 "updated_at": "2023-01-02"
             }
@@ -78,9 +79,40 @@ def test_list_conversations(test_client, mock_user_id):
         assert response.status_code == 200
         assert len(response.json()) == 2
         assert response.json()[0]["message_count"] == 2
+        assert response.json()[0]["preview"] is None
+        assert response.json()[1]["preview"]["assistant"] == "Pizza dough wants a hotter oven."
+        assert response.json()[1]["preview"]["total_tokens"] == 420
         
     app.dependency_overrides = {}
 
+def test_save_turn_updates_preview_with_message_count(mock_user_id):
+    import asyncio
+    from src.api_router import chat_router
+    conversation_id = str(ObjectId())
+
+    with patch.object(chat_router, "conversations_collection") as mock_conversations, \
+         patch.object(chat_router, "messages_collection") as mock_messages, \
+         patch.object(chat_router, "usage_collection") as mock_usage:
+        mock_conversations.find_one_and_update = AsyncMock(return_value={"_id": ObjectId(conversation_id), "message_count": 3})
+        mock_messages.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+        mock_usage.update_one = AsyncMock()
+        asyncio.run(chat_router.save_turn(
+            mock_user_id, conversation_id, "  $where   is\nthis? ", "x" * 500, 10, 20, 0.1, False, None,
+            {"pipeline": 900.0, "persistence": 5.0, "total": 950.0}, None
+        ))
+
+    # One update call carries the counters and the preview
+    mock_conversations.find_one_and_update.assert_awaited_once()
+    stage = mock_conversations.find_one_and_update.call_args.args[1][0]["$set"]
+    preview = stage["preview"]
+    assert preview["seq"] == stage["message_count"]
+    assert preview["user"] == {"$literal": "$where is this?"}
+    assert len(preview["assistant"]["$literal"]) == chat_router.PREVIEW_CHARS
+    assert preview["assistant"]["$literal"].endswith("…")
+    assert mock_messages.insert_one.call_args.args[0]["seq"] == 3
+    # Timings are a snapshot from before persistence; a stale persistence stage is not stored
+    assert mock_messages.insert_one.call_args.args[0]["timings"] == {"pipeline": 900.0, "total": 950.0}
+
 def test_execute_user_query_new_conversation(test_client, mock_user_id):
     from src.api_router.chat_router import get_current_user
     from main import app
@@ -89,21 +121,23 @@ def test_execute_user_query_new_conversation(test_client, mock_user_id):
     # Mock LLM and Database
     with patch("src.api_router.chat_router.conversations_collection") as mock_conv_collection, \
          patch("src.api_router.chat_router.messages_collection") as mock_msg_collection, \
+         patch("src.api_router.chat_router.usage_collection") as mock_usage_collection, \
          patch("src.api_router.chat_router.pipeline") as mock_pipeline, \
-         patch("src.api_router.chat_router.llm_model") as mock_llm_model, \
-         patch("src.api_router.chat_router.cfg", {"Services": {"SUPPORTED_SERVICES": ["chat"]}}): # Mock config
+         patch("src.api_router.chat_router.get_llm") as mock_get_llm, \
+         patch("src.api_router.chat_router.SUPPORTED_SERVICES", ("chat",)): # Mock config
         
         # Mock Title Generation
-        mock_llm_model.ainvoke = AsyncMock(return_value=MagicMock(content="Generated Title"))
+        mock_get_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="Generated Title"))
         
         # Mock Pipeline Response
-        mock_pipeline.ainvoke = AsyncMock(return_value={"llm_response": "Hello User"})
+        mock_pipeline.ainvoke = AsyncMock(return_value={"llm_response": "Hello User", "input_tokens": 12, "output_tokens": 3})
         
         # Mock DB Inserts
         mock_inserted = MagicMock()
         mock_inserted.inserted_id = ObjectId()
         mock_conv_collection.insert_one = AsyncMock(return_value=mock_inserted)
         mock_msg_collection.insert_one = AsyncMock()
+        mock_usage_collection.update_one = AsyncMock()
         
         response = test_client.post("/chat/run_pipeline", json={
             "user_query": "Hello",
@@ -114,9 +148,21 @@ def test_execute_user_query_new_conversation(test_client, mock_user_id):
         json_resp = response.json()
         assert json_resp["message"] == "Hello User"
         assert "conversation_id" in json_resp
+        assert "pipeline;dur=" in response.headers["Server-Timing"]
         
         mock_conv_collection.insert_one.assert_called_once()
         mock_msg_collection.insert_one.assert_called_once()
+
+        # Usage rollups are maintained at write time
+        new_conversation = mock_conv_collection.insert_one.call_args[0][0]
+        assert new_conversation["total_input_tokens"] == 12
+        assert new_conversation["total_output_tokens"] == 3
+        turn_doc = mock_msg_collection.insert_one.call_args[0][0]
+        assert "pipeline" in turn_doc["timings"]
+        assert "persistence" not in turn_doc["timings"]
+        rollup_filter, rollup_update = mock_usage_collection.update_one.call_args[0]
+        assert rollup_filter["user_id"] == mock_user_id
+        assert rollup_update == {"$inc": {"input_tokens": 12, "output_tokens": 3, "turns": 1}}
         
     app.dependency_overrides = {}
 
@@ -195,20 +241,189 @@ def test_delete_conversation(test_client, mock_user_id):
 
     chat_id = ObjectId()
     str_chat_id = str(chat_id)
+    job_id = ObjectId()
 
-    with patch("src.api_router.chat_router.conversations_collection") as mock_conv_collection, \
-         patch("src.api_router.chat_router.messages_collection") as mock_msg_collection:
+    with patch("src.purge.conversations_collection") as mock_conv_collection, \
+         patch("src.api_router.chat_router.job_runner") as mock_runner:
         
         mock_result = MagicMock()
-        mock_result.deleted_count = 1
-        mock_conv_collection.delete_one = AsyncMock(return_value=mock_result)
-        mock_msg_collection.delete_many = AsyncMock()
+        mock_result.modified_count = 1
+        mock_conv_collection.update_many = AsyncMock(return_value=mock_result)
+        mock_runner.submit = AsyncMock(return_value={"_id": job_id})
 
         response = test_client.delete(f"/chat/conversations/{str_chat_id}")
         
-        assert response.status_code == 200
-        assert response.json() == {"message": "Conversation and associated messages deleted successfully"}
-        
-        mock_msg_collection.delete_many.assert_called_once_with({"chat_id": str_chat_id})
+        assert response.status_code == 202
+        assert response.json()["job_id"] == str(job_id)
+
+        # Soft-deleted right away; the messages are left to the purge job
+        query, update = mock_conv_collection.update_many.call_args.args
+        assert query == {"user_id": mock_user_id, "deleted_at": None, "_id": chat_id}
+        assert "deleted_at" in update["$set"]
+        mock_runner.submit.assert_awaited_once_with(mock_user_id, {"conversation_id": str_chat_id}, kind="purge")
+
+        mock_result.modified_count = 0
+        assert test_client.delete(f"/chat/conversations/{str_chat_id}").status_code == 404
 
     app.dependency_overrides = {}
+
+def test_search_offset_is_bounded(test_client, mock_user_id):
+    from src.api_router.chat_router import SEARCH_MAX_OFFSET, get_current_user
+    from src.schemas import SearchResponse
+    from main import app
+    app.dependency_overrides[get_current_user] = mock_get_current_user
+
+    with patch("src.api_router.chat_router.search", AsyncMock(return_value=SearchResponse(query="bread", backend="text", offset=SEARCH_MAX_OFFSET, limit=20))) as mock_search:
+        assert test_client.get("/chat/search", params={"q": "bread", "offset": SEARCH_MAX_OFFSET}).status_code == 200
+        mock_search.assert_awaited_once_with(mock_user_id, "bread", SEARCH_MAX_OFFSET, 20)
+
+        # Deeper pages would rank offset + limit hits per request
+        assert test_client.get("/chat/search", params={"q": "bread", "offset": SEARCH_MAX_OFFSET + 1}).status_code == 422
+        assert mock_search.await_count == 1
+
+    app.dependency_overrides = {}
+
+def test_stream_disconnect_cancels_and_saves_partial(mock_user_id):
+    import asyncio
+    from src.api_router import chat_router
+    from src.background import drain
+    from src.schemas import UserInput
+
+    generation_cancelled = asyncio.Event()
+
+    async def fake_astream_events(*args, **kwargs):
+        try:
+            yield {"event": "on_chat_model_stream", "data": {"chunk": MagicMock(content="Partial")}}
+            await asyncio.sleep(10) # Model is still generating when the client leaves
+            yield {"event": "on_chat_model_stream", "data": {"chunk": MagicMock(content=" never sent")}}
+        except asyncio.CancelledError:
+            generation_cancelled.set()
+            raise
+
+    mock_request = MagicMock()
+    mock_request.is_disconnected = AsyncMock(return_value=True)
+
+    async def run_stream():
+        response = await chat_router.execute_user_query_streaming(
+            UserInput(user_query="Hello", service_name="chat"),
+            mock_request,
+            current_user=await mock_get_current_user(),
+        )
+        frames = [frame async for frame in response.body_iterator]
+        await drain(timeout=1)
+        return frames
+
+    with patch("src.api_router.chat_router.conversations_collection") as mock_conv_collection, \
+         patch("src.api_router.chat_router.messages_collection") as mock_msg_collection, \
+         patch("src.api_router.chat_router.usage_collection") as mock_usage_collection, \
+         patch("src.api_router.chat_router.pipeline") as mock_pipeline, \
+         patch("src.api_router.chat_router.DISCONNECT_POLICY", "cancel"), \
+         patch("src.api_router.chat_router.DISCONNECT_POLL_INTERVAL", 0.01):
+
+        mock_pipeline.astream_events = fake_astream_events
+        mock_inserted = MagicMock()
+        mock_inserted.inserted_id = ObjectId()
+        mock_conv_collection.insert_one = AsyncMock(return_value=mock_inserted)
+        mock_msg_collection.insert_one = AsyncMock()
+        mock_usage_collection.update_one = AsyncMock()
+
+        frames = asyncio.run(run_stream())
+
+        assert len(frames) == 1
+        assert generation_cancelled.is_set()
+        turn_doc = mock_msg_collection.insert_one.call_args[0][0]
+        assert turn_doc["assistant"] == "Partial"
+        assert turn_doc["truncated"] is True
+
+def test_stream_disconnect_background_saves_completed_answer(mock_user_id):
+    import asyncio
+    from src.api_router import chat_router
+    from src.background import drain
+    from src.schemas import UserInput
+
+    async def fake_astream_events(*args, **kwargs):
+        yield {"event": "on_chat_model_stream", "data": {"chunk": MagicMock(content="Partial")}}
+        await asyncio.sleep(0.1) # Model is still generating when the client leaves
+        yield {"event": "on_chat_model_stream", "data": {"chunk": MagicMock(content=" and the rest")}}
+        yield {"event": "on_chain_end", "data": {"output": {"llm_response": "Partial and the rest"}}}
+
+    mock_request = MagicMock()
+    mock_request.is_disconnected = AsyncMock(return_value=True)
+
+    async def run_stream():
+        response = await chat_router.execute_user_query_streaming(
+            UserInput(user_query="Hello", service_name="chat"),
+            mock_request,
+            current_user=await mock_get_current_user(),
+        )
+        frames = [frame async for frame in response.body_iterator]
+        saved_before_drain = mock_msg_collection.insert_one.await_count
+        await drain(timeout=1)
+        return frames, saved_before_drain
+
+    with patch("src.api_router.chat_router.conversations_collection") as mock_conv_collection, \
+         patch("src.api_router.chat_router.messages_collection") as mock_msg_collection, \
+         patch("src.api_router.chat_router.usage_collection") as mock_usage_collection, \
+         patch("src.api_router.chat_router.pipeline") as mock_pipeline, \
+         patch("src.api_router.chat_router.generate_title", AsyncMock(return_value="Title")), \
+         patch("src.api_router.chat_router.DISCONNECT_POLICY", "background"), \
+         patch("src.api_router.chat_router.DISCONNECT_POLL_INTERVAL", 0.01):
+
+        mock_pipeline.astream_events = fake_astream_events
+        mock_conv_collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+        mock_msg_collection.insert_one = AsyncMock()
+        mock_usage_collection.update_one = AsyncMock()
+
+        frames, saved_before_drain = asyncio.run(run_stream())
+
+        # The stream ends with the client, but generation runs on and the whole answer is saved
+        assert len(frames) == 1
+        assert saved_before_drain == 0
+        mock_msg_collection.insert_one.assert_awaited_once()
+        turn_doc = mock_msg_collection.insert_one.call_args[0][0]
+        assert turn_doc["assistant"] == "Partial and the rest"
+        assert turn_doc["truncated"] is False
+
+def test_stream_sends_sources_before_content(mock_user_id):
+    import asyncio
+    import json
+    from src.api_router import chat_router
+    from src.schemas import UserInput
+
+    sources = [{"number": 1, "title": "Example", "url": "https://example.com"}]
+
+    async def fake_astream_events(*args, **kwargs):
+        yield {"event": "on_custom_event", "name": "sources", "data": {"sources": sources}}
+        yield {"event": "on_chat_model_stream", "data": {"chunk": MagicMock(content="Answer [1]")}}
+        yield {"event": "on_chain_end", "data": {"output": {"llm_response": "Answer [1]", "sources": sources}}}
+
+    mock_request = MagicMock()
+    mock_request.is_disconnected = AsyncMock(return_value=False)
+
+    async def run_stream():
+        response = await chat_router.execute_user_query_streaming(
+            UserInput(user_query="Hello", service_name="web_search"),
+            mock_request,
+            current_user=await mock_get_current_user(),
+        )
+        return [frame async for frame in response.body_iterator]
+
+    with patch("src.api_router.chat_router.conversations_collection") as mock_conv_collection, \
+         patch("src.api_router.chat_router.messages_collection") as mock_msg_collection, \
+         patch("src.api_router.chat_router.usage_collection") as mock_usage_collection, \
+         patch("src.api_router.chat_router.pipeline") as mock_pipeline, \
+         patch("src.api_router.chat_router.generate_title", AsyncMock(return_value="Title")):
+
+        mock_pipeline.astream_events = fake_astream_events
+        mock_conv_collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+        mock_msg_collection.insert_one = AsyncMock()
+        mock_usage_collection.update_one = AsyncMock()
+
+        frames = asyncio.run(run_stream())
+
+    events = [json.loads(frame[len("data: "):]) for frame in frames]
+    assert [event["type"] for event in events[:2]] == ["sources", "content"]
+    assert events[0]["sources"] == sources
+    turn_doc = mock_msg_collection.insert_one.call_args[0][0]
+    assert turn_doc["assistant"] == "Answer [1]"
+    assert turn_doc["sources"] == sources
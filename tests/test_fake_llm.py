@@ -0,0 +1,56 @@
+"""
+This file contains test cases for the fake LLM provider.
+Unit Tests:
+    - test_fake_provider_registered: Tests if the factory builds the fake model from config.
+    - test_fake_astream_events: Tests if native streaming produces token events and usage.
+    - test_fake_error_injection: Tests if injected failures are raised.
+    - test_fake_replay: Tests if recorded responses are served by prompt.
+"""
+
+import asyncio
+import json
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from src.llms import FakeChatModel, LLMFactory
+from src.llms.fake import FakeLLMError
+
+
+def test_fake_provider_registered():
+    model = LLMFactory.get_provider("fake").create_model({"TTFT": 0, "TOKENS_PER_SECOND": 0, "RESPONSE_TOKENS_MEAN": 5})
+    assert isinstance(model, FakeChatModel)
+    assert model.response_tokens_mean == 5
+
+def test_fake_astream_events():
+    model = FakeChatModel(ttft=0, tokens_per_second=0, response_tokens_mean=8, response_tokens_stddev=0)
+
+    async def collect():
+        chunks, final = [], None
+        async for event in model.astream_events([HumanMessage(content="Hi")], version="v2"):
+            if event["event"] == "on_chat_model_stream" and event["data"]["chunk"].content:
+                chunks.append(event["data"]["chunk"].content)
+            elif event["event"] == "on_chat_model_end":
+                final = event["data"]["output"]
+        return chunks, final
+
+    chunks, final = asyncio.run(collect())
+    assert len(chunks) == 8
+    assert final.content == "".join(chunks)
+    assert final.usage_metadata["output_tokens"] == 8
+
+def test_fake_error_injection():
+    model = FakeChatModel(ttft=0, tokens_per_second=0, error_rate=1.0)
+    with pytest.raises(FakeLLMError):
+        asyncio.run(model.ainvoke([HumanMessage(content="Hi")]))
+
+def test_fake_replay(tmp_path):
+    replay_file = tmp_path / "replay.jsonl"
+    replay_file.write_text(
+        json.dumps({"prompt": "What is 2+2?", "response": "It is 4.", "usage": {"input_tokens": 9, "output_tokens": 3}}) + "\n"
+    )
+    model = FakeChatModel(ttft=0, tokens_per_second=0, replay_file=str(replay_file))
+
+    response = asyncio.run(model.ainvoke([HumanMessage(content="What is 2+2?")]))
+    assert response.content == "It is 4."
+    assert response.usage_metadata["input_tokens"] == 9
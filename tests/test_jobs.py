@@ -0,0 +1,235 @@
+"""
+This file contains test cases for async chat jobs.
+Unit Tests:
+    - test_job_runs_in_background: A submitted job is claimed atomically, run and marked succeeded.
+    - test_job_claimed_elsewhere_is_skipped: A job another worker already claimed is not run twice.
+    - test_shutdown_requeues_running_jobs: Jobs still running at shutdown go back to the queue.
+    - test_recover_requeues_stale_jobs: Jobs with a stale heartbeat are requeued and queued jobs are claimed.
+    - test_purges_do_not_take_query_slots: A running purge leaves the query slots free.
+    - test_submit_job_validates_before_queuing: Bad input is rejected up front; good input answers with the job.
+    - test_job_events_stream_until_finished: The SSE channel sends each status change and closes when the job ends.
+    - test_wait_for_change_cleans_up: Subscribers are woken by notify and leave nothing behind, notified or not.
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException, Response
+
+from src import jobs
+from src.api_router import job_router
+from src.schemas import UserInput
+
+USER = {"_id": ObjectId("507f1f77bcf86cd799439011"), "email": "test@example.com"}
+USER_ID = str(USER["_id"])
+JOB_ID = ObjectId()
+RESULT = {"conversation_id": str(ObjectId()), "message": "42", "sources": []}
+
+
+def job_doc(status: str = "queued", **fields) -> dict:
+    job = jobs.job_document(USER_ID, UserInput(user_query="think hard", service_name="thinking").model_dump())
+    job.update({"_id": JOB_ID, "status": status, "created_at": "2025-01-01T00:00:00+00:00", **fields})
+    return job
+
+
+def mock_jobs_collection(collection):
+    collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id=JOB_ID))
+    collection.find_one_and_update = AsyncMock(return_value=job_doc("running", attempts=1))
+    collection.update_one = AsyncMock(return_value=MagicMock(matched_count=1))
+    collection.update_many = AsyncMock(return_value=MagicMock(modified_count=0))
+    return collection
+
+
+def updates_by_status(collection) -> dict:
+    return {c.args[1]["$set"]["status"]: c for c in collection.update_one.call_args_list if "status" in c.args[1]["$set"]}
+
+
+def test_job_runs_in_background():
+    runner = jobs.JobRunner()
+
+    async def run():
+        job = await runner.submit(USER_ID, UserInput(user_query="think hard", service_name="thinking").model_dump())
+        await asyncio.gather(*runner._running.values())
+        return job
+
+    run_job = AsyncMock(return_value=RESULT)
+    with patch.object(jobs, "jobs_collection") as collection, \
+         patch.dict(jobs.JOB_KINDS, {"query": (run_job, jobs.JOBS.MAX_RUNTIME)}):
+        mock_jobs_collection(collection)
+        job = asyncio.run(run())
+
+    assert job["_id"] == JOB_ID and job["status"] == "queued"
+    claim_filter, claim = collection.find_one_and_update.call_args.args
+    assert claim_filter == {"_id": JOB_ID, "status": "queued"}
+    assert claim["$set"]["status"] == "running" and claim["$inc"] == {"attempts": 1}
+    run_job.assert_awaited_once()
+
+    finished = updates_by_status(collection)["succeeded"]
+    assert finished.args[0]["worker_id"] == jobs.worker_id()
+    assert finished.args[1]["$set"]["result"] == RESULT
+    assert "expire_at" in finished.args[1]["$set"]
+
+
+def test_job_claimed_elsewhere_is_skipped():
+    runner = jobs.JobRunner()
+
+    async def run():
+        runner.schedule(str(JOB_ID))
+        await asyncio.gather(*runner._running.values())
+
+    run_job = AsyncMock()
+    with patch.object(jobs, "jobs_collection") as collection, \
+         patch.dict(jobs.JOB_KINDS, {"query": (run_job, jobs.JOBS.MAX_RUNTIME)}):
+        mock_jobs_collection(collection).find_one_and_update.return_value = None
+        asyncio.run(run())
+
+    run_job.assert_not_awaited()
+    collection.update_one.assert_not_awaited()
+
+
+def test_shutdown_requeues_running_jobs():
+    runner = jobs.JobRunner()
+
+    async def slow_job(job):
+        await asyncio.sleep(60)
+
+    async def run():
+        runner.schedule(str(JOB_ID))
+        await asyncio.sleep(0.01)
+        await runner.stop(timeout=0.05)
+
+    with patch.object(jobs, "jobs_collection") as collection, \
+         patch.dict(jobs.JOB_KINDS, {"query": (slow_job, jobs.JOBS.MAX_RUNTIME)}):
+        mock_jobs_collection(collection)
+        asyncio.run(run())
+
+    requeue = updates_by_status(collection)["queued"]
+    assert requeue.args[0] == {"_id": JOB_ID, "status": "running", "worker_id": jobs.worker_id()}
+    assert requeue.args[1]["$inc"] == {"attempts": -1}
+    assert "succeeded" not in updates_by_status(collection)
+
+
+def test_recover_requeues_stale_jobs():
+    runner = jobs.JobRunner()
+    queued = [{"_id": ObjectId()}, {"_id": ObjectId()}]
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.__aiter__.return_value = queued
+
+    no_purges = MagicMock()
+    no_purges.sort.return_value = no_purges
+    no_purges.limit.return_value = no_purges
+    no_purges.__aiter__.return_value = []
+
+    with patch.object(jobs, "jobs_collection") as collection, patch.object(runner, "schedule") as schedule:
+        mock_jobs_collection(collection).find.side_effect = [cursor, no_purges]
+        collection.update_many.return_value = MagicMock(modified_count=1)
+        asyncio.run(runner.recover())
+
+    give_up, requeue = collection.update_many.call_args_list
+    assert give_up.args[0]["attempts"] == {"$gte": jobs.JOBS.MAX_ATTEMPTS}
+    assert give_up.args[1]["$set"]["status"] == "failed"
+    assert requeue.args[0]["status"] == "running" and "$lt" in requeue.args[0]["heartbeat_at"]
+    assert requeue.args[1]["$set"]["status"] == "queued"
+    cursor.limit.assert_called_once_with(jobs.JOBS.CONCURRENCY)
+    assert [c.args[0] for c in collection.find.call_args_list] == [
+        {"status": "queued", "kind": "query"}, {"status": "queued", "kind": "purge"},
+    ]
+    assert [c.args for c in schedule.call_args_list] == [(str(job["_id"]), "query") for job in queued]
+
+
+def test_purges_do_not_take_query_slots():
+    runner = jobs.JobRunner()
+    purge_ids = [str(ObjectId()) for _ in range(3)]
+    started = []
+
+    async def slow_purge(job):
+        started.append("purge")
+        await asyncio.sleep(60)
+
+    async def run():
+        for job_id in purge_ids:
+            runner.schedule(job_id, "purge")
+        runner.schedule(str(JOB_ID))
+        await asyncio.sleep(0.05)
+        await runner.stop(timeout=0)
+
+    query_job = AsyncMock(side_effect=lambda job: started.append("query"))
+    with patch.object(jobs, "jobs_collection") as collection, \
+         patch.dict(jobs.JOB_KINDS, {"query": (query_job, jobs.JOBS.MAX_RUNTIME), "purge": (slow_purge, None)}):
+        mock_jobs_collection(collection).find_one_and_update.side_effect = lambda query, update, **kwargs: job_doc(
+            "running", _id=query["_id"], kind="purge" if str(query["_id"]) in purge_ids else "query"
+        )
+        runner._slots = {kind: asyncio.Semaphore(1) for kind in ("query", "purge")}
+        asyncio.run(run())
+
+    assert sorted(started) == ["purge", "query"]  # One purge at a time, and the query still ran
+
+
+def test_submit_job_validates_before_queuing():
+    submit = AsyncMock(return_value=job_doc())
+
+    with patch.object(job_router.job_runner, "submit", submit), \
+         patch.object(job_router, "conversations_collection") as conversations:
+        conversations.find_one = AsyncMock(return_value=None)
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(job_router.submit_job(UserInput(user_query="q", service_name="unknown"), Response(), current_user=USER))
+        assert error.value.status_code == 400
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(job_router.submit_job(
+                UserInput(user_query="q", conversation_id=str(ObjectId())), Response(), current_user=USER
+            ))
+        assert error.value.status_code == 404
+        submit.assert_not_awaited()
+
+        response = Response()
+        status = asyncio.run(job_router.submit_job(
+            UserInput(user_query="think hard", service_name="thinking"), response, current_user=USER
+        ))
+
+    assert status.id == str(JOB_ID) and status.status == "queued"
+    assert response.headers["Location"] == f"/chat/jobs/{JOB_ID}"
+
+
+def test_job_events_stream_until_finished():
+    states = [
+        job_doc("queued"),
+        job_doc("running", attempts=1),
+        job_doc("running", attempts=1),  # Unchanged: no frame
+        job_doc("succeeded", attempts=1, result=RESULT),
+    ]
+
+    async def run():
+        response = await job_router.job_status_events(str(JOB_ID), current_user=USER)
+        return [frame async for frame in response.body_iterator]
+
+    with patch.object(job_router, "jobs_collection") as collection, \
+         patch.object(job_router.job_runner, "wait_for_change", AsyncMock()):
+        collection.find_one = AsyncMock(side_effect=states)
+        frames = asyncio.run(run())
+
+    events = [json.loads(frame.removeprefix("data: ")) for frame in frames]
+    assert [event["job"]["status"] for event in events] == ["queued", "running", "succeeded"]
+    assert events[-1]["job"]["result"]["message"] == "42"
+
+
+def test_wait_for_change_cleans_up():
+    runner = jobs.JobRunner()
+
+    async def run():
+        # Two subscribers to a job in this worker, one to a job running elsewhere that is never notified
+        local = [asyncio.create_task(runner.wait_for_change("local", timeout=5)) for _ in range(2)]
+        remote = asyncio.create_task(runner.wait_for_change("remote", timeout=0.01))
+        await asyncio.sleep(0)
+        assert len(runner._changed["local"]) == 2
+        runner.notify("local")
+        await asyncio.wait_for(asyncio.gather(*local, remote), timeout=1)
+
+    asyncio.run(run())
+    assert runner._changed == {}
@@ -0,0 +1,335 @@
+"""
+This file contains test cases for the llama.cpp generation worker and the shared sidecar.
+Unit Tests:
+    - test_worker_streams_tokens_and_usage: The in-process chat model streams tokens and reports usage.
+    - test_worker_runs_slots_in_parallel: Concurrent prompts are spread across PARALLEL slots.
+    - test_worker_rejects_when_queue_full: A full queue fails fast instead of growing without bound.
+    - test_worker_cancels_on_early_exit: Abandoning a stream stops its generation.
+    - test_prefix_cache_reuses_conversation_state: A follow-up turn restores the conversation's KV state.
+    - test_prefix_cache_is_bounded: The cache evicts least recently used conversations.
+    - test_prefix_cache_counts_resident_prefix: A match the context already holds is not counted as reuse.
+    - test_prefix_cache_scope_ends_on_failure: A failed generation does not leave its conversation on the slot.
+    - test_conversation_id_reaches_worker: Run metadata scopes the cache through the pipeline.
+    - test_sidecar_streams_tokens_and_usage: Tokens stream over the socket and usage arrives at the end.
+    - test_sidecar_ping: The readiness probe answers once the server is listening.
+    - test_sidecar_reports_errors: A failed generation surfaces as GenerationError on the client.
+    - test_sidecar_cancels_queued_request_on_disconnect: A worker closing its connection drops its queued generation.
+    - test_socket_path_ignores_working_directory: Relative socket paths resolve against the project root.
+"""
+
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from src.llms.llamacpp_cache import PrefixStateCache
+from src.llms.llamacpp_sidecar import ROOT_DIR, ChatLlamaCppSidecar, SidecarServer, ping, socket_path
+from src.llms.llamacpp_worker import (
+    ChatLlamaCppWorker,
+    GenerationError,
+    GenerationRequest,
+    GenerationWorker,
+    WorkerBusyError,
+)
+
+
+class FakeLlama:
+    """Stands in for llama_cpp.Llama's streaming chat completion."""
+
+    def __init__(self, tokens, fail=False, delay=0.0):
+        self.tokens = tokens
+        self.fail = fail
+        self.delay = delay
+        self.n_tokens = 0
+        self.calls = []
+        self.emitted = 0
+
+    def create_chat_completion(self, messages, stream, **options):
+        self.calls.append((messages, options))
+        if self.fail:
+            raise RuntimeError("model exploded")
+
+        def chunks():
+            self.n_tokens = 7
+            for token in self.tokens:
+                time.sleep(self.delay)
+                self.n_tokens += 1
+                self.emitted += 1
+                yield {"choices": [{"delta": {"content": token}}]}
+
+        return chunks()
+
+
+class CachingLlama(FakeLlama):
+    """Mimics Llama's use of its cache hook: load the longest cached prefix, evaluate the rest, save."""
+
+    def __init__(self, tokens):
+        super().__init__(tokens)
+        self.cache = None
+        self.evaluated = []
+
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def create_chat_completion(self, messages, stream, **options):
+        prompt_tokens = [ord(char) for message in messages for char in message["content"]]
+        reused = 0
+        try:
+            state = self.cache[prompt_tokens]
+            reused = len(state.input_ids)
+        except KeyError:
+            pass
+        self.evaluated.append(len(prompt_tokens) - reused)
+
+        def chunks():
+            for token in self.tokens:
+                yield {"choices": [{"delta": {"content": token}}]}
+            completion = [ord(char) for token in self.tokens for char in token]
+            self.n_tokens = len(prompt_tokens) + len(self.tokens)
+            self.cache[prompt_tokens + completion] = SavedState(prompt_tokens + completion)
+
+        return chunks()
+
+
+class SavedState:
+    def __init__(self, input_ids):
+        self.input_ids = input_ids
+        self.llama_state_size = 100
+
+
+def make_worker(llms, **config):
+    models = iter(llms)
+    return GenerationWorker(lambda n_threads: next(models), {"PARALLEL": len(llms), "N_THREADS": 4, **config})
+
+
+def test_worker_streams_tokens_and_usage():
+    model = ChatLlamaCppWorker(worker=make_worker([FakeLlama(["Hello", " there", "!"])], MAX_TOKENS=64))
+
+    async def run():
+        chunks = [chunk async for chunk in model.astream([HumanMessage(content="Hi")])]
+        return chunks, await model.ainvoke([HumanMessage(content="Hi")])
+
+    chunks, final = asyncio.run(run())
+    assert "".join(chunk.content for chunk in chunks) == "Hello there!"
+    assert final.usage_metadata == {"input_tokens": 7, "output_tokens": 3, "total_tokens": 10}
+    assert model.worker.slots[0].llm.calls[0][1]["max_tokens"] == 64
+    assert model.invoke([HumanMessage(content="Hi")]).content == "Hello there!"
+
+
+def test_worker_runs_slots_in_parallel():
+    llms = [FakeLlama(["a", "b"], delay=0.05), FakeLlama(["a", "b"], delay=0.05)]
+    model = ChatLlamaCppWorker(worker=make_worker(llms))
+
+    async def run():
+        start_time = time.perf_counter()
+        await asyncio.gather(*(model.ainvoke([HumanMessage(content="Hi")]) for _ in range(2)))
+        return time.perf_counter() - start_time
+
+    elapsed = asyncio.run(run())
+    assert [len(llm.calls) for llm in llms] == [1, 1]
+    assert elapsed < 0.18  # Two 0.1 s generations overlapped
+
+
+def test_worker_rejects_when_queue_full():
+    release = threading.Event()
+
+    class BlockingLlama(FakeLlama):
+        def create_chat_completion(self, messages, stream, **options):
+            release.wait()
+            return super().create_chat_completion(messages, stream, **options)
+
+    llm = BlockingLlama(["a"])
+    model = ChatLlamaCppWorker(worker=make_worker([llm], MAX_QUEUE=1))
+
+    async def run():
+        running = asyncio.create_task(model.ainvoke([HumanMessage(content="1")]))
+        await asyncio.sleep(0.05)  # Slot is now busy
+        queued = asyncio.create_task(model.ainvoke([HumanMessage(content="2")]))
+        await asyncio.sleep(0.01)
+        with pytest.raises(WorkerBusyError):
+            await model.ainvoke([HumanMessage(content="3")])
+        release.set()
+        await asyncio.gather(running, queued)
+
+    asyncio.run(run())
+
+
+def test_worker_cancels_on_early_exit():
+    llm = FakeLlama([str(i) for i in range(50)], delay=0.01)
+    worker = make_worker([llm])
+
+    async def run():
+        async for event in worker.stream([{"role": "user", "content": "Hi"}]):
+            break
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert llm.emitted < 50
+
+
+def test_prefix_cache_reuses_conversation_state():
+    llm = CachingLlama(["ok"])
+    worker = make_worker([llm], PREFIX_CACHE={"ENABLED": True})
+
+    async def turn(conversation_id, *contents):
+        messages = [{"role": "user", "content": content} for content in contents]
+        return [event async for event in worker.stream(messages, conversation_id=conversation_id)]
+
+    async def run():
+        await turn("c1", "hello")
+        await turn("c1", "hello", "ok", "more")  # Follow-up: history + previous answer + new message
+        await turn("c2", "hello", "ok", "more")  # Same text, other conversation: no reuse
+
+    asyncio.run(run())
+    assert llm.evaluated == [5, 4, 11]
+    stats = worker.stats()["prefix_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["tokens_reused"] == 7
+    assert stats["entries"] == 2  # One (latest) state per conversation
+
+
+def test_prefix_cache_is_bounded():
+    cache = PrefixStateCache(max_entries=2, max_bytes=250)
+    for conversation_id in ("a", "b", "c"):
+        cache.begin(conversation_id)
+        cache[[1, 2, 3]] = SavedState([1, 2, 3])
+    assert len(cache) == 2
+    assert cache.cache_size == 200
+
+    cache.begin("a")  # Evicted as least recently used
+    with pytest.raises(KeyError):
+        cache[[1, 2, 3, 4]]
+    cache.begin("c")
+    assert cache[[1, 2, 3, 4]].input_ids == [1, 2, 3]
+
+
+def test_prefix_cache_counts_resident_prefix():
+    cache = PrefixStateCache()
+    llm = FakeLlama([])
+    llm.input_ids = []
+    cache.begin("a", llm)
+    cache[[1, 2, 3]] = SavedState([1, 2, 3])
+
+    llm.input_ids = [1, 2, 3]  # The slot just generated this turn, so its context holds the prefix
+    cache.begin("a", llm)
+    cache[[1, 2, 3, 4]]
+    llm.input_ids = [9]  # Another conversation ran on the slot since
+    cache.begin("a", llm)
+    cache[[1, 2, 3, 4]]
+
+    stats = cache.stats()
+    assert (stats["resident"], stats["hits"], stats["tokens_reused"]) == (1, 1, 3)
+
+
+def test_prefix_cache_scope_ends_on_failure():
+    llm = FakeLlama([], fail=True)
+    llm.set_cache = lambda cache: None
+    worker = make_worker([llm], PREFIX_CACHE={"ENABLED": True})
+    request = GenerationRequest([{"role": "user", "content": "Hi"}], {}, lambda event: None, "c1")
+
+    with pytest.raises(RuntimeError):
+        worker._generate(worker.slots[0], request)  # On this thread, which stands in for the slot's
+    assert worker.prefix_cache._request.conversation_id is None
+
+
+def test_conversation_id_reaches_worker():
+    from langchain_core.runnables import RunnableLambda
+
+    llm = FakeLlama(["ok"])
+    model = ChatLlamaCppWorker(worker=make_worker([llm]))
+    seen = []
+    original_stream = model.worker.stream
+
+    def recording_stream(messages, params=None, conversation_id=None):
+        seen.append(conversation_id)
+        return original_stream(messages, params, conversation_id)
+
+    model.worker.stream = recording_stream
+
+    async def node(state):
+        # Nodes call the shared model without passing config, as in src/pipelines/nodes.py
+        return await model.ainvoke([HumanMessage(content=state)])
+
+    asyncio.run(RunnableLambda(node).ainvoke("Hi", config={"metadata": {"conversation_id": "abc"}}))
+    assert seen == ["abc"]
+
+
+async def with_sidecar(tmp_path, llm, action):
+    path = str(tmp_path / "llamacpp.sock")
+    server = SidecarServer(make_worker([llm], MAX_TOKENS=64, TEMPERATURE=0.5))
+    unix_server = await asyncio.start_unix_server(server.handle, path=path)
+    try:
+        return await action(path)
+    finally:
+        unix_server.close()
+        await unix_server.wait_closed()
+
+
+def test_sidecar_streams_tokens_and_usage(tmp_path):
+    llm = FakeLlama(["Hello", " there", "!"])
+
+    async def action(path):
+        model = ChatLlamaCppSidecar(socket_path=path, max_tokens=16)
+        chunks = [chunk async for chunk in model.astream([SystemMessage(content="Be brief"), HumanMessage(content="Hi")])]
+        return chunks, await model.ainvoke([HumanMessage(content="Hi")])
+
+    chunks, final = asyncio.run(with_sidecar(tmp_path, llm, action))
+
+    assert "".join(chunk.content for chunk in chunks) == "Hello there!"
+    assert final.content == "Hello there!"
+    assert final.usage_metadata["input_tokens"] == 7
+    assert final.usage_metadata["output_tokens"] == 3
+
+    messages, options = llm.calls[0]
+    assert messages == [{"role": "system", "content": "Be brief"}, {"role": "user", "content": "Hi"}]
+    assert options["max_tokens"] == 16  # Client parameters override the sidecar defaults
+    assert options["temperature"] == 0.5
+
+
+def test_sidecar_ping(tmp_path):
+    async def action(path):
+        return await asyncio.to_thread(ping, path)
+
+    assert asyncio.run(with_sidecar(tmp_path, FakeLlama([]), action)) is True
+    assert ping(str(tmp_path / "missing.sock")) is False
+
+
+def test_sidecar_reports_errors(tmp_path):
+    async def action(path):
+        return await ChatLlamaCppSidecar(socket_path=path).ainvoke([HumanMessage(content="Hi")])
+
+    with pytest.raises(GenerationError):
+        asyncio.run(with_sidecar(tmp_path, FakeLlama([], fail=True), action))
+
+
+def test_sidecar_cancels_queued_request_on_disconnect(tmp_path):
+    llm = FakeLlama(["a", "b", "c"], delay=0.05)
+    request = b'{"type": "generate", "messages": [{"role": "user", "content": "Hi"}]}\n'
+
+    async def action(path):
+        # The only slot is busy with the first request; the second waits in the queue and is abandoned
+        _, busy = await asyncio.open_unix_connection(path)
+        busy.write(request)
+        await asyncio.sleep(0.02)
+        _, abandoned = await asyncio.open_unix_connection(path)
+        abandoned.write(request)
+        await asyncio.sleep(0.02)
+        abandoned.close()
+        await asyncio.sleep(0.4)
+        busy.close()
+
+    asyncio.run(with_sidecar(tmp_path, llm, action))
+    assert len(llm.calls) == 1
+
+
+def test_socket_path_ignores_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    assert ROOT_DIR == Path(__file__).resolve().parent.parent
+    assert socket_path({}) == str(ROOT_DIR / "run" / "llamacpp.sock")
+    assert socket_path({"SIDECAR": {"SOCKET_PATH": "var/sidecar.sock"}}) == str(ROOT_DIR / "var" / "sidecar.sock")
+    assert socket_path({"SIDECAR": {"SOCKET_PATH": str(tmp_path / "abs.sock")}}) == str(tmp_path / "abs.sock")
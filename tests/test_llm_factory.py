@@ -0,0 +1,64 @@
+"""
+This file contains test cases for the lazy LLM provider registry.
+Unit Tests:
+    - test_unused_sdks_not_imported_at_startup: Importing the app loads only the configured provider's SDK.
+    - test_get_provider: Providers resolve by name on first use.
+    - test_get_provider_unsupported: Unknown providers raise ValueError.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src.llms import BaseLLMProvider, LLMFactory
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Top-level SDK modules behind each non-default provider
+PROVIDER_SDKS = [
+    "langchain_ollama",
+    "langchain_openai",
+    "openai",
+    "langchain_aws",
+    "boto3",
+    "langchain_groq",
+    "langchain_nvidia_ai_endpoints",
+    "langchain_google_genai",
+    "langchain_huggingface",
+    "langchain_community",
+    "llama_cpp",
+]
+
+
+def test_unused_sdks_not_imported_at_startup():
+    # A fresh interpreter, since this test session has already imported whatever other tests needed
+    script = (
+        "import json, sys\n"
+        "import main\n"
+        f"print(json.dumps([name for name in {PROVIDER_SDKS!r} if name in sys.modules]))\n"
+    )
+    env = {
+        **os.environ,
+        "AICHATAPP__LLM__PROVIDER": "fake",
+        "JWT_SECRET_KEY": os.environ.get("JWT_SECRET_KEY") or "test-secret",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+def test_get_provider():
+    provider = LLMFactory.get_provider("FAKE")
+    assert isinstance(provider, BaseLLMProvider)
+    assert type(provider).__name__ == "FakeProvider"
+
+
+def test_get_provider_unsupported():
+    with pytest.raises(ValueError):
+        LLMFactory.get_provider("unknown")
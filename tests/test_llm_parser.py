@@ -0,0 +1,34 @@
+"""
+This file contains test cases for the LLM response parser.
+Unit Tests:
+    - test_extract_usage_*: Tests token usage extraction for each provider shape, and the local estimate fallback.
+"""
+
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.llms.llm_parser import extract_usage
+
+
+def test_extract_usage_standard_metadata():
+    response = AIMessage(content="Hi", usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12})
+    assert extract_usage(response) == {"input_tokens": 10, "output_tokens": 2, "estimated": False}
+
+def test_extract_usage_openai_token_usage():
+    response = AIMessage(content="Hi", response_metadata={"token_usage": {"prompt_tokens": 7, "completion_tokens": 5}})
+    assert extract_usage(response) == {"input_tokens": 7, "output_tokens": 5, "estimated": False}
+
+def test_extract_usage_ollama_counts():
+    response = AIMessage(content="Hi", response_metadata={"prompt_eval_count": 30, "eval_count": 4})
+    assert extract_usage(response) == {"input_tokens": 30, "output_tokens": 4, "estimated": False}
+
+def test_extract_usage_raw_openai_object():
+    response = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=3, completion_tokens=8))
+    assert extract_usage(response) == {"input_tokens": 3, "output_tokens": 8, "estimated": False}
+
+def test_extract_usage_estimates_when_missing():
+    usage = extract_usage(AIMessage(content="a" * 40), [HumanMessage(content="b" * 80)])
+    assert usage["estimated"] is True
+    assert usage["output_tokens"] == 10
+    assert usage["input_tokens"] > 20
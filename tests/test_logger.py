@@ -0,0 +1,69 @@
+"""
+This file contains test cases for the queue-based logging setup.
+Unit Tests:
+    - test_json_formatter_fields: JSON lines carry request ID, user ID and latency.
+    - test_queue_drop_policies: A full queue drops new or oldest records instead of blocking.
+    - test_prepare_keeps_traceback: Exceptions survive the hop to the listener thread.
+    - test_request_id_header: Requests get an X-Request-ID, and a client-supplied one is echoed.
+"""
+
+import json
+import logging
+import queue
+import sys
+
+from src.logger import BoundedQueueHandler, JSONFormatter, RequestContextFilter, _log_context
+
+
+def make_record(msg="hello %s", args=("world",), exc_info=None, **extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_fields():
+    token = _log_context.set({"request_id": "req-1", "user_id": "user-1"})
+    try:
+        record = make_record(latency_ms=12.5)
+        RequestContextFilter().filter(record)
+    finally:
+        _log_context.reset(token)
+
+    payload = json.loads(JSONFormatter().format(record))
+    assert payload["message"] == "hello world"
+    assert payload["request_id"] == "req-1"
+    assert payload["user_id"] == "user-1"
+    assert payload["latency_ms"] == 12.5
+
+
+def test_queue_drop_policies():
+    drop_new = BoundedQueueHandler(queue.Queue(maxsize=2), drop_policy="drop_new")
+    drop_oldest = BoundedQueueHandler(queue.Queue(maxsize=2), drop_policy="drop_oldest")
+    for handler in (drop_new, drop_oldest):
+        for index in range(3):
+            handler.handle(make_record(msg=f"record {index}", args=()))
+
+    assert [drop_new.queue.get_nowait().msg for _ in range(2)] == ["record 0", "record 1"]
+    assert [drop_oldest.queue.get_nowait().msg for _ in range(2)] == ["record 1", "record 2"]
+    assert drop_new.dropped == drop_oldest.dropped == 1
+
+
+def test_prepare_keeps_traceback():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(msg="failed", args=(), exc_info=sys.exc_info())
+
+    prepared = BoundedQueueHandler(queue.Queue()).prepare(record)
+    assert prepared.exc_info is None
+    assert prepared.msg == "failed"
+    assert "ValueError: boom" in logging.Formatter("%(message)s").format(prepared)
+    assert "ValueError: boom" in json.loads(JSONFormatter().format(prepared))["exc_info"]
+
+
+def test_request_id_header(test_client):
+    response = test_client.get("/docs")
+    assert response.headers["X-Request-ID"]
+
+    response = test_client.get("/docs", headers={"X-Request-ID": "client-id"})
+    assert response.headers["X-Request-ID"] == "client-id"
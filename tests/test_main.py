@@ -9,3 +9,27 @@ def test_app_title(test_client):
 
 
 
+def test_metrics_endpoint(test_client):
+    test_client.get("/docs")
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/docs",status="200"}' in response.text
+    assert "chat_streams_in_flight" in response.text
+
+
+def test_ready_only_after_warmup():
+    from unittest.mock import AsyncMock, patch
+    from starlette.testclient import TestClient
+    from main import app
+
+    with patch("src.lifespan.ensure_indexes", AsyncMock()), \
+         patch("src.lifespan.warm_up", AsyncMock(return_value={"model": 1.0})) as mock_warm_up:
+        client = TestClient(app)
+        assert client.get("/health/ready").status_code == 503
+        assert client.get("/health/live").status_code == 200
+
+        with client:  # Runs the lifespan
+            mock_warm_up.assert_awaited_once()
+            response = client.get("/health/ready")
+            assert response.status_code == 200
+            assert response.json()["warmup_ms"] == {"model": 1.0}
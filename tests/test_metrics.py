@@ -0,0 +1,121 @@
+"""
+This file contains test cases for the Prometheus metrics.
+Unit Tests:
+    - test_mongo_command_metrics: Commands are timed per collection and operation; housekeeping is ignored.
+    - test_request_latency_labels: Requests are labelled by route template and status; /metrics is not recorded.
+    - test_prepare_multiprocess_dir: Stale worker files are removed and the directory is exported for the workers.
+    - test_metrics_response_exposes_histograms: The scrape output includes the hot-path histograms.
+"""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src import metrics
+from src.metrics import MULTIPROC_ENV, MongoCommandMetrics, metrics_response, prepare_multiprocess_dir, track_request_latency
+
+
+def sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_mongo_command_metrics():
+    listener = MongoCommandMetrics()
+    labels = {"collection": "metrics_test_chats", "operation": "find"}
+    count, total = sample("mongo_operation_duration_seconds_count", labels), sample("mongo_operation_duration_seconds_sum", labels)
+
+    find = SimpleNamespace(command_name="find", command={"find": "metrics_test_chats"}, request_id=1, connection_id=("h", 1))
+    failed_find = SimpleNamespace(**{**vars(find), "request_id": 2})
+    ping = SimpleNamespace(command_name="ping", command={"ping": 1}, request_id=3, connection_id=("h", 1))
+    listener.started(find)
+    listener.started(failed_find)
+    listener.started(ping)
+    listener.succeeded(SimpleNamespace(**vars(find), duration_micros=250_000))
+    listener.failed(SimpleNamespace(**vars(failed_find), duration_micros=50_000))
+    listener.succeeded(SimpleNamespace(**vars(ping), duration_micros=1_000))
+
+    assert sample("mongo_operation_duration_seconds_count", labels) == count + 2
+    assert sample("mongo_operation_duration_seconds_sum", labels) - total == pytest.approx(0.3)
+    assert sample("mongo_operation_duration_seconds_count", {"collection": "", "operation": "ping"}) == 0
+    assert listener._collections == {}  # Nothing is left behind for finished commands
+
+
+def test_request_latency_labels():
+    app = FastAPI()
+
+    @app.get("/metrics_test/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    @app.get("/metrics_test/boom")
+    async def boom():
+        raise RuntimeError("kaboom")
+
+    app.add_api_route("/metrics", metrics_response)
+    app.middleware("http")(track_request_latency)
+
+    def count(route: str, status: str) -> float:
+        return sample("http_request_duration_seconds_count", {"method": "GET", "route": route, "status": status})
+
+    before = {
+        "item": count("/metrics_test/items/{item_id}", "200"),
+        "boom": count("/metrics_test/boom", "500"),
+        "unmatched": count("unmatched", "404"),
+        "metrics": count("/metrics", "200"),
+    }
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.get("/metrics_test/items/1").status_code == 200
+    assert client.get("/metrics_test/items/2").status_code == 200
+    assert client.get("/metrics_test/boom").status_code == 500
+    assert client.get("/metrics_test/missing").status_code == 404
+    assert client.get("/metrics").status_code == 200
+
+    # One series per route template, not per path
+    assert count("/metrics_test/items/{item_id}", "200") == before["item"] + 2
+    assert count("/metrics_test/items/1", "200") == 0
+    assert count("/metrics_test/boom", "500") == before["boom"] + 1
+    assert count("unmatched", "404") == before["unmatched"] + 1
+    assert count("/metrics", "200") == before["metrics"]
+
+
+def test_prepare_multiprocess_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv(MULTIPROC_ENV, raising=False)
+    path = tmp_path / "prometheus"
+    path.mkdir()
+    (path / "histogram_1234.db").write_bytes(b"stale")
+    (path / "README").write_text("kept")
+
+    monkeypatch.chdir(tmp_path)
+    prepare_multiprocess_dir("prometheus")
+
+    assert sorted(os.listdir(path)) == ["README"]
+    assert os.environ[MULTIPROC_ENV] == str(path)
+
+    prepare_multiprocess_dir(str(tmp_path / "new"))  # Created when missing
+    assert (tmp_path / "new").is_dir()
+
+
+def test_metrics_response_exposes_histograms(monkeypatch):
+    monkeypatch.delenv(MULTIPROC_ENV, raising=False)
+    metrics.observe_generation("fake", "chat", output_tokens=20, generation_time=0.5)
+
+    response = metrics_response(None)
+    text = response.body.decode()
+
+    assert response.media_type.startswith("text/plain")
+    for name in (
+        "http_request_duration_seconds",
+        "llm_time_to_first_token_seconds",
+        "llm_output_tokens_per_second",
+        "pipeline_node_duration_seconds",
+        "mongo_operation_duration_seconds",
+        "web_page_fetch_duration_seconds",
+        "llamacpp_queue_wait_seconds",
+        "llamacpp_phase_duration_seconds",
+    ):
+        assert f"# TYPE {name} histogram" in text
+    assert 'llm_output_tokens_per_second_bucket{le="40.0",provider="fake",service="chat"}' in text
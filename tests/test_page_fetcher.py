@@ -0,0 +1,186 @@
+"""
+This file contains test cases for deep-search page fetching.
+Unit Tests:
+    - test_extract_main_text: Boilerplate is dropped and the article body is kept.
+    - test_cache_and_revalidation: Fresh pages come from the cache; stale ones are revalidated with ETags.
+    - test_limits_and_budget: Per-host concurrency is bounded (with no semaphores kept for idle hosts), bodies are capped and slow pages miss the deadline.
+    - test_busy_host_leaves_global_slots_free: Pages waiting on one host do not block other hosts.
+    - test_blocks_internal_addresses: Non-public hosts, other schemes and redirects into them are never requested.
+    - test_best_passages: Only the passages relevant to the query are kept, in page order.
+"""
+
+import asyncio
+import ipaddress
+import time
+
+import httpx
+
+from src.config import settings
+from src.pipelines.page_fetcher import PageCache, PageFetcher, extract_main_text
+from src.pipelines.web_context import best_passages
+
+ARTICLE = b"""
+<html><head><script>var tracking = 1;</script><style>p { color: red }</style></head>
+<body>
+  <nav><li>Home and a very long navigation entry that should never be extracted</li></nav>
+  <article>
+    <h1>Monsoon arrives early in Kerala this year</h1>
+    <p>The India Meteorological Department confirmed the onset of the monsoon over Kerala on Friday.</p>
+    <p>Short.</p>
+  </article>
+  <footer><p>Copyright notice and a long list of links that are not part of the content.</p></footer>
+</body></html>
+"""
+
+
+def make_fetcher(handler, **overrides) -> PageFetcher:
+    config = settings.WebSearch.DEEP_SEARCH.model_copy(update=overrides)
+    fetcher = PageFetcher(PageCache(max_entries=8, ttl=60), config)
+    fetcher.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    fetcher.resolve = fake_resolve
+    return fetcher
+
+
+async def fake_resolve(host: str, port: int) -> list[str]:
+    # Test hosts resolve to a public documentation address unless they are IP literals
+    if host == "internal.example":
+        return ["10.0.0.5"]
+    try:
+        return [str(ipaddress.ip_address(host))]
+    except ValueError:
+        return ["93.184.216.34"]
+
+
+def test_extract_main_text():
+    text = extract_main_text(ARTICLE, max_chars=10000)
+    assert text.splitlines() == [
+        "Monsoon arrives early in Kerala this year",
+        "The India Meteorological Department confirmed the onset of the monsoon over Kerala on Friday.",
+    ]
+    assert extract_main_text(b"", max_chars=100) == ""
+
+
+def test_cache_and_revalidation():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=ARTICLE, headers={"content-type": "text/html", "etag": '"v1"'})
+
+    async def run():
+        fetcher = make_fetcher(handler)
+        first = await fetcher.fetch("https://news.example/monsoon")
+        cached = await fetcher.fetch("https://news.example/monsoon")
+        fetcher.cache.get("https://news.example/monsoon").validated_at -= 3600  # Stale
+        revalidated = await fetcher.fetch("https://news.example/monsoon")
+        await fetcher.aclose()
+        return first, cached, revalidated
+
+    first, cached, revalidated = asyncio.run(run())
+    assert "Meteorological" in first and first == cached == revalidated
+    assert len(requests) == 2
+    assert requests[1].headers["if-none-match"] == '"v1"'
+
+
+def test_limits_and_budget():
+    active = {"slow.example": 0}
+    peak = {"slow.example": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if host == "slow.example":
+            active[host] += 1
+            peak[host] = max(peak[host], active[host])
+            await asyncio.sleep(0.2)
+            active[host] -= 1
+        if host == "big.example":
+            return httpx.Response(200, content=b"<p>" + b"x" * 5000 + b"</p>", headers={"content-type": "text/html"})
+        if host == "pdf.example":
+            return httpx.Response(200, content=b"%PDF", headers={"content-type": "application/pdf"})
+        return httpx.Response(200, content=ARTICLE, headers={"content-type": "text/html"})
+
+    async def run():
+        fetcher = make_fetcher(handler, PER_HOST_CONCURRENCY=1, MAX_PAGE_BYTES=1000, PAGE_TIMEOUT=5)
+        urls = [f"https://slow.example/{i}" for i in range(3)] + [
+            "https://fast.example/a", "https://big.example/b", "https://pdf.example/c", "ftp://ignored.example/d",
+        ]
+        started = time.monotonic()
+        pages = await fetcher.fetch_all(urls, deadline=started + 0.3)
+        elapsed = time.monotonic() - started
+        hosts = dict(fetcher._hosts)
+        await fetcher.aclose()
+        return pages, elapsed, hosts
+
+    pages, elapsed, hosts = asyncio.run(run())
+    assert elapsed < 0.6
+    assert hosts == {}  # Finished and cancelled fetches leave no per-host semaphores behind
+    assert peak["slow.example"] == 1
+    assert "https://fast.example/a" in pages
+    assert len(pages["https://big.example/b"]) <= 1000
+    assert "https://pdf.example/c" not in pages
+    # One request per host at a time: only the first slow page fits in the budget
+    assert sum(url.startswith("https://slow.example") for url in pages) == 1
+
+
+def test_busy_host_leaves_global_slots_free():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "slow.example":
+            await asyncio.sleep(0.5)
+        return httpx.Response(200, content=ARTICLE, headers={"content-type": "text/html"})
+
+    async def run():
+        fetcher = make_fetcher(handler, MAX_CONCURRENCY=2, PER_HOST_CONCURRENCY=1, PAGE_TIMEOUT=5)
+        urls = [f"https://slow.example/{i}" for i in range(3)] + ["https://fast.example/a"]
+        pages = await fetcher.fetch_all(urls, deadline=time.monotonic() + 0.3)
+        await fetcher.aclose()
+        return pages
+
+    assert list(asyncio.run(run())) == ["https://fast.example/a"]
+
+
+def test_blocks_internal_addresses():
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        if request.url.path == "/to-metadata":
+            return httpx.Response(302, headers={"location": "http://169.254.169.254/latest/meta-data/"})
+        if request.url.path == "/to-article":
+            return httpx.Response(301, headers={"location": "/article"})
+        if request.url.path == "/loop":
+            return httpx.Response(302, headers={"location": "/loop"})
+        return httpx.Response(200, content=ARTICLE, headers={"content-type": "text/html"})
+
+    async def run():
+        fetcher = make_fetcher(handler, MAX_REDIRECTS=3)
+        results = {
+            url: await fetcher.fetch(url)
+            for url in (
+                "http://127.0.0.1:8000/admin", "http://[::ffff:127.0.0.1]/", "http://internal.example/",
+                "file:///etc/passwd", "https://news.example/to-metadata", "https://news.example/to-article",
+                "https://news.example/loop",
+            )
+        }
+        await fetcher.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert "Meteorological" in results.pop("https://news.example/to-article")
+    assert set(results.values()) == {None}
+    assert requested == [
+        "https://news.example/to-metadata",
+        "https://news.example/to-article", "https://news.example/article",
+    ] + ["https://news.example/loop"] * 4
+
+
+def test_best_passages():
+    text = "\n".join([
+        "Cookie banner text about accepting all the cookies on this website before reading further on.",
+        "The monsoon reached Kerala on Friday, three days ahead of its normal onset date of June first.",
+        "Subscribe to our newsletter for more stories delivered to your inbox every single morning today.",
+    ])
+    passages = best_passages("when did the monsoon reach kerala", text, max_tokens=30, passage_words=10)
+    assert passages.startswith("The monsoon reached Kerala")
+    assert "newsletter" not in passages and "Cookie" not in passages
@@ -0,0 +1,78 @@
+"""
+This file contains test cases for background conversation purges.
+Unit Tests:
+    - test_purge_deletes_in_chunks: Messages and conversations are deleted in bounded chunks, with progress on the job.
+    - test_no_turns_saved_to_deleted_conversations: A turn finishing after its conversation was deleted is not saved.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from src import purge
+from src.api_router import chat_router
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+
+def cursor_of(docs: list[dict]):
+    cursor = MagicMock()
+    cursor.limit.return_value = cursor
+    cursor.__aiter__.return_value = docs
+    return cursor
+
+
+def test_purge_deletes_in_chunks():
+    conversations = [{"_id": ObjectId()} for _ in range(3)]
+    messages = [{"_id": ObjectId()} for _ in range(5)]
+    job = {"_id": ObjectId(), "user_id": USER_ID, "worker_id": "w1", "input": {"conversation_id": None}}
+    deletion = purge.DELETION.model_copy(update={"CHUNK_SIZE": 2, "CONVERSATION_CHUNK_SIZE": 2, "THROTTLE": 0})
+
+    with patch.object(purge, "conversations_collection") as conversation_store, \
+         patch.object(purge, "messages_collection") as message_store, \
+         patch.object(purge, "jobs_collection") as job_store, \
+         patch.object(purge, "DELETION", deletion):
+        # Each find returns the next chunk, as the previous one has been deleted by then
+        conversation_store.find.side_effect = [cursor_of(conversations[:2]), cursor_of(conversations[2:]), cursor_of([])]
+        message_store.find.side_effect = [
+            cursor_of(messages[:2]), cursor_of(messages[2:4]), cursor_of([]),  # First conversation chunk
+            cursor_of(messages[4:]), cursor_of([]),                            # Second
+        ]
+        conversation_store.count_documents = AsyncMock(return_value=3)
+        conversation_store.delete_many = AsyncMock(side_effect=lambda query: MagicMock(deleted_count=len(query["_id"]["$in"])))
+        message_store.delete_many = AsyncMock(side_effect=lambda query: MagicMock(deleted_count=len(query["_id"]["$in"])))
+        job_store.update_one = AsyncMock()
+
+        asyncio.run(purge.purge_conversations(job))
+
+    query = conversation_store.find.call_args.args[0]
+    assert query == {"user_id": USER_ID, "deleted_at": {"$ne": None}}
+    assert [len(c.args[0]["_id"]["$in"]) for c in message_store.delete_many.call_args_list] == [2, 2, 1]
+    assert [len(c.args[0]["_id"]["$in"]) for c in conversation_store.delete_many.call_args_list] == [2, 1]
+    assert message_store.find.call_args_list[0].args[0] == {"chat_id": {"$in": [str(c["_id"]) for c in conversations[:2]]}}
+
+    assert all(c.args[0] == {"_id": job["_id"], "worker_id": "w1"} for c in job_store.update_one.call_args_list)
+    progress = [c.args[1] for c in job_store.update_one.call_args_list]
+    assert progress[0] == {"$set": {"progress.conversations_total": 3}}
+    assert sum(update["$inc"].get("progress.messages_deleted", 0) for update in progress[1:]) == 5
+    assert sum(update["$inc"].get("progress.conversations_deleted", 0) for update in progress[1:]) == 3
+
+
+def test_no_turns_saved_to_deleted_conversations():
+    conversation_id = str(ObjectId())
+
+    with patch.object(chat_router, "conversations_collection") as conversations, \
+         patch.object(chat_router, "messages_collection") as messages:
+        conversations.find_one_and_update = AsyncMock(return_value=None)
+        messages.insert_one = AsyncMock()
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(chat_router._save_turn(
+                USER_ID, conversation_id, "hi", "hello", 1, 1, 0.1, False, None, None, None
+            ))
+
+    assert error.value.status_code == 404
+    messages.insert_one.assert_not_awaited()
+    assert conversations.find_one_and_update.call_args.args[0] == {"_id": ObjectId(conversation_id), "deleted_at": None}
@@ -0,0 +1,152 @@
+"""
+This file contains test cases for conversation search.
+Unit Tests:
+    - test_snippet_highlights: The snippet is the window with the most matches, with their character ranges.
+    - test_local_index_search: The local backend ranks turns and titles, skips deleted conversations and pages.
+    - test_index_turn_updates_loaded_index: Inserted turns are added to a user's loaded index.
+    - test_text_backend_excludes_deleted_conversations: The $text query leaves out soft-deleted conversations' turns and titles are only read for the page.
+    - test_purged_conversations_leave_the_index: Purged turns are dropped from a loaded index.
+    - test_auto_backend_falls_back_to_local: Without a MongoDB text index, search switches to the local index.
+"""
+
+import asyncio
+from collections import OrderedDict
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from src import search
+
+USER_ID = "507f1f77bcf86cd799439011"
+LIVE, OTHER, DELETED = (str(ObjectId()) for _ in range(3))
+
+TURNS = [
+    {"_id": ObjectId(), "chat_id": LIVE, "seq": 1, "user": "How do I bake sourdough bread?",
+     "assistant": "Feed the starter, mix flour and water, then bake the sourdough at 250C.", "created_at": "2025-01-01T10:00:00+00:00"},
+    {"_id": ObjectId(), "chat_id": LIVE, "seq": 2, "user": "And pizza?",
+     "assistant": "Pizza dough wants a hotter oven.", "created_at": "2025-01-01T10:05:00+00:00"},
+    {"_id": ObjectId(), "chat_id": DELETED, "seq": 1, "user": "sourdough again",
+     "assistant": "Sourdough sourdough sourdough.", "created_at": "2025-01-02T09:00:00+00:00"},
+]
+
+
+def cursor_of(docs: list[dict]):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.__aiter__.return_value = docs
+    return cursor
+
+
+def find_turns(query, projection=None):
+    if "_id" in query:
+        return cursor_of([turn for turn in TURNS if turn["_id"] in query["_id"]["$in"]])
+    return cursor_of(TURNS)
+
+
+def find_conversations(titles: list[dict]):
+    def find(query, projection=None):
+        if "deleted_at" in query and query["deleted_at"] is not None:
+            return cursor_of([{"_id": ObjectId(DELETED)}])
+        if "_id" in query:
+            return cursor_of([title for title in titles if title["_id"] in query["_id"]["$in"]])
+        return cursor_of([] if "$text" in query else titles)
+    return find
+
+
+def test_snippet_highlights():
+    text = ("Filler words about nothing in particular. " * 10) + "The sourdough starter needs feeding daily. " + ("More filler. " * 10)
+    snippet, highlights = search.snippet(text, ["sourdough", "feed"], max_chars=80)
+
+    assert snippet.startswith("…") and snippet.endswith("…") and len(snippet) <= 82
+    assert [snippet[start:end] for start, end in highlights] == ["sourdough", "feeding"]
+    assert search.snippet("short text", ["missing"], max_chars=80) == ("short text", [])
+
+
+def test_local_index_search():
+    titles = [{"_id": ObjectId(LIVE), "title": "Baking bread"}, {"_id": ObjectId(OTHER), "title": "Sourdough questions"}]
+
+    async def run():
+        first = await search.search(USER_ID, "sourdough", offset=0, limit=1)
+        second = await search.search(USER_ID, "sourdough", offset=1, limit=1)
+        return first, second
+
+    with patch.object(search, "_backend", "local"), patch.object(search, "_indexes", OrderedDict()), \
+         patch.object(search, "conversations_collection") as conversations, \
+         patch.object(search, "messages_collection") as messages:
+        conversations.find.side_effect = find_conversations(titles)
+        messages.find.side_effect = find_turns
+        first, second = asyncio.run(run())
+
+    assert first.backend == "local" and first.has_more
+    results = first.results + second.results
+    assert {(r.kind, r.conversation_id) for r in results} == {("turn", LIVE), ("title", OTHER)}
+    assert not second.has_more  # The deleted conversation's turn is not counted
+
+    turn = next(r for r in results if r.kind == "turn")
+    assert turn.seq == 1 and turn.title == "Baking bread" and turn.matched_in == "assistant"
+    assert all(turn.snippet[start:end].lower() == "sourdough" for start, end in turn.highlights)
+
+
+def test_index_turn_updates_loaded_index():
+    index = search.InvertedIndex()
+    index.add(TURNS[0])
+
+    with patch.object(search, "_indexes", OrderedDict({USER_ID: index})):
+        search.index_turn({**TURNS[1], "user_id": USER_ID})
+        search.index_turn({**TURNS[2], "user_id": "someone-else"})
+
+    assert [turn_id for turn_id, _ in index.search(["pizza"])] == [str(TURNS[1]["_id"])]
+    assert index.indexed_until == TURNS[1]["created_at"]
+    assert len(index.turns) == 2
+
+
+def test_text_backend_excludes_deleted_conversations():
+    titles = [{"_id": ObjectId(LIVE), "title": "Baking bread"}]
+    turn = {**TURNS[0], "score": 1.5}
+
+    with patch.object(search, "_backend", "text"), \
+         patch.object(search, "conversations_collection") as conversations, \
+         patch.object(search, "messages_collection") as messages:
+        conversations.find.side_effect = find_conversations(titles)
+        messages.find.side_effect = lambda query, projection: cursor_of([turn])
+        response = asyncio.run(search.search(USER_ID, "sourdough", offset=0, limit=10))
+
+    text_query = messages.find.call_args_list[0].args[0]
+    assert text_query["chat_id"] == {"$nin": [DELETED]}
+    assert [r.conversation_id for r in response.results] == [LIVE]
+    assert response.results[0].title == "Baking bread"
+    # Titles are read for the page only, never for all of the user's conversations
+    title_reads = [call.args[0] for call in conversations.find.call_args_list if "title" in (call.args[1] or {})]
+    assert all("$text" in query or "_id" in query for query in title_reads)
+
+
+def test_purged_conversations_leave_the_index():
+    index = search.InvertedIndex()
+    for turn in TURNS:
+        index.add(turn)
+
+    with patch.object(search, "_indexes", OrderedDict({USER_ID: index})):
+        search.forget_conversations(USER_ID, [DELETED])
+        search.forget_conversations("someone-else", [LIVE])
+
+    assert {chat_id for chat_id, _ in index.turns.values()} == {LIVE}
+    assert index.total_length == sum(length for _, length in index.turns.values())
+    assert all(str(TURNS[2]["_id"]) not in posting for posting in index.postings.values())
+    assert [turn_id for turn_id, _ in index.search(["sourdough"])] == [str(TURNS[0]["_id"])]
+
+
+def test_auto_backend_falls_back_to_local():
+    text_hits = AsyncMock(side_effect=OperationFailure("text index required for $text query", code=27))
+    local_hits = AsyncMock(return_value=[])
+
+    with patch.object(search, "_backend", "auto"), \
+         patch.object(search, "text_hits", text_hits), patch.object(search, "local_hits", local_hits), \
+         patch.object(search, "conversations_collection") as conversations:
+        conversations.find.return_value = cursor_of([])
+        response = asyncio.run(search.search(USER_ID, "sourdough", offset=0, limit=10))
+        assert search._backend == "local"
+
+    assert response.backend == "local"
+    local_hits.assert_awaited_once()
@@ -0,0 +1,63 @@
+"""
+This file contains test cases for the typed settings module.
+Unit Tests:
+    - test_settings_are_typed: YAML values are validated into typed fields.
+    - test_settings_are_immutable: Settings cannot be mutated at runtime.
+    - test_env_overrides: AICHATAPP__ and secret env vars override config.yml.
+    - test_unsupported_provider_rejected: An unknown LLM provider fails validation.
+    - test_settings_cached: get_settings() parses the file once per process.
+    - test_settings_independent_of_cwd: config.yml is found from any working directory.
+"""
+
+import pydantic
+import pytest
+
+from src.config import get_settings, settings
+from src.config.settings import Settings, apply_env_overrides, read_config_file
+
+
+def test_settings_are_typed():
+    assert isinstance(settings.FastAPI.PORT, int)
+    assert isinstance(settings.FastAPI.WORKERS, int)
+    assert isinstance(settings.Services.SUPPORTED_SERVICES, tuple)
+
+
+def test_settings_are_immutable():
+    with pytest.raises(pydantic.ValidationError):
+        settings.FastAPI.PORT = 1
+    config = settings.LLM.provider_config()
+    config["MODEL"] = "changed"
+    assert settings.LLM.provider_config().get("MODEL") != "changed"
+
+
+def test_env_overrides():
+    raw = read_config_file()
+    provider = raw["LLM"]["Provider"]
+    overridden = Settings.model_validate(apply_env_overrides(raw, {
+        "AICHATAPP__FASTAPI__WORKERS": "7",
+        "AICHATAPP__llm__provider": "fake",
+        "JWT_SECRET_KEY": "from-env",
+    }))
+    assert overridden.FastAPI.WORKERS == 7
+    assert overridden.LLM.Provider == "fake"
+    assert overridden.Security.JWT_SECRET_KEY == "from-env"
+    # The cached raw config is left untouched
+    assert read_config_file()["LLM"]["Provider"] == provider
+
+
+def test_unsupported_provider_rejected():
+    with pytest.raises(pydantic.ValidationError):
+        Settings.model_validate(apply_env_overrides(read_config_file(), {"AICHATAPP__LLM__PROVIDER": "nope"}))
+
+
+def test_settings_cached():
+    assert get_settings() is get_settings()
+
+
+def test_settings_independent_of_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    read_config_file.cache_clear()
+    try:
+        assert "FastAPI" in read_config_file()
+    finally:
+        read_config_file.cache_clear()
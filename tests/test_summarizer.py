@@ -0,0 +1,87 @@
+"""
+This file contains test cases for rolling conversation summaries.
+Unit Tests:
+    - test_fold_schedule: Folding starts once FOLD_BATCH turns have left the recent window.
+    - test_history_window_without_summaries: With summaries off, prompts keep the previous five-turn window.
+    - test_prompt_uses_summary: The summary leads the prompt and history skips the turns it covers.
+    - test_update_summary_folds_turns: Older turns are summarized and summary_seq advances with a compare-and-set.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from bson import ObjectId
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from src import summarizer
+from src.api_router.chat_router import build_llm_messages, load_history
+from src.config import settings
+
+
+def mock_cursor(items):
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = items
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    return cursor
+
+
+def test_fold_schedule():
+    recent, batch = settings.Summary.RECENT_TURNS, settings.Summary.FOLD_BATCH
+    assert summarizer.history_limit() == recent + batch - 1
+    assert not summarizer.needs_summary(recent + batch - 1, None)
+    assert summarizer.needs_summary(recent + batch, None)
+    # Already folded up to the window: wait for another full batch
+    assert not summarizer.needs_summary(recent + batch + 1, batch)
+    assert summarizer.needs_summary(recent + 2 * batch, batch)
+
+
+def test_history_window_without_summaries():
+    disabled = settings.Summary.model_copy(update={"ENABLED": False})
+    with patch.object(summarizer, "SUMMARY", disabled):
+        assert summarizer.history_limit() == 5
+        assert not summarizer.needs_summary(100, None)
+
+
+def test_prompt_uses_summary():
+    messages = build_llm_messages([{"user": "u5", "assistant": "a5"}], "new question", summary="User is planning a trip.")
+    assert isinstance(messages[0], SystemMessage)
+    assert "User is planning a trip." in messages[0].content
+    assert [m.content for m in messages[1:]] == ["u5", "a5", "new question"]
+    assert not isinstance(build_llm_messages([], "hi")[0], SystemMessage)
+
+    with patch("src.api_router.chat_router.messages_collection") as messages_collection:
+        messages_collection.find.return_value = mock_cursor([{"seq": 6}, {"seq": 5}])
+        turns = asyncio.run(load_history("chat-1", {"summary": "s", "summary_seq": 4}))
+
+    query = messages_collection.find.call_args.args[0]
+    assert query == {"chat_id": "chat-1", "seq": {"$gt": 4}}
+    assert [turn["seq"] for turn in turns] == [5, 6]
+
+
+def test_update_summary_folds_turns():
+    conversation_id = str(ObjectId())
+    recent, batch = settings.Summary.RECENT_TURNS, settings.Summary.FOLD_BATCH
+    latest = recent + batch
+    turns = [{"seq": seq, "user": f"u{seq}", "assistant": f"a{seq}"} for seq in range(1, batch + 1)]
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(return_value=AIMessage(content="  The user asked about things.  "))
+
+    with patch.object(summarizer, "conversations_collection") as conversations, \
+         patch.object(summarizer, "messages_collection") as messages, \
+         patch.object(summarizer, "get_llm", return_value=llm):
+        conversations.find_one = AsyncMock(return_value={"_id": ObjectId(conversation_id), "message_count": latest})
+        conversations.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+        messages.find.return_value = mock_cursor(turns)
+
+        asyncio.run(summarizer.update_summary(conversation_id))
+
+    assert messages.find.call_args.args[0] == {"chat_id": conversation_id, "seq": {"$gt": 0, "$lte": latest - recent}}
+    prompt = llm.ainvoke.call_args.args[0]
+    assert isinstance(prompt[1], HumanMessage) and "u1" in prompt[1].content
+
+    query, update = conversations.update_one.call_args.args
+    assert query == {"_id": ObjectId(conversation_id), "summary_seq": None}
+    assert update["$set"]["summary"] == "The user asked about things."
+    assert update["$set"]["summary_seq"] == batch
+    assert conversation_id not in summarizer._folding
@@ -0,0 +1,166 @@
+"""
+This file contains test cases for request tracing.
+Unit Tests:
+    - test_spans_nest_and_export: Child spans share the trace and point at their parent.
+    - test_sampler: Ratio sampling is deterministic per trace and follows a remote parent's flag.
+    - test_middleware_continues_traceparent: The root span continues the caller's trace and returns it.
+    - test_middleware_ends_root_span_on_error: A request whose route raises is still exported, as an error.
+    - test_mongo_and_llm_spans: Mongo commands and chat model calls become children of the active span.
+    - test_jsonl_exporter: Spans are written one JSON object per line.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import HumanMessage
+
+from src import tracing
+from src.config import settings
+from src.llms.fake import FakeChatModel
+from src.tracing import (
+    JSONLSpanExporter,
+    LLMSpanHandler,
+    MongoCommandTracer,
+    Sampler,
+    SpanContext,
+    parse_traceparent,
+    span,
+    start_span,
+    trace_requests,
+    traced,
+)
+
+
+class MemoryExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING", settings.Tracing.model_copy(update={"ENABLED": True}))
+    monkeypatch.setattr(tracing, "_sampler", Sampler("always_on", 1.0, parent_based=True))
+    exporter = MemoryExporter()
+    processor = tracing.configure(exporter)
+    yield lambda: (processor.force_flush(), exporter.spans)[1]
+    tracing.shutdown_tracing()
+
+
+def test_spans_nest_and_export(exported):
+    @traced("node.test")
+    async def node():
+        with span("inner", key="value"):
+            pass
+
+    with span("root") as root:
+        asyncio.run(node())
+
+    spans = {s.name: s for s in exported()}
+    assert set(spans) == {"root", "node.test", "inner"}
+    assert {s.context.trace_id for s in spans.values()} == {root.context.trace_id}
+    assert spans["node.test"].parent_id == root.context.span_id
+    assert spans["inner"].parent_id == spans["node.test"].context.span_id
+    assert spans["inner"].attributes == {"key": "value"}
+
+
+def test_sampler():
+    ratio = Sampler("ratio", 0.5, parent_based=True)
+    assert ratio.should_sample("0" * 16 + "0" * 16, None) is True
+    assert ratio.should_sample("0" * 16 + "f" * 16, None) is False
+    assert Sampler("always_off", 1.0, True).should_sample("a" * 32, None) is False
+
+    sampled_parent = SpanContext("a" * 32, "b" * 16, sampled=True)
+    assert Sampler("always_off", 0.0, parent_based=True).should_sample("a" * 32, sampled_parent) is True
+    assert Sampler("always_off", 0.0, parent_based=False).should_sample("a" * 32, sampled_parent) is False
+
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(sampled_parent.traceparent()) == sampled_parent
+
+
+def test_middleware_continues_traceparent(exported):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        with span("handler"):
+            return {"item_id": item_id}
+
+    app.middleware("http")(trace_requests)
+    incoming = SpanContext("1" * 32, "2" * 16, sampled=True)
+
+    response = TestClient(app).get("/items/42", headers={"traceparent": incoming.traceparent()})
+    assert response.status_code == 200
+    returned = parse_traceparent(response.headers["traceparent"])
+    assert returned.trace_id == incoming.trace_id
+
+    spans = {s.name: s for s in exported()}
+    root = spans["GET /items/{item_id}"]
+    assert root.parent_id == incoming.span_id
+    assert root.attributes["http.status_code"] == 200
+    assert spans["handler"].parent_id == root.context.span_id
+
+
+def test_middleware_ends_root_span_on_error(exported):
+    app = FastAPI()
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("kaboom")
+
+    app.middleware("http")(trace_requests)
+
+    response = TestClient(app, raise_server_exceptions=False).get("/boom")
+    assert response.status_code == 500
+
+    root = {s.name: s for s in exported()}["GET /boom"]
+    assert root.status == "ERROR"
+    assert root.status_message == "RuntimeError: kaboom"
+    assert root.attributes["http.status_code"] == 500
+    assert root.end_time_ns is not None
+
+
+def test_mongo_and_llm_spans(exported):
+    listener = MongoCommandTracer()
+    event = SimpleNamespace(
+        command_name="find", command={"find": "chats"}, database_name="db", request_id=1, connection_id=("h", 1)
+    )
+    model = FakeChatModel(callbacks=[LLMSpanHandler("fake")])
+
+    with span("root") as root:
+        listener.started(event)
+        listener.succeeded(event)
+        asyncio.run(model.ainvoke([HumanMessage(content="hi")]))
+    listener.started(event)  # Outside a traced request: not recorded
+    listener.succeeded(event)
+
+    spans = exported()
+    mongo = [s for s in spans if s.name == "mongo.find"]
+    llm = [s for s in spans if s.name == "llm.chat"]
+    assert len(mongo) == 1 and len(llm) == 1
+    assert mongo[0].attributes["db.mongodb.collection"] == "chats"
+    assert llm[0].parent_id == root.context.span_id
+    assert llm[0].attributes["llm.provider"] == "fake"
+
+
+def test_jsonl_exporter(tmp_path):
+    exporter = JSONLSpanExporter(str(tmp_path / "traces.jsonl"), max_bytes=1024 * 1024, backup_count=1)
+    finished = start_span("job", {"n": 1}, parent=None, remote_parent=SpanContext("c" * 32, "d" * 16, True))
+    finished.end_time_ns = finished.start_time_ns + 1_500_000
+    exporter.export([finished])
+    exporter.shutdown()
+
+    line = json.loads((tmp_path / "traces.jsonl").read_text().strip())
+    assert line["trace_id"] == "c" * 32
+    assert line["parent_span_id"] == "d" * 16
+    assert line["duration_ms"] == 1.5
+    assert line["attributes"] == {"n": 1}
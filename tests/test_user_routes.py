@@ -124,21 +124,57 @@ def test_delete_user(test_client):
     app.dependency_overrides[get_current_user] = mock_get_current_user
     
     with patch("src.api_router.user_router.users_collection") as mock_users, \
-         patch("src.api_router.user_router.conversations_collection") as mock_convs, \
-         patch("src.api_router.user_router.messages_collection") as mock_msgs:
+         patch("src.api_router.user_router.usage_collection") as mock_usage, \
+         patch("src.api_router.user_router.soft_delete", AsyncMock(return_value=3)) as mock_soft_delete, \
+         patch("src.api_router.user_router.job_runner") as mock_runner:
         
         mock_users.delete_one = AsyncMock()
-        mock_convs.delete_many = AsyncMock()
-        mock_msgs.delete_many = AsyncMock()
-        
-        # Mock cursor for find
-        mock_cursor = MagicMock()
-        mock_cursor.__aiter__.return_value = []
-        mock_convs.find.return_value = mock_cursor
+        mock_usage.delete_many = AsyncMock()
+        mock_runner.submit = AsyncMock(return_value={"_id": "job_id_123"})
         
         response = test_client.delete("/auth/delete-user")
         
-        assert response.status_code == 200
-        assert response.json() == {"message": "User and all associated data deleted successfully"}
+        assert response.status_code == 202
+        assert response.json() == {"message": "User deleted; associated data is being removed", "job_id": "job_id_123"}
+        mock_soft_delete.assert_awaited_once_with("user_id_123")
+        mock_runner.submit.assert_awaited_once_with("user_id_123", {"conversation_id": None}, kind="purge")
+        mock_usage.delete_many.assert_awaited_once_with({"user_id": "user_id_123"})
         
-    app.dependency_overrides = {}
\ No newline at end of file
+    app.dependency_overrides = {}
+
+def test_admin_usage_report(test_client):
+    from main import app
+    from src.api_router.user_router import get_current_user
+
+    async def mock_admin_user():
+        return {"_id": "admin_id", "name": "Admin", "email": "admin@example.com", "role": ["ROLE_USER", "ROLE_ADMIN"]}
+
+    app.dependency_overrides[get_current_user] = mock_admin_user
+
+    with patch("src.api_router.user_router.usage_collection") as mock_usage:
+        mock_cursor = MagicMock()
+        mock_cursor.__aiter__.return_value = [
+            {"user_id": "u1", "date": "2026-01-02", "input_tokens": 100, "output_tokens": 40, "turns": 3},
+            {"user_id": "u1", "date": "2026-01-01", "input_tokens": 50, "output_tokens": 10, "turns": 1},
+        ]
+        mock_usage.find.return_value = mock_cursor
+        mock_cursor.sort.return_value = mock_cursor
+        mock_cursor.limit.return_value = mock_cursor
+        # Totals over every matching rollup, more than the page returned
+        mock_totals = MagicMock()
+        mock_totals.__aiter__.return_value = [{"_id": None, "input_tokens": 900, "output_tokens": 300, "turns": 20, "rollups": 7}]
+        mock_usage.aggregate.return_value = mock_totals
+
+        response = test_client.get("/auth/admin/usage", params={"user_id": "u1", "start_date": "2026-01-01", "limit": 2})
+
+        assert response.status_code == 200
+        report = response.json()
+        assert report["input_tokens"] == 900
+        assert report["output_tokens"] == 300
+        assert report["turns"] == 20
+        assert report["truncated"] is True
+        assert len(report["rollups"]) == 2
+        assert mock_usage.aggregate.call_args.args[0][0] == {"$match": {"user_id": "u1", "date": {"$gte": "2026-01-01"}}}
+        mock_usage.find.assert_called_once_with({"user_id": "u1", "date": {"$gte": "2026-01-01"}}, {"_id": 0})
+
+    app.dependency_overrides = {}
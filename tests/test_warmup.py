@@ -0,0 +1,37 @@
+"""
+This file contains test cases for worker warm-up.
+Unit Tests:
+    - test_warm_up_runs_configured_steps: Builds the model, primes Mongo and sends a tiny generation.
+    - test_warm_up_tolerates_failures: A failing step is logged, not raised.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src import warmup
+
+
+def test_warm_up_runs_configured_steps():
+    model = MagicMock()
+    model.ainvoke = AsyncMock()
+    mongo = MagicMock()
+    mongo.admin.command = AsyncMock(return_value={"ok": 1})
+
+    with patch("src.warmup.get_llm", return_value=model), patch("src.warmup.mongo_client", mongo):
+        timings = asyncio.run(warmup.warm_up())
+
+    model.ainvoke.assert_awaited_once()
+    assert mongo.admin.command.await_count == warmup.WARMUP.MONGO_CONNECTIONS
+    assert {"model", "mongo", "generation"} <= set(timings)
+
+
+def test_warm_up_tolerates_failures():
+    model = MagicMock()
+    model.ainvoke = AsyncMock(side_effect=ConnectionError("upstream down"))
+    mongo = MagicMock()
+    mongo.admin.command = AsyncMock(side_effect=ConnectionError("mongo down"))
+
+    with patch("src.warmup.get_llm", return_value=model), patch("src.warmup.mongo_client", mongo):
+        timings = asyncio.run(warmup.warm_up())
+
+    assert "generation" in timings
@@ -0,0 +1,120 @@
+"""
+This file contains test cases for web search context building.
+Unit Tests:
+    - test_normalize: HTML entities, whitespace, leading dates and trailing ellipses are cleaned up.
+    - test_bm25_prefers_relevant_snippets: Snippets matching the query outrank unrelated ones.
+    - test_build_web_context: Duplicates and irrelevant snippets are dropped, sources are numbered and the budget is respected.
+    - test_web_search_node_uses_context: The node sends the packed context and returns numbered sources separately.
+    - test_web_search_answer_failure_keeps_sources_honest: A failed answer is not retried without the context it cites.
+    - test_search_failure_answers_without_sources: A failed search falls back to a plain answer with no sources.
+    - test_deep_search_replaces_snippets: In deep-search mode fetched page passages replace the snippets.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from langchain_core.messages import AIMessage
+
+from src.llms.llm_parser import estimate_tokens
+from src.pipelines import nodes
+from src.pipelines.web_context import bm25_scores, build_web_context, normalize, tokenize
+
+RESULTS = [
+    {"title": "Weather in Delhi", "href": "https://a.example/delhi", "body": "Jan 5, 2025 — Delhi weather today: 18&deg;C, fog in the morning ..."},
+    {"title": "Delhi weather (mirror)", "href": "https://b.example/delhi", "body": "Delhi weather today: 18°C, fog in the morning"},
+    {"title": "Cricket scores", "href": "https://c.example/cricket", "body": "Live cricket scores and match schedules for the season."},
+    {"title": "Delhi forecast", "href": "https://d.example/forecast", "body": "The ten day forecast for Delhi shows clear skies and cold nights with weather alerts."},
+    {"title": "Weather in Delhi", "href": "https://a.example/delhi", "body": "Same URL again with other text about Delhi weather."},
+]
+
+
+def test_normalize():
+    assert normalize("Jan 5, 2025 — Rain&nbsp;expected   today ...") == "Rain expected today"
+    assert normalize("3 days ago · Ｆｕｌｌｗｉｄｔｈ text…") == "Fullwidth text"
+    assert normalize(None) == ""
+
+
+def test_bm25_prefers_relevant_snippets():
+    documents = [tokenize(item["body"]) for item in RESULTS[:4]]
+    scores = bm25_scores(tokenize("delhi weather today"), documents)
+    assert scores[2] == 0
+    assert min(scores[0], scores[1], scores[3]) > 0
+
+
+def test_build_web_context():
+    context = build_web_context("delhi weather today", RESULTS, token_budget=1000)
+    assert context.duplicates == 2  # the mirrored snippet and the repeated URL
+    assert [source.number for source in context.sources] == [1, 2]
+    assert context.sources[0].url == "https://a.example/delhi"
+    assert "cricket" not in context.text  # No query term: dropped
+    assert context.text.startswith("[1] Weather in Delhi\nDelhi weather today")
+    assert context.tokens_saved == context.raw_tokens - context.context_tokens > 0
+
+    tight = build_web_context("delhi weather today", RESULTS, token_budget=40)
+    assert tight.context_tokens <= 40
+    assert len(tight.sources) == 1 and estimate_tokens(tight.text) <= 40
+
+
+def test_web_search_node_uses_context():
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(return_value=AIMessage(content="Foggy, 18°C [1]."))
+    search = MagicMock()
+    search.return_value.text.return_value = RESULTS
+
+    with patch.object(nodes, "DDGS", search), patch.object(nodes, "get_llm", return_value=llm):
+        state = asyncio.run(nodes.web_search_node({"service_name": "web_search", "user_input": "delhi weather today"}))
+
+    prompt = llm.ainvoke.call_args.args[0][0].content
+    assert "[1] Weather in Delhi" in prompt and "['" not in prompt
+    assert state["llm_response"] == "Foggy, 18°C [1]."
+    assert state["sources"][0] == {"number": 1, "title": "Weather in Delhi", "url": "https://a.example/delhi"}
+
+
+def test_web_search_answer_failure_keeps_sources_honest():
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(side_effect=RuntimeError("model unavailable"))
+    search = MagicMock()
+    search.return_value.text.return_value = RESULTS
+
+    with patch.object(nodes, "DDGS", search), patch.object(nodes, "get_llm", return_value=llm), \
+         pytest.raises(RuntimeError):
+        asyncio.run(nodes.web_search_node({"service_name": "web_search", "user_input": "delhi weather today"}))
+
+    llm.ainvoke.assert_awaited_once()  # No context-free retry that would be stored with these sources
+
+
+def test_search_failure_answers_without_sources():
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(return_value=AIMessage(content="I cannot browse right now."))
+    search = MagicMock()
+    search.return_value.text.side_effect = RuntimeError("rate limited")
+
+    with patch.object(nodes, "DDGS", search), patch.object(nodes, "get_llm", return_value=llm):
+        state = asyncio.run(nodes.web_search_node({"service_name": "web_search", "user_input": "delhi weather today"}))
+
+    assert state["llm_response"] == "I cannot browse right now."
+    assert not state.get("sources")
+
+
+def test_deep_search_replaces_snippets():
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(return_value=AIMessage(content="Foggy [1]."))
+    search = MagicMock()
+    search.return_value.text.return_value = RESULTS
+    fetcher = MagicMock()
+    fetcher.fetch_all = AsyncMock(return_value={
+        "https://a.example/delhi": "Delhi weather today: dense fog until noon, visibility under 50 metres at the airport."
+    })
+
+    with patch.object(nodes, "DDGS", search), patch.object(nodes, "get_llm", return_value=llm), \
+         patch.object(nodes, "get_fetcher", return_value=fetcher):
+        asyncio.run(nodes.web_search_node(
+            {"service_name": "web_search", "user_input": "delhi weather today", "deep_search": True}
+        ))
+
+    urls = fetcher.fetch_all.call_args.args[0]
+    assert urls[0] == "https://a.example/delhi" and len(urls) <= nodes.DEEP_SEARCH.TOP_K
+    prompt = llm.ainvoke.call_args.args[0][0].content
+    assert "visibility under 50 metres" in prompt